@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark cases for the wizard hot paths.
+
+A case is a setup function registered with `benchmark`. It builds whatever
+it needs (forms, views, requests, storage) and returns a callable without
+arguments, which is the code that gets timed.
+"""
+from __future__ import unicode_literals
+
+import json
+from collections import OrderedDict
+from importlib import import_module
+
+from django.conf import settings
+from django.http.response import HttpResponse
+from django.test.client import RequestFactory
+from formtools.wizard.storage import get_storage
+from formtools.wizard.storage.cookie import CookieStorage
+from formtools.wizard.views import StepsHelper
+
+from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.middleware import JSONMiddleware
+from formtools_addons.wizard.rendering import render_as_p
+from formtools_addons.wizard.views.multipleformwizard import (
+    MultipleFormWizardView, SessionMultipleFormWizardView)
+from formtools_addons.wizard.views.wizardapi import WizardAPIView
+
+from .forms import make_form, make_form_data, make_multiple_form_list, make_substep_form_list
+
+BENCHMARKS = OrderedDict()
+
+# (steps, substeps, fields) of the generated wizards
+WIZARD_SIZES = (
+    (2, 2, 5),
+    (5, 4, 10),
+    (10, 4, 20),
+)
+
+
+def benchmark(name):
+    """
+    Registers the decorated setup function under `name`.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def size_label(size):
+    return 'x'.join(str(i) for i in size)
+
+
+class BenchWizardAPIView(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+
+    def done(self, form_list, **kwargs):
+        return HttpResponse()
+
+
+class BenchMultipleFormWizardView(SessionMultipleFormWizardView):
+
+    def done(self, form_list, **kwargs):
+        return HttpResponse()
+
+
+def get_request(method='get', path='/', data=None, session=None, **extra):
+    """
+    Returns a request with a (not persisted) session attached.
+    """
+    request = getattr(RequestFactory(), method)(path, data or {}, **extra)
+    if session is None:
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore(None)
+    request.session = session
+    return request
+
+
+def setup_view(view_class, request, **initkwargs):
+    """
+    Returns a view instance prepared the same way `WizardView.dispatch` does,
+    so methods like `render_state` can be called directly.
+    """
+    view = view_class(**view_class.get_initkwargs(**initkwargs))
+    view.request = request
+    view.args = ()
+    view.kwargs = {}
+    view.prefix = view.get_prefix(request)
+    view.storage = get_storage(view.storage_name, view.prefix, request,
+                               getattr(view, 'file_storage', None))
+    view.steps = StepsHelper(view)
+    return view
+
+
+def make_api_view(size):
+    steps, substeps, fields = size
+    request = get_request(HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+    view = setup_view(BenchWizardAPIView, request,
+                      form_list=make_substep_form_list(steps, substeps, fields))
+
+    # Fill in every step, so the state is as large as it gets
+    for step in view.form_list:
+        view.storage.set_step_data(step, dict(
+            (key, [value]) for key, value in make_form_data(fields).items()))
+    view.storage.current_step = view.steps.first
+    return view
+
+
+def _register_render_state(size):
+    @benchmark('wizardapi.render_state[%s]' % size_label(size))
+    def render_state():
+        view = make_api_view(size)
+        return lambda: view.render_state(step=view.storage.current_step)
+
+
+def _register_multipleform_post(size):
+    @benchmark('multipleformwizard.post[%s]' % size_label(size))
+    def multipleform_post():
+        steps, forms_per_step, fields = size
+        form_list = make_multiple_form_list(steps, forms_per_step, fields)
+        view = BenchMultipleFormWizardView.as_view(form_list)
+
+        # Start the wizard, so the session contains the wizard state
+        session = get_request().session
+        view(get_request(session=session)).render()
+
+        data = {'bench_multiple_form_wizard_view-current_step': 'step0'}
+        for i in range(forms_per_step):
+            data.update(make_form_data(fields, prefix='step0-form%d' % i))
+
+        def post():
+            response = view(get_request('post', data=data, session=session))
+            response.render()
+            return response
+        return post
+
+
+def _register_compute_form_list(size):
+    @benchmark('multipleformwizard.compute_form_list[%s]' % size_label(size))
+    def compute_form_list():
+        form_list = make_multiple_form_list(*size)
+        return lambda: MultipleFormWizardView.compute_form_list(form_list)
+
+    @benchmark('wizardapi.get_initkwargs[%s]' % size_label(size))
+    def get_initkwargs():
+        form_list = make_substep_form_list(*size)
+        return lambda: WizardAPIView.get_initkwargs(form_list=form_list)
+
+
+for _size in WIZARD_SIZES:
+    _register_render_state(_size)
+    _register_multipleform_post(_size)
+    _register_compute_form_list(_size)
+
+
+def _register_json_middleware(num_keys):
+    @benchmark('middleware.json[%d]' % num_keys)
+    def json_middleware():
+        payload = {}
+        for i in range(num_keys):
+            payload['key_%d' % i] = ['a', 'b', 'c'] if i % 4 == 0 else 'value %d' % i
+        request = RequestFactory().post('/', json.dumps(payload),
+                                        content_type=HTTP_APPLICATION_JSON)
+        middleware = JSONMiddleware()
+        return lambda: middleware.process_request(request)
+
+
+for _num_keys in (10, 100, 1000):
+    _register_json_middleware(_num_keys)
+
+
+def _register_render_form(num_fields):
+    form_class = make_form(num_fields)
+    data = make_form_data(num_fields)
+
+    @benchmark('forms.as_p[%d]' % num_fields)
+    def as_p():
+        return lambda: form_class(data).as_p()
+
+    @benchmark('forms.render_as_p[%d]' % num_fields)
+    def compiled_as_p():
+        return lambda: render_as_p(form_class(data))
+
+
+for _num_fields in (5, 20, 50):
+    _register_render_form(_num_fields)
+
+
+def _register_storage(size):
+    steps, substeps, fields = size
+    step_names = ['step%d|substep%d' % (step, substep)
+                  for step in range(steps) for substep in range(substeps)]
+    step_data = dict((key, [value]) for key, value in make_form_data(fields).items())
+
+    @benchmark('storage.session[%s]' % size_label(size))
+    def session_storage():
+        storage_name = 'formtools.wizard.storage.session.SessionStorage'
+
+        def roundtrip():
+            storage = get_storage(storage_name, 'bench', get_request())
+            for step in step_names:
+                storage.set_step_data(step, step_data)
+            for step in step_names:
+                storage.get_step_data(step)
+        return roundtrip
+
+    @benchmark('storage.cookie[%s]' % size_label(size))
+    def cookie_storage():
+        def roundtrip():
+            storage = CookieStorage('bench', get_request())
+            for step in step_names:
+                storage.set_step_data(step, step_data)
+            response = HttpResponse()
+            storage.update_response(response)
+
+            # Load the state again from the signed cookie
+            request = get_request()
+            request.COOKIES[storage.prefix] = response.cookies[storage.prefix].value
+            storage = CookieStorage('bench', request)
+            for step in step_names:
+                storage.get_step_data(step)
+        return roundtrip
+
+
+for _size in WIZARD_SIZES:
+    _register_storage(_size)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic form and wizard generators for the benchmark suite.
+
+Every generated form cycles through a fixed set of field types, so a wizard
+of a given size (steps x substeps x fields) is always built the same way and
+timings stay comparable between runs.
+"""
+from __future__ import unicode_literals
+
+from django import forms
+
+FIELD_FACTORIES = (
+    lambda: forms.CharField(max_length=100),
+    lambda: forms.IntegerField(min_value=0),
+    lambda: forms.BooleanField(required=False),
+    lambda: forms.ChoiceField(choices=[('a', 'A'), ('b', 'B'), ('c', 'C')]),
+    lambda: forms.EmailField(),
+    lambda: forms.DateField(),
+)
+
+FIELD_VALUES = (
+    'some text',
+    '42',
+    'on',
+    'b',
+    'someone@example.com',
+    '2016-05-17',
+)
+
+
+def field_name(index):
+    return 'field_%d' % index
+
+
+def make_form(num_fields, name='SyntheticForm'):
+    """
+    Returns a new ``forms.Form`` subclass with `num_fields` fields.
+    """
+    attrs = {}
+    for i in range(num_fields):
+        attrs[field_name(i)] = FIELD_FACTORIES[i % len(FIELD_FACTORIES)]()
+    return type(str(name), (forms.Form,), attrs)
+
+
+def make_form_data(num_fields, prefix=None):
+    """
+    Returns valid POST data for a form created by `make_form(num_fields)`.
+    """
+    data = {}
+    for i in range(num_fields):
+        key = field_name(i)
+        if prefix:
+            key = '%s-%s' % (prefix, key)
+        data[key] = FIELD_VALUES[i % len(FIELD_VALUES)]
+    return data
+
+
+def make_substep_form_list(steps, substeps, fields):
+    """
+    Returns a `WizardAPIView` form list of `steps` pages with `substeps`
+    forms each.
+    """
+    form_list = []
+    for step in range(steps):
+        substep_list = []
+        for substep in range(substeps):
+            form = make_form(fields, name='Form_%d_%d' % (step, substep))
+            substep_list.append(('substep%d' % substep, form))
+        form_list.append(('step%d' % step, tuple(substep_list)))
+    return form_list
+
+
+def make_multiple_form_list(steps, forms_per_step, fields):
+    """
+    Returns a `MultipleFormWizardView` form list of `steps` steps with
+    `forms_per_step` forms each.
+    """
+    form_list = []
+    for step in range(steps):
+        step_forms = []
+        for i in range(forms_per_step):
+            form = make_form(fields, name='Form_%d_%d' % (step, i))
+            step_forms.append(('form%d' % i, form))
+        form_list.append(('step%d' % step, tuple(step_forms)))
+    return form_list
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+In-process load generator for the wizard views.
+
+Simulates many concurrent wizard users. Each user runs a full journey
+(fetching data, posting every step, navigating back and forth and
+committing) through Django's WSGI handler, so the whole middleware and
+session stack is exercised without a web server or network.
+
+Usage::
+
+    python -m benchmarks.loadgen --users 2000 --concurrency 50
+    python -m benchmarks.loadgen --wizard api --size 10x4x20 --processes 4
+
+The report contains the throughput, p50/p95/p99 latencies per endpoint and
+the number of bytes stored per session.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import timeit
+from collections import defaultdict
+from importlib import import_module
+from io import BytesIO
+
+import six
+from six.moves import queue
+from six.moves.http_cookies import SimpleCookie
+from six.moves.urllib.parse import urlencode
+
+from .forms import make_form_data
+
+WIZARDS = ('api', 'multiple', 'named')
+
+
+class WSGIClient(object):
+    """
+    Minimal client that calls a WSGI application directly and keeps cookies,
+    like a browser would, for a single user.
+    """
+    def __init__(self, application, stats):
+        self.application = application
+        self.stats = stats
+        self.cookies = {}
+
+    def request(self, label, method, path, body=b'', content_type='', expect=(200,), **headers):
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+        environ = {
+            'REQUEST_METHOD': str(method),
+            'PATH_INFO': str(path),
+            'SCRIPT_NAME': str(''),
+            'QUERY_STRING': str(''),
+            'SERVER_NAME': str('loadgen'),
+            'SERVER_PORT': str('80'),
+            'SERVER_PROTOCOL': str('HTTP/1.1'),
+            'HTTP_HOST': str('loadgen'),
+            'HTTP_COOKIE': str('; '.join('%s=%s' % item for item in self.cookies.items())),
+            'CONTENT_TYPE': str(content_type),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': str('http'),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for key, value in headers.items():
+            environ[str(key)] = str(value)
+
+        response_status = []
+        response_headers = []
+
+        def start_response(status, header_list, exc_info=None):
+            response_status.append(int(status.split(' ', 1)[0]))
+            response_headers.extend(header_list)
+
+        start = timeit.default_timer()
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        self.stats.add_request(label, timeit.default_timer() - start,
+                               ok=response_status[0] in expect)
+
+        headers = {}
+        for name, value in response_headers:
+            if name.lower() == 'set-cookie':
+                self._store_cookie(value)
+            headers[name.lower()] = value
+        return response_status[0], headers, content
+
+    def _store_cookie(self, header):
+        cookie = SimpleCookie()
+        cookie.load(str(header))
+        for name, morsel in cookie.items():
+            if morsel.value and morsel['max-age'] != '0':
+                self.cookies[name] = morsel.value
+            else:
+                self.cookies.pop(name, None)
+
+    def get(self, label, path, **kwargs):
+        return self.request(label, 'GET', path, **kwargs)
+
+    def post(self, label, path, data=None, **kwargs):
+        return self.request(label, 'POST', path, body=urlencode(data or {}),
+                            content_type='application/x-www-form-urlencoded', **kwargs)
+
+    def post_json(self, label, path, data=None, **kwargs):
+        return self.request(label, 'POST', path, body=json.dumps(data or {}),
+                            content_type='application/json', HTTP_ACCEPT='application/json', **kwargs)
+
+
+class Stats(object):
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.session_bytes = []
+        self.journeys = 0
+
+    def add_request(self, label, duration, ok=True):
+        self.latencies[label].append(duration)
+        if not ok:
+            self.errors[label] += 1
+
+    def merge(self, other):
+        for label, values in other.latencies.items():
+            self.latencies[label].extend(values)
+        for label, count in other.errors.items():
+            self.errors[label] += count
+        self.session_bytes.extend(other.session_bytes)
+        self.journeys += other.journeys
+
+    @property
+    def requests(self):
+        return sum(len(values) for values in self.latencies.values())
+
+
+def get_session_size(client):
+    """
+    Returns the size in bytes of the encoded session of the client.
+    """
+    from django.conf import settings
+
+    session_key = client.cookies.get(settings.SESSION_COOKIE_NAME)
+    if session_key is None:
+        return 0
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    return len(session.encode(session.load()))
+
+
+def api_journey(client, fields):
+    status, headers, content = client.get('api GET data', '/api/data/',
+                                          HTTP_ACCEPT='application/json')
+    steps = json.loads(content.decode('utf-8'))['structure']
+    data = make_form_data(fields)
+
+    for i, step in enumerate(steps):
+        client.post_json('api POST step', '/api/%s/' % step, data)
+        if i == 1:
+            client.post_json('api POST prev', '/api/prev/')
+            client.post_json('api POST next', '/api/next/')
+        elif i == 2:
+            client.post_json('api POST goto', '/api/goto/%s/' % steps[0])
+            client.post_json('api POST goto', '/api/goto/%s/' % steps[i + 1 if i + 1 < len(steps) else i])
+
+    client.stats.session_bytes.append(get_session_size(client))
+    client.post_json('api POST commit', '/api/commit/')
+
+
+def get_multiple_step_data(prefix, step, forms_per_step, fields):
+    data = {'%s-current_step' % prefix: step}
+    for i in range(forms_per_step):
+        data.update(make_form_data(fields, prefix='%s-form%d' % (step, i)))
+    return data
+
+
+def multiple_journey(client, steps, forms_per_step, fields):
+    prefix = 'load_multiple_form_wizard_view'
+    client.get('multiple GET', '/multiple/')
+    step_names = ['step%d' % i for i in range(steps)]
+
+    def post_step(data):
+        status, headers, content = client.post('multiple POST step', '/multiple/', data)
+        if b'errorlist' in content:
+            # Invalid steps are rendered again with a 200 status
+            client.stats.errors['multiple POST step'] += 1
+
+    for i, step in enumerate(step_names):
+        data = get_multiple_step_data(prefix, step, forms_per_step, fields)
+        post_step(data)
+        if i == 0 and steps > 1:
+            # Go back to the first step and submit it again
+            client.post('multiple POST goto', '/multiple/', {'wizard_goto_step': step})
+            post_step(data)
+        if i == steps - 2:
+            client.stats.session_bytes.append(get_session_size(client))
+
+
+def named_journey(client, steps, forms_per_step, fields):
+    prefix = 'load_named_url_multiple_form_wizard_view'
+    status, headers, content = client.get('named GET start', '/named/', expect=(302,))
+    client.get('named GET step', headers['location'])
+    step_names = ['step%d' % i for i in range(steps)]
+
+    for i, step in enumerate(step_names):
+        data = get_multiple_step_data(prefix, step, forms_per_step, fields)
+        status, headers, content = client.post('named POST step', '/named/%s/' % step, data,
+                                               expect=(302,))
+        if i == steps - 1:
+            client.stats.session_bytes.append(get_session_size(client))
+            client.get('named GET done', headers['location'])
+        else:
+            client.get('named GET step', headers['location'])
+
+
+def run_journey(wizard, application, stats, size):
+    steps, substeps, fields = size
+    client = WSGIClient(application, stats)
+    if wizard == 'api':
+        api_journey(client, fields)
+    elif wizard == 'multiple':
+        multiple_journey(client, steps, substeps, fields)
+    else:
+        named_journey(client, steps, substeps, fields)
+    stats.journeys += 1
+
+
+def run_users(options):
+    """
+    Runs `users` journeys with `concurrency` threads and returns the merged
+    stats. This is also the entry point of the worker processes.
+    """
+    wizards, users, concurrency, size = options
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    os.environ['BENCHMARK_WIZARD_SIZE'] = 'x'.join(str(i) for i in size)
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    pending = queue.Queue()
+    for user in range(users):
+        pending.put(wizards[user % len(wizards)])
+
+    thread_stats = []
+
+    def worker():
+        stats = Stats()
+        thread_stats.append(stats)
+        while True:
+            try:
+                wizard = pending.get_nowait()
+            except queue.Empty:
+                return
+            run_journey(wizard, application, stats, size)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = Stats()
+    for other in thread_stats:
+        stats.merge(other)
+    return stats
+
+
+def percentile(values, pct):
+    """
+    Returns the `pct` percentile of the sorted `values` (nearest rank).
+    """
+    if not values:
+        return 0.0
+    index = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+def get_report(stats, elapsed):
+    endpoints = {}
+    for label, values in sorted(stats.latencies.items()):
+        values = sorted(values)
+        endpoints[label] = {
+            'count': len(values),
+            'errors': stats.errors.get(label, 0),
+            'mean': sum(values) / len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+        }
+    session_bytes = stats.session_bytes or [0]
+    return {
+        'elapsed': elapsed,
+        'journeys': stats.journeys,
+        'requests': stats.requests,
+        'requests_per_second': stats.requests / elapsed if elapsed else 0.0,
+        'journeys_per_second': stats.journeys / elapsed if elapsed else 0.0,
+        'session_bytes': {
+            'mean': sum(session_bytes) / len(session_bytes),
+            'max': max(session_bytes),
+        },
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report, stream=sys.stdout):
+    print('%d journeys, %d requests in %.2f s: %.1f requests/s, %.1f journeys/s' % (
+        report['journeys'], report['requests'], report['elapsed'],
+        report['requests_per_second'], report['journeys_per_second']), file=stream)
+    print('Bytes stored per session: mean %d, max %d' % (
+        report['session_bytes']['mean'], report['session_bytes']['max']), file=stream)
+    print(file=stream)
+
+    endpoints = report['endpoints']
+    width = max([len(label) for label in endpoints] + [len('endpoint')])
+    line = '%-{0}s  %7s  %6s  %9s  %9s  %9s'.format(width)
+    print(line % ('endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'), file=stream)
+    for label, data in sorted(endpoints.items()):
+        print(line % (label, data['count'], data['errors'], '%.2f' % (data['p50'] * 1e3),
+                      '%.2f' % (data['p95'] * 1e3), '%.2f' % (data['p99'] * 1e3)), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate concurrent wizard users.')
+    parser.add_argument('--wizard', choices=WIZARDS + ('all',), default='all')
+    parser.add_argument('--users', type=int, default=1000, help='number of journeys (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='threads per process (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes (default: %(default)s)')
+    parser.add_argument('--size', default='3x3x8',
+                        help='wizard size as steps x substeps x fields (default: %(default)s)')
+    parser.add_argument('--output', default=None, help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    wizards = WIZARDS if args.wizard == 'all' else (args.wizard,)
+    size = tuple(int(i) for i in args.size.split('x'))
+    assert len(size) == 3 and size[0] > 1, 'size should look like 3x3x8, with at least two steps'
+
+    start = timeit.default_timer()
+    if args.processes > 1:
+        import multiprocessing
+
+        shares = [args.users // args.processes + (1 if i < args.users % args.processes else 0)
+                  for i in range(args.processes)]
+        pool = multiprocessing.Pool(args.processes)
+        try:
+            results = pool.map(run_users, [(wizards, share, args.concurrency, size) for share in shares])
+        finally:
+            pool.close()
+            pool.join()
+        stats = Stats()
+        for result in results:
+            stats.merge(result)
+    else:
+        stats = run_users((wizards, args.users, args.concurrency, size))
+    elapsed = timeit.default_timer() - start
+
+    report = get_report(stats, elapsed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 1 if any(data['errors'] for data in report['endpoints'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the benchmark suite and compares the results with a stored baseline.
+
+Usage::
+
+    python -m benchmarks.run                 # run and compare with the baseline
+    python -m benchmarks.run --save          # run and store a new baseline
+    python -m benchmarks.run -k render_state # only run matching benchmarks
+
+Timings depend on the machine, so baselines are meant to be stored locally
+(by default in `.benchmarks/baseline.json`) and compared on the same machine,
+e.g. before and after upgrading Django or formtools.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+DEFAULT_BASELINE = os.path.join('.benchmarks', 'baseline.json')
+
+
+def measure(func, repeat=5, min_time=0.1):
+    """
+    Times `func` and returns the best and the median duration of a single
+    call in seconds. The number of loops per repetition is calibrated so one
+    repetition takes at least `min_time` seconds.
+    """
+    timer = timeit.default_timer
+    loops = 1
+    while True:
+        start = timer()
+        for _ in range(loops):
+            func()
+        elapsed = timer() - start
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    timings = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(loops):
+            func()
+        timings.append((timer() - start) / loops)
+
+    timings.sort()
+    return {
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'loops': loops,
+    }
+
+
+def run(names, repeat=5, min_time=0.1, stream=sys.stdout):
+    from .cases import BENCHMARKS
+
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name]()
+        results[name] = measure(func, repeat=repeat, min_time=min_time)
+        print('.', end='', file=stream)
+        stream.flush()
+    print(file=stream)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (name, baseline median, median, relative change, status)
+    rows. A benchmark regressed when its median is more than `threshold`
+    (relative) slower than the baseline median.
+    """
+    rows = []
+    for name in sorted(results):
+        median = results[name]['median']
+        if name not in baseline:
+            rows.append((name, None, median, None, 'new'))
+            continue
+        base = baseline[name]['median']
+        change = (median - base) / base if base else 0.0
+        if change > threshold:
+            status = 'REGRESSION'
+        elif change < -threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, base, median, change, status))
+    return rows
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '-'
+    if seconds >= 1:
+        return '%.2f s' % seconds
+    if seconds >= 1e-3:
+        return '%.2f ms' % (seconds * 1e3)
+    return '%.2f us' % (seconds * 1e6)
+
+
+def print_report(rows, stream=sys.stdout):
+    width = max([len(row[0]) for row in rows] + [len('benchmark')])
+    line = '%-{0}s  %12s  %12s  %8s  %s'.format(width)
+    print(line % ('benchmark', 'baseline', 'current', 'change', 'status'), file=stream)
+    for name, base, median, change, status in rows:
+        print(line % (name, format_duration(base), format_duration(median),
+                      '-' if change is None else '%+.1f%%' % (change * 100), status), file=stream)
+
+
+def get_environment():
+    import django
+    import formtools
+
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'formtools': getattr(formtools, '__version__', 'unknown'),
+        'machine': platform.machine(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the formtools-addons benchmark suite.')
+    parser.add_argument('-k', dest='keyword', default=None,
+                        help='only run benchmarks whose name contains this string')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--output', default=None,
+                        help='also write the results and the comparison to this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='minimal duration of one repetition in seconds')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    from .cases import BENCHMARKS
+
+    names = [name for name in BENCHMARKS if not args.keyword or args.keyword in name]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    results = run(names, repeat=args.repeat, min_time=args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    rows = compare(results, baseline, args.threshold)
+    print_report(rows)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'environment': get_environment(),
+                'results': results,
+                'comparison': [dict(zip(('name', 'baseline', 'current', 'change', 'status'), row))
+                               for row in rows],
+            }, f, indent=2, sort_keys=True)
+
+    if args.save:
+        # Keep the baseline of benchmarks that were not run this time
+        baseline.update(results)
+        directory = os.path.dirname(args.baseline)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': get_environment(), 'results': baseline},
+                      f, indent=2, sort_keys=True)
+        print('Baseline saved to %s' % args.baseline)
+        return 0
+
+    return 1 if any(row[4] == 'REGRESSION' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
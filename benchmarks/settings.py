@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Settings used when running the benchmark suite (``python -m benchmarks.run``).
+
+Everything is kept in memory, so no database or network is needed.
+"""
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+
+    'formtools',
+    'formtools_addons',
+]
+
+SECRET_KEY = 'benchmark-benchmark-benchmark'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'formtools-addons-benchmarks'
+    }
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+
+MIDDLEWARE_CLASSES = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'formtools_addons.middleware.JSONMiddleware',
+)
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+
+USE_TZ = True
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+ALLOWED_HOSTS = ['*']
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+URLconf used by the load generator. The wizard size (steps x substeps x
+fields) is read from the `BENCHMARK_WIZARD_SIZE` environment variable.
+"""
+from __future__ import unicode_literals
+
+import os
+
+from django.conf.urls import url
+
+from .views import get_api_view, get_multiple_view, get_named_view
+
+WIZARD_SIZE = tuple(int(i) for i in os.environ.get('BENCHMARK_WIZARD_SIZE', '3x3x8').split('x'))
+
+api_view = get_api_view(WIZARD_SIZE)
+named_view = get_named_view(WIZARD_SIZE)
+
+urlpatterns = [
+    url(r'^api/(?P<step>[^/]+)/(?P<substep>[^/]+)/$', api_view, name='api_step'),
+    url(r'^api/(?P<step>[^/]+)/$', api_view, name='api_step'),
+    url(r'^multiple/$', get_multiple_view(WIZARD_SIZE), name='multiple'),
+    url(r'^named/(?P<step>[^/]+)/$', named_view, name='named_step'),
+    url(r'^named/$', named_view, name='named'),
+]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Wizard views driven by the load generator (see `benchmarks.loadgen`).
+"""
+from __future__ import unicode_literals
+
+from django.http.response import HttpResponse, JsonResponse
+
+from formtools_addons import (
+    SessionMultipleFormWizardView, NamedUrlSessionMultipleFormWizardView, WizardAPIView)
+
+from .forms import make_multiple_form_list, make_substep_form_list
+
+
+def make_condition(step):
+    """
+    Returns a condition that depends on the cleaned data of `step`, like real
+    conditional wizards do. The step is always shown.
+    """
+    def condition(wizard):
+        wizard.get_cleaned_data_for_step(step)
+        return True
+    return condition
+
+
+class LoadWizardAPIView(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+
+    def done(self, form_list, **kwargs):
+        return JsonResponse({'next_url': '/done/'})
+
+
+class LoadMultipleFormWizardView(SessionMultipleFormWizardView):
+
+    def done(self, form_list, **kwargs):
+        return HttpResponse('done')
+
+
+class LoadNamedUrlMultipleFormWizardView(NamedUrlSessionMultipleFormWizardView):
+
+    def done(self, form_list, **kwargs):
+        return HttpResponse('done')
+
+
+def get_api_view(size):
+    form_list = make_substep_form_list(*size)
+    first_step = '%s|%s' % (form_list[0][0], form_list[0][1][0][0])
+
+    # Every second page depends on the first step
+    condition_dict = {}
+    for step, substeps in form_list[1::2]:
+        for substep, _ in substeps:
+            condition_dict['%s|%s' % (step, substep)] = make_condition(first_step)
+
+    return LoadWizardAPIView.as_view(form_list=form_list, condition_dict=condition_dict,
+                                     url_name='api_step')
+
+
+def get_multiple_view(size):
+    return LoadMultipleFormWizardView.as_view(make_multiple_form_list(*size))
+
+
+def get_named_view(size):
+    return LoadNamedUrlMultipleFormWizardView.as_view(make_multiple_form_list(*size),
+                                                      url_name='named_step')
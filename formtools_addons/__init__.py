@@ -3,6 +3,6 @@ __version__ = '0.1.21'
 from .wizard.views.multipleformwizard import (
     SessionMultipleFormWizardView, CookieMultipleFormWizardView,
     NamedUrlSessionMultipleFormWizardView, NamedUrlCookieMultipleFormWizardView,
-    MultipleFormWizardView, NamedUrlMultipleFormWizardView)
+    MultipleFormWizardView, NamedUrlMultipleFormWizardView, FormListVariant)
 
 from .wizard.views.wizardapi import WizardAPIView
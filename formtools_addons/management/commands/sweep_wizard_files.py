@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from formtools_addons.wizard.files import FileSweeper
+
+
+class Command(BaseCommand):
+    help = ("Deletes the files of abandoned wizards, as listed in the manifests of the "
+            "manifest and content addressed wizard storages.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--storage', dest='storage',
+                            help="Dotted path of the wizards' file storage (an instance or class). "
+                                 "Defaults to the default storage.")
+        parser.add_argument('--max-age', dest='max_age', type=int, default=7 * 24 * 3600,
+                            help='Seconds since the last update of a wizard before its files are deleted.')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=100,
+                            help='Number of files deleted per batch.')
+        parser.add_argument('--rate', dest='rate', type=float, default=None,
+                            help='Maximum number of files deleted per second.')
+        parser.add_argument('--dry-run', dest='dry_run', action='store_true', default=False,
+                            help='Only report the files that would be deleted.')
+        parser.add_argument('--manifest-location', dest='manifest_location', default='wizard_manifests')
+        parser.add_argument('--manifest-interval', dest='manifest_interval', type=int, default=3600)
+        parser.add_argument('--blob-location', dest='blob_location', default='wizard_blobs')
+        parser.add_argument('--upload-location', dest='upload_location', default='wizard_uploads')
+        parser.add_argument('--file-location', dest='file_location', default='wizard_files')
+
+    def get_file_storage(self, path):
+        if not path:
+            return default_storage
+        file_storage = import_string(path)
+        if isinstance(file_storage, type):
+            file_storage = file_storage()
+        return file_storage
+
+    def handle(self, *args, **options):
+        sweeper = FileSweeper(
+            self.get_file_storage(options['storage']), options['max_age'],
+            batch_size=options['batch_size'], rate=options['rate'], dry_run=options['dry_run'],
+            manifest_location=options['manifest_location'], manifest_interval=options['manifest_interval'],
+            blob_location=options['blob_location'], upload_location=options['upload_location'],
+            file_location=options['file_location'])
+        stats = sweeper.sweep()
+        self.stdout.write('%s %d files of %d abandoned wizards (%d errors)' % (
+            'Would delete' if options['dry_run'] else 'Deleted', stats.files, stats.manifests, stats.errors))
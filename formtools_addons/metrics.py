@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics emitted by the wizard views.
+
+The backend is configured with the `FORMTOOLS_ADDONS_METRICS` setting::
+
+    FORMTOOLS_ADDONS_METRICS = {
+        'BACKEND': 'formtools_addons.metrics.StatsdMetrics',
+        'OPTIONS': {'host': 'localhost', 'port': 8125, 'prefix': 'wizards'},
+    }
+
+Without this setting no metrics are recorded.
+"""
+from __future__ import unicode_literals
+
+import json
+import logging
+import socket
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from formtools.wizard.storage.cookie import CookieStorage
+
+logger = logging.getLogger('formtools_addons.metrics')
+
+
+class BaseMetrics(object):
+    """
+    Interface of a metrics backend. `name` is a dotted metric name, `tags`
+    a dict of extra dimensions (e.g. the wizard class).
+    """
+    enabled = True
+
+    def incr(self, name, value=1, tags=None):
+        """
+        Increments the counter `name` by `value`.
+        """
+        raise NotImplementedError
+
+    def observe(self, name, value, tags=None):
+        """
+        Records `value` in the histogram `name`.
+        """
+        raise NotImplementedError
+
+
+class NullMetrics(BaseMetrics):
+    """
+    Backend used when metrics are disabled.
+    """
+    enabled = False
+
+    def incr(self, name, value=1, tags=None):
+        pass
+
+    def observe(self, name, value, tags=None):
+        pass
+
+
+def _tag_key(tags):
+    return tuple(sorted((tags or {}).items()))
+
+
+class InMemoryMetrics(BaseMetrics):
+    """
+    Keeps all metrics in memory, useful in tests.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = defaultdict(int)
+            self.histograms = defaultdict(list)
+
+    def incr(self, name, value=1, tags=None):
+        with self._lock:
+            self.counters[(name, _tag_key(tags))] += value
+
+    def observe(self, name, value, tags=None):
+        with self._lock:
+            self.histograms[(name, _tag_key(tags))].append(value)
+
+    def get_counter(self, name, **tags):
+        """
+        Returns the value of counter `name`, summed over all tag values that
+        are not given.
+        """
+        return sum(value for (key, key_tags), value in self.counters.items()
+                   if key == name and set(tags.items()) <= set(key_tags))
+
+    def get_histogram(self, name, **tags):
+        values = []
+        for (key, key_tags), observed in self.histograms.items():
+            if key == name and set(tags.items()) <= set(key_tags):
+                values.extend(observed)
+        return values
+
+
+class StatsdMetrics(BaseMetrics):
+    """
+    Sends metrics as StatsD UDP packets. Tags are sent in the DogStatsD
+    format (`|#key:value`) when `tags` is True, and left out otherwise.
+    """
+    def __init__(self, host='localhost', port=8125, prefix='formtools_addons', tags=True):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.tags = tags
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format(self, name, value, metric_type, tags=None):
+        packet = '%s:%s|%s' % ('.'.join(filter(None, [self.prefix, name])), value, metric_type)
+        if self.tags and tags:
+            packet += '|#' + ','.join('%s:%s' % item for item in sorted(tags.items()))
+        return packet
+
+    def send(self, packet):
+        try:
+            self._socket.sendto(packet.encode('utf-8'), self.address)
+        except (socket.error, OSError):
+            # Metrics should never break a request
+            logger.debug('Failed to send metric %r', packet, exc_info=True)
+
+    def incr(self, name, value=1, tags=None):
+        self.send(self.format(name, value, 'c', tags))
+
+    def observe(self, name, value, tags=None):
+        self.send(self.format(name, value, 'h', tags))
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    Returns the configured metrics backend.
+    """
+    global _metrics
+    if _metrics is None:
+        config = getattr(settings, 'FORMTOOLS_ADDONS_METRICS', None)
+        if config:
+            backend_class = import_string(config['BACKEND'])
+            _metrics = backend_class(**config.get('OPTIONS', {}))
+        else:
+            _metrics = NullMetrics()
+    return _metrics
+
+
+def set_metrics(backend):
+    """
+    Overrides the configured metrics backend, `None` reloads it from the
+    settings.
+    """
+    global _metrics
+    _metrics = backend
+
+
+def _reset_metrics(setting, **kwargs):
+    if setting == 'FORMTOOLS_ADDONS_METRICS':
+        set_metrics(None)
+
+
+setting_changed.connect(_reset_metrics)
+
+
+class WizardMetricsMixin(object):
+    """
+    Records metrics for a wizard view, tagged with the wizard class name:
+
+    * `forms.constructed` and `forms.validated` - forms built and validated
+    * `cache.hits` and `cache.misses` - lookups in the view's caches
+    * `storage.bytes_read` and `storage.bytes_written` - size of the wizard
+      state in the session or cookie before and after the request
+    * `steps.rendered` - steps rendered
+    * `state.bytes` - histogram of the JSON state payload sizes
+    * `commits` - completed wizards
+    """
+    def get_metric_tags(self, **tags):
+        tags.setdefault('wizard', self.__class__.__name__)
+        return tags
+
+    def incr_metric(self, name, value=1, **tags):
+        metrics = get_metrics()
+        if metrics.enabled:
+            metrics.incr(name, value, self.get_metric_tags(**tags))
+
+    def observe_metric(self, name, value, **tags):
+        metrics = get_metrics()
+        if metrics.enabled:
+            metrics.observe(name, value, self.get_metric_tags(**tags))
+
+    def record_cache_lookup(self, cache, hit):
+        self.incr_metric('cache.hits' if hit else 'cache.misses', cache=cache)
+
+    def instrument_form(self, form):
+        form = super(WizardMetricsMixin, self).instrument_form(form)
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return form
+
+        tags = self.get_metric_tags()
+        metrics.incr('forms.constructed', 1, tags)
+
+        full_clean = form.full_clean
+
+        def counted_full_clean():
+            metrics.incr('forms.validated', 1, tags)
+            full_clean()
+        form.full_clean = counted_full_clean
+        return form
+
+    def dispatch(self, request, *args, **kwargs):
+        if not get_metrics().enabled:
+            return super(WizardMetricsMixin, self).dispatch(request, *args, **kwargs)
+
+        # Same prefix as the storage backends use
+        storage_prefix = 'wizard_%s' % self.get_prefix(request, *args, **kwargs)
+        stored = self.get_stored_state(request, storage_prefix)
+        self.incr_metric('storage.bytes_read', len(stored))
+
+        response = super(WizardMetricsMixin, self).dispatch(request, *args, **kwargs)
+
+        # only a changed state is written
+        written = self.get_stored_state(request, storage_prefix, response)
+        if written is not None and written != stored:
+            self.incr_metric('storage.bytes_written', len(written))
+        return response
+
+    def get_stored_state(self, request, storage_prefix, response=None):
+        """
+        Returns the stored wizard state. For cookie storage this is the
+        cookie in the request (or `response`), otherwise the JSON encoded
+        state in the session. With a `response`, None means the state
+        wasn't written.
+        """
+        if issubclass(import_string(self.storage_name), CookieStorage):
+            if response is None:
+                return request.COOKIES.get(storage_prefix, '')
+            cookie = response.cookies.get(storage_prefix)
+            return cookie.value if cookie is not None else None
+
+        session = getattr(request, 'session', {})
+        if response is not None and not getattr(session, 'modified', True):
+            return None
+        data = session.get(storage_prefix)
+        if not data:
+            return ''
+        return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
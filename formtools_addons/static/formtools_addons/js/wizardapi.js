@@ -8,6 +8,8 @@
     var wizard_template = $('body').data('template') || 'formtools_addons/templates/directives/wizardapi/wizard.html';
     var wizard_root = $('body').data('wizardroot') || '/wizard/';
     var substep_separator = '|';
+    var step_versions_header = 'X-Wizard-Step-Versions';
+    var prefetch_delay = $('body').data('prefetchdelay') || 1000;
 
     var getWizardUrl = function(path, endSlash){
         endSlash = endSlash || true;
@@ -123,6 +125,7 @@
         var structure = parseStepNames(data.structure);
         var steps = transformSteps(data.steps);
 
+        data.step_names = data.structure;
         data.structure = structure;
         data.current_step = currentStepInfo;
         data.steps = steps;
@@ -130,6 +133,82 @@
         return data;
     };
 
+    var StepCache = function(){
+        /*
+        Cache of the HTML of the steps, by form_id. The server leaves out the
+        HTML of the steps whose version the client holds.
+         */
+        this.entries = {};
+    };
+
+    StepCache.prototype.getRequestConfig = function(){
+        var versions = [];
+        var entries = this.entries;
+        Object.keys(entries).forEach(function(formId){
+            versions.push(formId + ':' + entries[formId].version);
+        });
+
+        var config = {headers: {}};
+        if(versions.length){
+            config.headers[step_versions_header] = versions.join(',');
+        }
+        return config;
+    };
+
+    StepCache.prototype.update = function(steps){
+        /*
+        Stores the HTML of the steps of a server state, and restores the HTML
+        of the steps left out because they are cached.
+         */
+        var entries = this.entries;
+        Object.keys(steps || {}).forEach(function(stepName){
+            var step = steps[stepName];
+            var entry = entries[step.form_id];
+            if(step.cached && entry && entry.version == step.version){
+                step.form = entry.form;
+                step.preview = entry.preview;
+            }
+            else if(step.version){
+                entries[step.form_id] = {version: step.version, form: step.form, preview: step.preview};
+            }
+        });
+    };
+
+    var CancelableRequests = function($http, $q){
+        /*
+        Sends GET requests, cancelling the request that is still pending when
+        another one is sent. Cancelled requests are rejected with canceled set.
+         */
+        this.$http = $http;
+        this.$q = $q;
+        this.canceler = null;
+    };
+
+    CancelableRequests.prototype.get = function(url, config){
+        this.cancel();
+        var $q = this.$q;
+        var self = this;
+        var canceler = this.canceler = $q.defer();
+        config.timeout = canceler.promise;
+
+        return this.$http.get(url, config).then(function(response){
+            if(self.canceler === canceler)self.canceler = null;
+            return response;
+        }, function(response){
+            if(self.canceler === canceler)self.canceler = null;
+            response.canceled = canceler.canceled || false;
+            return $q.reject(response);
+        });
+    };
+
+    CancelableRequests.prototype.cancel = function(){
+        if(this.canceler){
+            this.canceler.canceled = true;
+            this.canceler.resolve();
+            this.canceler = null;
+        }
+    };
+
     $.fn.serializeObject = function(){
         var o = {};
         var a = this.serializeArray();
@@ -153,21 +232,84 @@
         $httpProvider.defaults.xsrfHeaderName = 'X-CSRFToken';
     }]);
 
+    var captureFocus = function(element){
+        /*
+        Returns the name, value and selection of the focused field within
+        element, to focus it again once element is recompiled.
+         */
+        var active = document.activeElement;
+        if(!active || !active.name || !$.contains(element.get(0), active)){
+            return null;
+        }
+        var focus = {name: active.name, value: active.value, start: null, end: null};
+        try{
+            focus.start = active.selectionStart;
+            focus.end = active.selectionEnd;
+        }
+        catch(e){
+            // Fields without a text selection (e.g. checkboxes)
+        }
+        return focus;
+    };
+
+    var restoreFocus = function(element, focus){
+        if(!focus){
+            return;
+        }
+        var field = element.find('[name="' + focus.name + '"]').get(0);
+        if(!field){
+            return;
+        }
+        field.focus();
+        if(focus.start != null && field.value == focus.value){
+            try{
+                field.setSelectionRange(focus.start, focus.end);
+            }
+            catch(e){
+                // Fields without a text selection
+            }
+        }
+    };
+
     // http://stackoverflow.com/questions/17417607/angular-ng-bind-html-unsafe-and-directive-within-it
     app.directive('compile', ['$parse', '$compile', function ($parse, $compile){
+        /*
+        Compiles the bound HTML. With compile-version (e.g. the version of the
+        step), only a new version is checked for changed HTML. Unchanged HTML
+        isn't recompiled, and the focus and scroll position are kept when it
+        is.
+         */
         return {
             link: function($scope, element, attrs){
+                var contentScope = null;
+                var html = null;
+
                 $scope.$watch(function($scope){
-                    return $scope.$eval(attrs.compile);
-                }, function(value){
+                    return $scope.$eval(attrs.compileVersion || attrs.compile);
+                }, function(){
+                    var value = $scope.$eval(attrs.compile);
+                    if(contentScope && value === html){
+                        return;
+                    }
                     if(verbose)console.log('compile value:', value);
+                    html = value;
+
+                    var focus = captureFocus(element);
+                    var scrollTop = $(window).scrollTop();
+                    if(contentScope){
+                        contentScope.$destroy();
+                    }
+                    contentScope = $scope.$new();
                     element.html(value);
-                    $compile(element.contents())($scope);
+                    $compile(element.contents())(contentScope);
+                    restoreFocus(element, focus);
+                    $(window).scrollTop(scrollTop);
+
                     if (attrs.onReady){
                         var onReadyFn = $parse(attrs.onReady);
                         onReadyFn($scope);
                     }
-                }, true);
+                });
             },
             scope: true
         };
@@ -194,9 +336,22 @@
         };
     });
 
-    app.directive('wizard', ['$http', '$timeout', function($http, $timeout) {
+    app.directive('wizard', ['$http', '$q', '$timeout', function($http, $q, $timeout) {
         return {
             link: function($scope, elem, attrs){
+                var stepCache = new StepCache();
+                var requests = new CancelableRequests($http, $q);
+                // Step the wizard is being moved to, and the step to move to next
+                var navigation = {target: null, queued: null};
+                // Form being submitted, and the timer of a delayed submission
+                var submission = {form_id: null, timer: null};
+                var prefetches = new CancelableRequests($http, $q);
+                // Prefetched data of the next step
+                var prefetch = {step: null, data: null, timer: null};
+                // Whether a step moved to locally is being synced, the step to sync next, and
+                // the navigation to send once synced
+                var sync = {sending: false, queued: null, then: null};
+
                 $scope._set_initial_loading = function(loading){
                     $scope.initial_loading = loading;
                 };
@@ -213,26 +368,81 @@
                     $scope._set_loading(true);
                     $scope._set_initial_loading(true);
 
-                    var promise = $http.get(getWizardUrl('data'));
+                    var promise = requests.get(getWizardUrl('data'), stepCache.getRequestConfig());
                     promise.then(function(data){
                         $scope.handle_new_data(data);
                         // $scope._set_loading(false);
                         $scope._set_initial_loading(false);
-                    }, function(){
+                    }, function(data){
+                        if(data.canceled)return;
                         $scope.error = true;
                         $scope._set_loading(false);
                         $scope._set_initial_loading(false);
                     });
                 };
 
-                $scope.prev = function(){
-                    $scope._set_loading(true);
+                $scope._get_relative_step = function(offset){
+                    /*
+                    Returns the full name of the step offset steps from the
+                    step the wizard is (or will be) at.
+                     */
+                    var stepNames = $scope.data.step_names;
+                    var fromStep = navigation.queued || navigation.target || $scope.data.current_step.fullStep;
+                    var index = stepNames.indexOf(fromStep) + offset;
+                    return stepNames[Math.min(Math.max(index, 0), stepNames.length - 1)];
+                };
+
+                $scope._navigate = function(target, url){
+                    /*
+                    Moves the wizard to the step target. While a navigation
+                    request is sent, further navigation is collapsed into a
+                    single goto to the last target.
+                     */
+                    if(navigation.target !== null){
+                        navigation.queued = target;
+                        return false;
+                    }
+                    if($scope._is_local_step(target)){
+                        $scope._cancel_prefetch();
+                        if(target != $scope.data.current_step.fullStep){
+                            $scope._show_step(target, $scope._get_step_data(target));
+                            $scope._sync_step(target);
+                        }
+                        return false;
+                    }
+                    if(sync.sending){
+                        // Sent once the sync is done, the server may not be at
+                        // the step the client is at before
+                        $scope._set_loading(true);
+                        sync.then = function(){
+                            $scope._navigate(target, getWizardUrl('goto/' + target));
+                        };
+                        return false;
+                    }
+                    navigation.target = target;
+                    // The state of a pending refresh would be outdated
+                    requests.cancel();
+                    if(prefetch.step !== null && prefetch.step == target){
+                        // Show the prefetched step until the server responds
+                        $scope._show_step(target, prefetch.data);
+                    }
+                    else{
+                        $scope._set_loading(true);
+                    }
+                    $scope._cancel_prefetch();
 
-                    var promise = $http.post(getWizardUrl('prev'));
+                    var promise = $http.post(url, null, stepCache.getRequestConfig());
                     promise.then(function(data){
+                        var queued = navigation.queued;
+                        navigation.target = navigation.queued = null;
+                        if(queued !== null && queued != data.data.current_step){
+                            $scope._navigate(queued, getWizardUrl('goto/' + queued));
+                            return;
+                        }
                         $scope.handle_new_data(data);
                         // $scope._set_loading(false);
                     }, function(){
+                        navigation.target = navigation.queued = null;
                         $scope._set_loading(false);
                         $scope.error = true;
                     });
@@ -240,38 +450,142 @@
                     return false;
                 };
 
-                $scope.next = function(){
-                    $scope._set_loading(true);
+                $scope._get_step_data = function(fullStep){
+                    var stepInfo = parseStepName(fullStep);
+                    if(stepInfo.subStep == null){
+                        return $scope.data.steps[stepInfo.step];
+                    }
+                    return ($scope.data.steps[stepInfo.step] || {})[stepInfo.subStep];
+                };
 
-                    var promise = $http.post(getWizardUrl('next'));
-                    promise.then(function(data){
-                        $scope.handle_new_data(data);
-                        // $scope._set_loading(false);
+                $scope._is_local_step = function(fullStep){
+                    /*
+                    Returns true if the client can move to the step without
+                    asking the server: it's always reachable and loaded, and
+                    the server can be synced.
+                     */
+                    var navigationData = $scope.data.navigation;
+                    if(!navigationData || !navigationData.sync || navigationData.reachable.indexOf(fullStep) < 0){
+                        return false;
+                    }
+                    var stepData = $scope._get_step_data(fullStep);
+                    return !!stepData && stepData.form !== undefined;
+                };
+
+                $scope._sync_step = function(fullStep){
+                    /*
+                    Moves the server to the step the client moved to, without
+                    rendering the state. Only the last of the steps moved to
+                    while a sync is sent is synced next.
+                     */
+                    if(sync.sending){
+                        sync.queued = fullStep;
+                        return;
+                    }
+                    sync.sending = true;
+
+                    var promise = $http.post(getWizardUrl($scope.data.navigation.sync + '/' + fullStep));
+                    promise.then(function(){
+                        var queued = sync.queued;
+                        var then = sync.then;
+                        sync.sending = false;
+                        sync.queued = sync.then = null;
+                        if(then !== null){
+                            // Navigation asked for while syncing moves the server itself
+                            then();
+                        }
+                        else if(queued !== null){
+                            $scope._sync_step(queued);
+                        }
+                        else{
+                            $scope._schedule_prefetch();
+                        }
                     }, function(){
-                        $scope._set_loading(false);
-                        $scope.error = true;
+                        sync.sending = false;
+                        sync.queued = sync.then = null;
+                        $scope.refresh();
                     });
+                };
 
-                    return false;
+                $scope._show_step = function(fullStep, stepData){
+                    var stepInfo = parseStepName(fullStep);
+                    if(stepInfo.subStep == null){
+                        $scope.data.steps[stepInfo.step] = stepData;
+                    }
+                    else{
+                        $scope.data.steps[stepInfo.step][stepInfo.subStep] = stepData;
+                    }
+                    $scope.data.current_step = stepInfo;
+                    $timeout(function(){
+                        $scope.$broadcast('activateSubstep');
+                    }, 1);
                 };
 
-                $scope.goto = function(step, substep){
-                    $scope._set_loading(true);
+                $scope._cancel_prefetch = function(){
+                    if(prefetch.timer){
+                        $timeout.cancel(prefetch.timer);
+                    }
+                    prefetches.cancel();
+                    prefetch.step = prefetch.data = prefetch.timer = null;
+                };
+
+                $scope._schedule_prefetch = function(){
+                    /*
+                    Requests the next step (without changing the current step
+                    of the wizard) once the client is idle, so next can show
+                    it right away.
+                     */
+                    $scope._cancel_prefetch();
+                    var navigationData = $scope.data.navigation;
+                    if(!navigationData || !navigationData.peek){
+                        return;
+                    }
+                    var perform_prefetch = function(){
+                        // The next step is relative to the step the server is at
+                        if(navigation.target !== null || sync.sending){
+                            return;
+                        }
+                        var promise = prefetches.get(getWizardUrl(navigationData.peek), stepCache.getRequestConfig());
+                        promise.then(function(response){
+                            var steps = {};
+                            steps[response.data.step] = response.data.data;
+                            stepCache.update(steps);
+                            prefetch.step = response.data.step;
+                            prefetch.data = steps[response.data.step];
+                        }, function(){
+                            // Next is sent without a prefetched step
+                        });
+                    };
 
+                    prefetch.timer = $timeout(function(){
+                        prefetch.timer = null;
+                        if(window.requestIdleCallback){
+                            window.requestIdleCallback(function(){
+                                $scope.$apply(perform_prefetch);
+                            });
+                        }
+                        else{
+                            perform_prefetch();
+                        }
+                    }, prefetch_delay);
+                };
+
+                $scope.prev = function(){
+                    if(!$scope.data)return false;
+                    return $scope._navigate($scope._get_relative_step(-1), getWizardUrl('prev'));
+                };
+
+                $scope.next = function(){
+                    if(!$scope.data)return false;
+                    return $scope._navigate($scope._get_relative_step(1), getWizardUrl('next'));
+                };
+
+                $scope.goto = function(step, substep){
                     var fullStep = step;
                     if(substep){
                         fullStep += substep_separator + substep;
                     }
-                    var promise = $http.post(getWizardUrl('goto/' + fullStep));
-                    promise.then(function(data){
-                        $scope.handle_new_data(data);
-                        // $scope._set_loading(false);
-                    }, function(){
-                        $scope.error = true;
-                        $scope._set_loading(false);
-                    });
-
-                    return false;
+                    return $scope._navigate(fullStep, getWizardUrl('goto/' + fullStep));
                 };
 
                 $scope.action_edit_step = function(subStep, step){
@@ -282,28 +596,47 @@
                 };
 
                 $scope.action_submit_step = function(form_id, delay){
+                    /*
+                    Submits the form form_id. Repeated submissions within
+                    delay are debounced into the last one, and a form isn't
+                    submitted again while its submission is sent.
+                     */
                     $scope._set_loading(true);
 
                     var perform_submit = function() {
+                        submission.timer = null;
+                        if(submission.form_id == form_id){
+                            return;
+                        }
+                        submission.form_id = form_id;
+                        requests.cancel();
+                        $scope._cancel_prefetch();
+
                         var form = $('#' + form_id);
                         var form_data = form.serializeObject();
                         if (verbose)console.log(form_data);
 
                         var fullStepName = $scope.data.current_step.fullStep;
 
-                        var promise = $http.post(getWizardUrl(fullStepName), form_data);
+                        var promise = $http.post(getWizardUrl(fullStepName), form_data, stepCache.getRequestConfig());
                         promise.then(function (data) {
+                            submission.form_id = null;
                             $scope.handle_new_data(data);
                             $scope._set_loading(false);
                         }, function (data) {
+                            submission.form_id = null;
                             $scope.error = true;
                             $scope.handle_new_data(data);
                             $scope._set_loading(false);
                         });
                     };
 
+                    if(submission.timer){
+                        $timeout.cancel(submission.timer);
+                        submission.timer = null;
+                    }
                     if(delay){
-                        setTimeout(perform_submit, delay);
+                        submission.timer = $timeout(perform_submit, delay);
                         return;
                     }
                     else{
@@ -328,6 +661,7 @@
                 };
 
                 $scope.handle_new_data = function(data){
+                    stepCache.update(data.data.steps);
                     data = transformData(data.data);
                     if(verbose)console.log(data);
 
@@ -338,6 +672,7 @@
                     }
 
                     $scope.data = data;
+                    $scope._schedule_prefetch();
 
                     $timeout(function(){
                         $scope.$broadcast('activateSubstep');
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django import template
+
+from ..wizard.rendering import render_as_p
+
+register = template.Library()
+
+
+@register.filter
+def as_p_compiled(form):
+    """
+    Renders `form` like ``form.as_p``, see `formtools_addons.wizard.rendering`.
+    """
+    return render_as_p(form)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread safe dict-like cache holding at most `maxsize` items, the least
+    recently used items are evicted first.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            # Move the item to the end, as most recently used
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_class_cache_lock = threading.Lock()
+
+
+def get_class_cache(cls, name, maxsize):
+    """
+    Returns the `LRUCache` stored as attribute `name` of `cls`, creating it if
+    needed. Subclasses get a cache of their own.
+    """
+    cache = cls.__dict__.get(name)
+    if cache is None:
+        with _class_cache_lock:
+            cache = cls.__dict__.get(name)
+            if cache is None:
+                cache = LRUCache(maxsize)
+                setattr(cls, name, cache)
+    return cache
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Serves stored step files of `WizardAPIView` (``GET file/<step>/?field=``).
+
+Files are streamed from the wizard's `file_storage` in chunks of
+`download_chunk_size` bytes, never read into memory as a whole. Single byte
+ranges (``Range``) and conditional requests (``ETag``, ``Last-Modified``) are
+supported. With `download_accel_header` set, the file is left to the front-end
+server (``X-Accel-Redirect`` for nginx, ``X-Sendfile`` for Apache or
+lighttpd).
+
+The content type of a file is the one sent by the client with the upload, so
+files are served as attachments (with ``X-Content-Type-Options: nosniff``)
+unless their type is one of `download_inline_types`. Uploaded HTML or SVG is
+never rendered on the site's origin.
+"""
+from __future__ import unicode_literals
+
+import calendar
+import hashlib
+import re
+import time
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag, urlquote
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) (inclusive) of the single byte range `header`,
+    None if the whole file should be served, or False if the range can't be
+    satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple or malformed ranges, serve the whole file
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # The last `end` bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def get_content_disposition(disposition, file_name):
+    """
+    Returns a Content-Disposition header value, with the UTF-8 encoded
+    `file_name` (RFC 5987) and an ASCII fallback.
+    """
+    fallback = re.sub(r'[^\w .-]', '_', file_name.encode('ascii', 'replace').decode('ascii'))
+    return '%s; filename="%s"; filename*=UTF-8\'\'%s' % (disposition, fallback, urlquote(file_name, safe=''))
+
+
+def iter_file(file_obj, start, length, chunk_size):
+    """
+    Yields `length` bytes of `file_obj` from `start`, in chunks of at most
+    `chunk_size` bytes, and closes the file.
+    """
+    try:
+        if start:
+            file_obj.seek(start)
+        while length > 0:
+            data = file_obj.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file_obj.close()
+
+
+class StepFileDownloadMixin(object):
+    """
+    * `download_chunk_size` - bytes per streamed chunk
+    * `download_accel_header` - e.g. 'X-Accel-Redirect' or 'X-Sendfile', to
+      let the front-end server send the files
+    * `download_accel_location` - internal location of the `file_storage`
+      files for `download_accel_header` (e.g. '/protected/wizard/' for nginx).
+      Without it the path of the files is sent (e.g. for X-Sendfile), or the
+      file is streamed if the storage has no paths.
+    * `download_inline_types` - content types served inline, other files are
+      served as attachments
+    """
+    download_chunk_size = 64 * 1024
+    download_accel_header = None
+    download_accel_location = None
+    download_inline_types = ('application/pdf', 'image/gif', 'image/jpeg', 'image/png', 'image/webp', 'text/plain')
+
+    def get_stored_file(self, step, field_name):
+        """
+        Returns the stored file dict of `field_name` of `step`, or None.
+        """
+        return self.storage.data[self.storage.step_files_key].get(step, {}).get(field_name)
+
+    def get_file_modified_time(self, name):
+        """
+        Returns the modification time of the stored file `name` as timestamp,
+        or None if the storage doesn't know it.
+        """
+        # get_modified_time() replaces modified_time() in Django 1.10
+        get_modified_time = getattr(self.file_storage, 'get_modified_time', None) or self.file_storage.modified_time
+        try:
+            modified_time = get_modified_time(name)
+        except (NotImplementedError, OSError, IOError):
+            return None
+        if timezone.is_aware(modified_time):
+            return calendar.timegm(modified_time.utctimetuple())
+        # Naive times of the storages are local times
+        return time.mktime(modified_time.timetuple())
+
+    def get_file_etag(self, file_dict, size):
+        value = '%s:%s' % (file_dict['tmp_name'], size)
+        return quote_etag(hashlib.sha1(value.encode('utf-8')).hexdigest())
+
+    def get_accel_redirect(self, file_dict):
+        """
+        Returns the value of `download_accel_header` for the file, or None if
+        the file has to be streamed.
+        """
+        if self.download_accel_location is not None:
+            return self.download_accel_location + file_dict['tmp_name']
+        try:
+            return self.file_storage.path(file_dict['tmp_name'])
+        except NotImplementedError:
+            # e.g. a remote storage
+            return None
+
+    def get_content_disposition(self, file_dict, content_type):
+        base_type = content_type.split(';')[0].strip().lower()
+        disposition = 'inline' if base_type in self.download_inline_types else 'attachment'
+        return get_content_disposition(disposition, file_dict['name'] or 'download')
+
+    def is_not_modified(self, etag, last_modified):
+        if_none_match = self.request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(self.request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return bool(if_modified_since and last_modified and int(last_modified) <= if_modified_since)
+
+    def serve_step_file(self, step):
+        """
+        Responds with the stored file of the `field` parameter of `step`.
+        """
+        file_dict = self.get_stored_file(step, self.request.GET.get('field'))
+        if file_dict is None or not getattr(self, 'file_storage', None):
+            return self.render_response_error('file not found', status_code=404)
+
+        name = file_dict['tmp_name']
+        content_type = file_dict['content_type'] or 'application/octet-stream'
+        try:
+            size = self.file_storage.size(name)
+        except (OSError, IOError):
+            return self.render_response_error('file not found', status_code=404)
+        last_modified = self.get_file_modified_time(name)
+        etag = self.get_file_etag(file_dict, size)
+
+        accel_redirect = self.get_accel_redirect(file_dict) if self.download_accel_header else None
+        if self.is_not_modified(etag, last_modified):
+            response = HttpResponse(status=304)
+        elif accel_redirect is not None:
+            response = HttpResponse(content_type=content_type)
+            response[self.download_accel_header] = accel_redirect
+        else:
+            response = self.stream_file(name, size, content_type, etag)
+
+        # The content type was sent by the client, don't let the browser
+        # render anything else
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['Content-Disposition'] = self.get_content_disposition(file_dict, content_type)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def stream_file(self, name, size, content_type, etag):
+        byte_range = None
+        range_header = self.request.META.get('HTTP_RANGE')
+        if_range = self.request.META.get('HTTP_IF_RANGE')
+        if range_header and (if_range is None or if_range == etag):
+            byte_range = parse_range(range_header, size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+        response = StreamingHttpResponse(
+            iter_file(self.file_storage.open(name), start, length, self.download_chunk_size),
+            status=206 if byte_range else 200, content_type=content_type)
+        response['Content-Length'] = '%d' % length
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range:
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        return response
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Rate-limited logging of form validation errors.
+
+Invalid steps are logged as structured records (the `wizard`, `step`,
+`fields` and `error_count` attributes are set on the log record) and only
+formatted when a handler actually emits them. A token bucket limits the number
+of records per second; errors that are not logged are still counted and
+reported in periodic summaries per wizard and step. A summary is logged by
+the first `log()` or `flush_due()` call after its interval, so views call
+`flush_due()` on every request to report bursts followed by silence.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+import timeit
+from collections import defaultdict
+
+from django.utils.encoding import python_2_unicode_compatible
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` events per second, with bursts of up to `burst` events.
+    """
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = self.clock()
+
+    def consume(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+@python_2_unicode_compatible
+class FieldErrors(object):
+    """
+    Formats form errors as `field: "error"` pairs when converted to text.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+
+    def __str__(self):
+        return '; '.join('%s: "%s"' % (field, '", "'.join('%s' % error for error in errors))
+                         for field, errors in self.errors.items())
+
+
+class ValidationErrorLogger(object):
+    """
+    Logs validation errors of wizard steps.
+
+    * `rate` and `burst` - number of records per second (and in a burst)
+      logged with their errors, further errors are only counted
+    * `summary_interval` - seconds between summary records with the error
+      counts per wizard and step
+    """
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__(self, logger, rate=1, burst=10, summary_interval=60):
+        self.logger = logger
+        self.bucket = TokenBucket(rate, burst)
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.counts = defaultdict(int)
+        self.suppressed = 0
+        self.started = self.clock()
+
+    def log(self, level, wizard, step, errors):
+        """
+        Logs the `errors` (a form's `errors` dict) of `step` of `wizard`.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+
+        with self._lock:
+            self.counts[(wizard, step)] += 1
+            allowed = self.bucket.consume()
+            if not allowed:
+                self.suppressed += 1
+            summary = self._pop_due_summary()
+
+        if allowed:
+            fields = dict((field, len(field_errors)) for field, field_errors in errors.items())
+            self.logger.log(level, 'Invalid step "%s" of %s: %s', step, wizard, FieldErrors(errors), extra={
+                'wizard': wizard,
+                'step': step,
+                'fields': fields,
+                'error_count': sum(fields.values()),
+            })
+        if summary is not None:
+            self._log_summary(level, summary)
+
+    def flush_due(self, level=logging.ERROR):
+        """
+        Logs the summary of the current interval if the interval is over.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        with self._lock:
+            summary = self._pop_due_summary()
+        if summary is not None:
+            self._log_summary(level, summary)
+
+    def flush(self, level=logging.ERROR):
+        """
+        Logs the summary of the current interval now.
+        """
+        with self._lock:
+            summary = self._pop_summary()
+        self._log_summary(level, summary)
+
+    def _pop_due_summary(self):
+        if self.clock() - self.started >= self.summary_interval:
+            return self._pop_summary()
+        return None
+
+    def _pop_summary(self):
+        summary = (dict(self.counts), self.suppressed, self.clock() - self.started)
+        self._reset()
+        return summary
+
+    def _log_summary(self, level, summary):
+        counts, suppressed, duration = summary
+        if not counts:
+            return
+        self.logger.log(
+            level, 'Invalid steps in the last %ds: %s (%d not logged)', duration,
+            ', '.join('%s "%s": %d' % (wizard, step, count) for (wizard, step), count in sorted(counts.items())),
+            suppressed,
+            extra={
+                'validation_summary': [{'wizard': wizard, 'step': step, 'count': count}
+                                       for (wizard, step), count in sorted(counts.items())],
+                'suppressed': suppressed,
+            })
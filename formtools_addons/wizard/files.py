@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Content addressed storage of wizard uploads.
+
+Every uploaded file is stored once in the wizard's `file_storage`, under the
+SHA-256 digest of its content (``<location>/<digest[:2]>/<digest>``). Each
+wizard state referencing a blob owns an empty marker file
+(``<blob>.refs/<owner>``), the blob is deleted when the last marker is. While
+a blob is being deleted, the releasing owner holds a marker
+(``<blob>.releasing/<owner>``), so a concurrent `add` waits for the deletion
+and stores the blob again.
+
+Uploads are hashed while they are received when the `Hashing*UploadHandler`
+classes are used as ``FILE_UPLOAD_HANDLERS``, otherwise they are read once to
+compute the digest before they are stored.
+
+Wizard states list their files in a manifest
+(``<location>/<bucket>/<owner>``), in the bucket of the time they were last
+updated. `FileSweeper` finds the files of abandoned wizards by listing the
+expired buckets only.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import posixpath
+import time
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+def get_content_digest(field_file):
+    """
+    Returns the hex SHA-256 digest of the content of `field_file`.
+    """
+    digest = getattr(field_file, 'content_digest', None)
+    if digest:
+        return digest
+
+    hasher = hashlib.sha256()
+    for chunk in field_file.chunks():
+        hasher.update(chunk)
+    field_file.seek(0)
+    field_file.content_digest = hasher.hexdigest()
+    return field_file.content_digest
+
+
+class HashingUploadHandlerMixin(object):
+    """
+    Computes the digest of the uploaded files while they are received, and
+    sets it as `content_digest` on the files.
+    """
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        super(HashingUploadHandlerMixin, self).new_file(*args, **kwargs)
+
+    def is_receiving(self):
+        return True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.is_receiving():
+            self.hasher.update(raw_data)
+        return super(HashingUploadHandlerMixin, self).receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        field_file = super(HashingUploadHandlerMixin, self).file_complete(file_size)
+        if field_file is not None:
+            field_file.content_digest = self.hasher.hexdigest()
+        return field_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    def is_receiving(self):
+        return self.activated
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class BlobStore(object):
+    """
+    Stores files in `file_storage` under their digest, reference counted by
+    owner.
+
+    * `release_timeout` - seconds `add` waits at most for a concurrent
+      deletion of the blob (e.g. for the marker of a crashed release)
+    """
+    clock = staticmethod(time.time)
+    sleep = staticmethod(time.sleep)
+    release_poll_interval = 0.05
+
+    def __init__(self, file_storage, location='wizard_blobs', release_timeout=5):
+        self.file_storage = file_storage
+        self.location = location
+        self.release_timeout = release_timeout
+
+    def get_blob_name(self, digest):
+        return posixpath.join(self.location, digest[:2], digest)
+
+    def get_refs_dir(self, digest):
+        return self.get_blob_name(digest) + '.refs'
+
+    def get_releasing_dir(self, digest):
+        return self.get_blob_name(digest) + '.releasing'
+
+    def list_dir(self, directory):
+        try:
+            directories, names = self.file_storage.listdir(directory)
+        except (OSError, IOError):
+            return []
+        return names
+
+    def get_digest(self, name):
+        """
+        Returns the digest of the blob stored as `name`, or None if `name`
+        isn't a blob of this store.
+        """
+        directory, digest = posixpath.split(name)
+        if directory != posixpath.join(self.location, digest[:2]):
+            return None
+        return digest
+
+    def add(self, field_file, owner):
+        """
+        Stores `field_file` (unless its content is already stored) and adds a
+        reference of `owner` to it. Returns the name of the blob.
+        """
+        digest = get_content_digest(field_file)
+        name = self.get_blob_name(digest)
+        ref_name = posixpath.join(self.get_refs_dir(digest), owner)
+        # The reference is added first: a concurrent release that lists the
+        # references after this doesn't delete the blob. A release that listed
+        # them before holds a releasing marker until the blob is deleted, the
+        # blob is checked (and stored again) only after that.
+        if not self.file_storage.exists(ref_name):
+            self.file_storage.save(ref_name, ContentFile(b''))
+        self.wait_for_release(digest)
+        if not self.file_storage.exists(name):
+            saved_name = self.file_storage.save(name, field_file)
+            if saved_name != name:
+                # Stored concurrently under the same digest
+                self.file_storage.delete(saved_name)
+        return name
+
+    def wait_for_release(self, digest):
+        """
+        Waits until no owner is deleting the blob, at most `release_timeout`
+        seconds.
+        """
+        releasing_dir = self.get_releasing_dir(digest)
+        deadline = self.clock() + self.release_timeout
+        while self.list_dir(releasing_dir) and self.clock() < deadline:
+            self.sleep(self.release_poll_interval)
+
+    def release(self, digest, owner):
+        """
+        Removes the reference of `owner` to the blob, and deletes the blob if
+        that was its last reference.
+        """
+        refs_dir = self.get_refs_dir(digest)
+        self.file_storage.delete(posixpath.join(refs_dir, owner))
+        if self.list_dir(refs_dir):
+            return
+
+        # Mark the deletion and list the references again: an owner adding a
+        # reference after this waits for the marker to be deleted
+        marker_name = posixpath.join(self.get_releasing_dir(digest), '%s-%s' % (owner, uuid.uuid4().hex))
+        marker_name = self.file_storage.save(marker_name, ContentFile(b''))
+        try:
+            if not self.list_dir(refs_dir):
+                self.file_storage.delete(self.get_blob_name(digest))
+        finally:
+            self.file_storage.delete(marker_name)
+
+
+class FileManifest(object):
+    """
+    Manifests listing the files of wizard states, in buckets of `interval`
+    seconds.
+    """
+    clock = staticmethod(time.time)
+
+    def __init__(self, file_storage, location='wizard_manifests', interval=3600):
+        self.file_storage = file_storage
+        self.location = location
+        self.interval = interval
+
+    def get_bucket(self, timestamp=None):
+        if timestamp is None:
+            timestamp = self.clock()
+        return '%d' % (int(timestamp // self.interval) * self.interval)
+
+    def get_name(self, bucket, owner):
+        return posixpath.join(self.location, bucket, owner)
+
+    def write(self, bucket, owner, names):
+        name = self.get_name(bucket, owner)
+        # Storage.save() doesn't overwrite existing files
+        self.file_storage.delete(name)
+        self.file_storage.save(name, ContentFile(json.dumps({'names': names}).encode('utf-8')))
+
+    def read(self, bucket, owner):
+        with self.file_storage.open(self.get_name(bucket, owner)) as manifest_file:
+            return json.loads(manifest_file.read().decode('utf-8'))['names']
+
+    def delete(self, bucket, owner):
+        self.file_storage.delete(self.get_name(bucket, owner))
+
+    def get_expired_buckets(self, max_age):
+        """
+        Returns the buckets that were last updated more than `max_age` seconds
+        ago, oldest first.
+        """
+        try:
+            buckets, files = self.file_storage.listdir(self.location)
+        except (OSError, IOError):
+            return []
+        expired_before = self.clock() - max_age
+        return sorted((bucket for bucket in buckets
+                       if bucket.isdigit() and int(bucket) + self.interval <= expired_before), key=int)
+
+    def get_owners(self, bucket):
+        try:
+            directories, owners = self.file_storage.listdir(posixpath.join(self.location, bucket))
+        except (OSError, IOError):
+            return []
+        return sorted(owners)
+
+
+class SweepStats(object):
+    def __init__(self):
+        self.manifests = 0
+        self.files = 0
+        self.errors = 0
+
+    def __repr__(self):
+        return '<SweepStats manifests=%d files=%d errors=%d>' % (self.manifests, self.files, self.errors)
+
+
+class FileSweeper(object):
+    """
+    Deletes the files of wizards that weren't updated for `max_age` seconds,
+    as listed in their manifests.
+
+    * `batch_size` - number of files deleted per batch
+    * `rate` - maximum number of files deleted per second (None for no limit)
+    * `dry_run` - only count the files that would be deleted
+
+    Only files below `blob_location`, `upload_location` and `file_location`
+    are deleted, other names listed in a manifest are counted as errors.
+    """
+    clock = staticmethod(time.time)
+    sleep = staticmethod(time.sleep)
+
+    def __init__(self, file_storage, max_age, batch_size=100, rate=None, dry_run=False,
+                 manifest_location='wizard_manifests', manifest_interval=3600, blob_location='wizard_blobs',
+                 upload_location='wizard_uploads', file_location='wizard_files'):
+        self.file_storage = file_storage
+        self.locations = [blob_location, upload_location, file_location]
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.rate = rate
+        self.dry_run = dry_run
+        self.manifest = FileManifest(file_storage, manifest_location, manifest_interval)
+        self.blob_store = BlobStore(file_storage, blob_location)
+
+    def get_expired_manifests(self):
+        """
+        Yields (bucket, owner) of the manifests of abandoned wizards.
+        """
+        for bucket in self.manifest.get_expired_buckets(self.max_age):
+            for owner in self.manifest.get_owners(bucket):
+                yield bucket, owner
+
+    def get_batches(self):
+        """
+        Yields lists of at most `batch_size` (bucket, owner, names) of expired
+        manifests. A manifest listing more files is a batch of its own.
+        """
+        batch, batch_files = [], 0
+        for bucket, owner in self.get_expired_manifests():
+            try:
+                names = self.manifest.read(bucket, owner)
+            except (OSError, IOError, ValueError, KeyError):
+                names = []
+            if batch and batch_files + len(names) > self.batch_size:
+                yield batch
+                batch, batch_files = [], 0
+            batch.append((bucket, owner, names))
+            batch_files += len(names)
+        if batch:
+            yield batch
+
+    def is_sweepable(self, name):
+        """
+        Returns True if `name` is below one of the locations of wizard files.
+        """
+        path = name.rstrip('/')
+        if posixpath.normpath(path) != path:
+            return False
+        return any(path.startswith(location.rstrip('/') + '/') for location in self.locations)
+
+    def delete_file(self, name, owner):
+        if name.endswith('/'):
+            # The chunk directory of an unfinished upload
+            directory = name.rstrip('/')
+            for chunk in self.blob_store.list_dir(directory):
+                self.file_storage.delete(posixpath.join(directory, chunk))
+            return
+        digest = self.blob_store.get_digest(name)
+        if digest is not None:
+            self.blob_store.release(digest, owner)
+        else:
+            self.file_storage.delete(name)
+
+    def sweep(self):
+        """
+        Deletes the files and manifests of abandoned wizards, and returns the
+        `SweepStats`.
+        """
+        stats = SweepStats()
+        for batch in self.get_batches():
+            started = self.clock()
+            deleted = 0
+            for bucket, owner, names in batch:
+                errors = 0
+                for name in names:
+                    if not self.is_sweepable(name):
+                        # Not deleted, but it doesn't keep the manifest
+                        stats.errors += 1
+                        continue
+                    if not self.dry_run:
+                        try:
+                            self.delete_file(name, owner)
+                        except (OSError, IOError):
+                            errors += 1
+                            continue
+                    stats.files += 1
+                    deleted += 1
+                # A manifest is kept until all its files are deleted, so they
+                # are retried by the next sweep
+                if not self.dry_run and not errors:
+                    self.manifest.delete(bucket, owner)
+                stats.manifests += 1
+                stats.errors += errors
+
+            if self.rate and not self.dry_run:
+                remaining = deleted / float(self.rate) - (self.clock() - started)
+                if remaining > 0:
+                    self.sleep(remaining)
+        return stats
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Stores the uploads of wizard steps in the background.
+
+With `BackgroundFileStorageMixin`, the files of a submitted step are not
+copied to the wizard's `file_storage` while the request is handled. Each
+upload is staged in a local temporary file (a hard link of the uploaded
+temporary file where possible) and copied by the threads of a bounded
+`FileCopyExecutor`. The wizard state records the file as pending until the
+copy is done. Then it is stored like any other step file.
+
+When a copy finishes, its task writes a status file
+(``<location>/<task_id>``) to `file_storage`, so a state can be resolved by
+another process too. While the task is pending, the process that staged the
+file reads it from the staged copy.
+
+The executor is configured with the `FORMTOOLS_ADDONS_FILE_EXECUTOR`
+setting::
+
+    FORMTOOLS_ADDONS_FILE_EXECUTOR = {
+        'MAX_WORKERS': 2,
+        'MAX_QUEUE': 16,
+    }
+
+When the queue is full, `submit()` blocks for up to `timeout` seconds
+(backpressure). If the queue is still full after that, the file is copied
+in the request.
+"""
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.signals import setting_changed
+from django.forms import formsets
+from django.utils.translation import ugettext as _
+from six.moves import queue
+
+from .cache import LRUCache
+
+logger = logging.getLogger('formtools_addons.wizard.persistence')
+
+
+def stage_file(field_file):
+    """
+    Returns the path of a local temporary copy of `field_file`, which stays
+    available after the request is finished.
+    """
+    fd, path = tempfile.mkstemp(prefix='wizard-', dir=getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None))
+    os.close(fd)
+    temporary_file_path = getattr(field_file, 'temporary_file_path', None)
+    if temporary_file_path is not None:
+        try:
+            os.unlink(path)
+            os.link(temporary_file_path(), path)
+            return path
+        except (OSError, AttributeError):
+            # e.g. another file system, or no hard links on this platform
+            pass
+    field_file.seek(0)
+    with open(path, 'wb') as staged:
+        for chunk in field_file.chunks():
+            staged.write(chunk)
+    field_file.seek(0)
+    return path
+
+
+def get_status_name(location, task_id):
+    return posixpath.join(location, task_id)
+
+
+class FileCopyTask(object):
+    """
+    Copies the staged file `staged_path` to `file_storage` as `name`.
+    """
+    def __init__(self, file_storage, name, staged_path, status_location='wizard_file_status'):
+        self.task_id = uuid.uuid4().hex
+        self.file_storage = file_storage
+        self.name = name
+        self.staged_path = staged_path
+        self.status_location = status_location
+        self.stored_name = None
+        self.error = None
+        self.discarded = False
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def get_status_name(self):
+        return get_status_name(self.status_location, self.task_id)
+
+    def get_status(self):
+        return {'name': self.stored_name, 'error': self.error}
+
+    def run(self):
+        try:
+            with open(self.staged_path, 'rb') as staged:
+                self.stored_name = self.file_storage.save(self.name, File(staged, name=self.name))
+        except Exception as e:
+            logger.exception('Failed to store the wizard file %r', self.name)
+            self.error = '%s' % e
+        finally:
+            try:
+                os.unlink(self.staged_path)
+            except OSError:
+                pass
+            with self._lock:
+                if self.discarded:
+                    self.delete_copy()
+                else:
+                    self.write_status()
+                self.done.set()
+
+    def discard(self):
+        """
+        Deletes the copy once it's done, e.g. when its wizard was reset.
+        """
+        with self._lock:
+            self.discarded = True
+            if self.done.is_set():
+                self.delete_copy()
+                self.file_storage.delete(self.get_status_name())
+
+    def delete_copy(self):
+        if self.stored_name is not None:
+            self.file_storage.delete(self.stored_name)
+
+    def write_status(self):
+        try:
+            self.file_storage.save(self.get_status_name(),
+                                   ContentFile(json.dumps(self.get_status()).encode('utf-8')))
+        except Exception:
+            # The process that started the task still knows the status
+            logger.exception('Failed to write the status of the wizard file %r', self.name)
+
+
+def read_task_status(file_storage, status_name):
+    """
+    Returns the status written by a `FileCopyTask` of another process, or None
+    if the task isn't done.
+    """
+    try:
+        with file_storage.open(status_name) as status_file:
+            return json.loads(status_file.read().decode('utf-8'))
+    except (OSError, IOError, ValueError):
+        return None
+
+
+class FileCopyExecutor(object):
+    """
+    Runs `FileCopyTask`s in at most `max_workers` daemon threads, with at
+    most `max_queue` tasks waiting.
+    """
+    def __init__(self, max_workers=2, max_queue=16):
+        self.max_workers = max_workers
+        self.queue = queue.Queue(max_queue)
+        # Tasks of this process by id, until their status is collected
+        self.tasks = LRUCache(1024)
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start_workers(self):
+        with self._lock:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self.work, name='wizard-file-copy-%d' % len(self._workers))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def work(self):
+        while True:
+            task = self.queue.get()
+            try:
+                task.run()
+            finally:
+                self.queue.task_done()
+
+    def submit(self, task, timeout=None):
+        """
+        Queues `task`, waiting at most `timeout` seconds for a free slot.
+        Raises `queue.Full` if there is none.
+        """
+        self.start_workers()
+        self.tasks.set(task.task_id, task)
+        try:
+            self.queue.put(task, timeout=timeout)
+        except queue.Full:
+            self.tasks.pop(task.task_id, None)
+            raise
+        return task
+
+    def get_task(self, task_id):
+        return self.tasks.get(task_id)
+
+    def forget(self, task_id):
+        self.tasks.pop(task_id, None)
+
+
+_executor = None
+
+
+def get_file_executor():
+    """
+    Returns the executor configured by `FORMTOOLS_ADDONS_FILE_EXECUTOR`.
+    """
+    global _executor
+    if _executor is None:
+        config = getattr(settings, 'FORMTOOLS_ADDONS_FILE_EXECUTOR', None) or {}
+        _executor = FileCopyExecutor(max_workers=config.get('MAX_WORKERS', 2),
+                                     max_queue=config.get('MAX_QUEUE', 16))
+    return _executor
+
+
+def set_file_executor(executor):
+    """
+    Overrides the configured executor, `None` reloads it from the settings.
+    """
+    global _executor
+    _executor = executor
+
+
+def _reset_file_executor(setting, **kwargs):
+    if setting == 'FORMTOOLS_ADDONS_FILE_EXECUTOR':
+        set_file_executor(None)
+
+
+setting_changed.connect(_reset_file_executor)
+
+
+class PendingFilesMixin(object):
+    """
+    Makes the view wait for the files of a `BackgroundFileStorageMixin`
+    storage when the wizard is done, and reports the files that couldn't be
+    stored as errors of their steps.
+
+    * `pending_files_timeout` - seconds to wait for files still being stored
+    """
+    pending_files_timeout = 30
+
+    def wait_for_files(self):
+        wait_for_files = getattr(self.storage, 'wait_for_files', None)
+        if wait_for_files is not None:
+            wait_for_files(self.pending_files_timeout)
+
+    def get_failed_files(self, step):
+        get_failed_files = getattr(self.storage, 'get_failed_files', None)
+        return get_failed_files(step) if get_failed_files is not None else []
+
+    def get_failed_file_error(self, step, field_name):
+        return _('The file could not be stored, please upload it again.')
+
+    def get_file_field(self, form_objs, field_name):
+        """
+        Returns the form of `form_objs` (or of their formsets) with the field
+        of the file `field_name` and the name of the field, or the first form
+        or formset and None.
+        """
+        for form_obj in form_objs:
+            for form in (form_obj.forms if isinstance(form_obj, formsets.BaseFormSet) else [form_obj]):
+                for name in form.fields:
+                    if field_name in (name, form.add_prefix(name)):
+                        return form, name
+        return form_objs[0], None
+
+    def add_file_errors(self, step, form_objs):
+        """
+        Adds an error to the (bound) `form_objs` of `step` for each of its
+        files that couldn't be stored. Returns True if there were any.
+        """
+        failed = self.get_failed_files(step)
+        form_objs = [form_obj for form_obj in form_objs
+                     if isinstance(form_obj, (forms.BaseForm, formsets.BaseFormSet)) and form_obj.is_bound]
+        if form_objs:
+            for field_name in failed:
+                form_obj, name = self.get_file_field(form_objs, field_name)
+                error = self.get_failed_file_error(step, field_name)
+                if isinstance(form_obj, formsets.BaseFormSet):
+                    # a formset has no fields, the error is one of the formset
+                    form_obj.non_form_errors().append(error)
+                else:
+                    form_obj.add_error(name, error)
+        return bool(failed)
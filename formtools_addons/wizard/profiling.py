@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of wizard requests.
+
+Profiling is configured with the `FORMTOOLS_ADDONS_PROFILING` setting::
+
+    FORMTOOLS_ADDONS_PROFILING = {
+        # Where profiles are written (required)
+        'DIRECTORY': '/var/tmp/wizard-profiles',
+        # Profile a random sample of all wizard requests
+        'ENABLED': True,
+        'RATE': 0.01,
+        # Always profile requests that send this header with the value SECRET
+        'HEADER': 'X-Wizard-Profile',
+        'SECRET': 'change-me',
+        # 'auto' (pyinstrument if installed, else cProfile), 'cprofile' or 'pyinstrument'
+        'PROFILER': 'auto',
+    }
+
+Every profiled request writes a profile file and a `.json` file with the
+wizard context (class, step, number of steps, payload size, storage).
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import os
+import random
+import timeit
+import uuid
+from datetime import datetime
+
+import six
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import constant_time_compare
+
+try:
+    import cProfile as profile
+except ImportError:  # pragma: no cover
+    import profile
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger('formtools_addons.profiling')
+
+DEFAULT_PROFILING = {
+    'DIRECTORY': None,
+    'ENABLED': False,
+    'RATE': 1.0,
+    'HEADER': None,
+    'SECRET': None,
+    'PROFILER': 'auto',
+}
+
+
+def get_profiling_config():
+    """
+    Returns the profiling settings, or None if profiling isn't configured.
+    """
+    config = getattr(settings, 'FORMTOOLS_ADDONS_PROFILING', None)
+    if not config:
+        return None
+    result = dict(DEFAULT_PROFILING)
+    result.update(config)
+    if not result['DIRECTORY']:
+        raise ImproperlyConfigured('FORMTOOLS_ADDONS_PROFILING requires a DIRECTORY')
+    if result['HEADER'] and not result['SECRET']:
+        raise ImproperlyConfigured('The HEADER of FORMTOOLS_ADDONS_PROFILING requires a SECRET')
+    return result
+
+
+class CProfileProfiler(object):
+    name = 'cprofile'
+    extension = 'prof'
+
+    def __init__(self):
+        self.profiler = profile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path)
+
+
+class PyinstrumentProfiler(object):
+    """
+    Sampling profiler, has a lower overhead than cProfile.
+    """
+    name = 'pyinstrument'
+    extension = 'html'
+
+    def __init__(self):
+        self.profiler = pyinstrument.Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def save(self, path):
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(self.profiler.output_html())
+
+
+def get_profiler(name='auto'):
+    if name == 'auto':
+        name = 'pyinstrument' if pyinstrument is not None else 'cprofile'
+    if name == 'cprofile':
+        return CProfileProfiler()
+    if name == 'pyinstrument':
+        if pyinstrument is None:
+            raise ImproperlyConfigured('The pyinstrument profiler is not installed')
+        return PyinstrumentProfiler()
+    raise ImproperlyConfigured('Unknown profiler "%s"' % name)
+
+
+class ProfilingMixin(object):
+    """
+    Runs sampled wizard requests, or requests sending the configured header
+    with the configured secret, under a profiler and writes the profile to the configured directory.
+
+    Only use this in staging: profiling slows requests down considerably.
+    """
+    def should_profile(self, request, config):
+        header = config['HEADER']
+        if header:
+            value = request.META.get('HTTP_' + header.upper().replace('-', '_'))
+            if value and constant_time_compare(value, config['SECRET']):
+                return True
+        return bool(config['ENABLED']) and random.random() < config['RATE']
+
+    def dispatch(self, request, *args, **kwargs):
+        config = get_profiling_config()
+        if config is None or not self.should_profile(request, config):
+            return super(ProfilingMixin, self).dispatch(request, *args, **kwargs)
+
+        profiler = get_profiler(config['PROFILER'])
+        started = timeit.default_timer()
+        try:
+            profiler.start()
+        except ValueError:
+            # Another profiler is already active in this thread
+            logger.warning('Could not start the %s profiler', profiler.name, exc_info=True)
+            return super(ProfilingMixin, self).dispatch(request, *args, **kwargs)
+
+        try:
+            response = super(ProfilingMixin, self).dispatch(request, *args, **kwargs)
+        except Exception:
+            profiler.stop()
+            self.save_profile(config, profiler, request, None, timeit.default_timer() - started)
+            raise
+
+        def finish(response):
+            profiler.stop()
+            self.save_profile(config, profiler, request, response, timeit.default_timer() - started)
+
+        if getattr(response, 'is_rendered', True):
+            finish(response)
+        else:
+            # Include the rendering of template responses in the profile
+            response.add_post_render_callback(finish)
+        return response
+
+    def get_profile_context(self, request, response, duration):
+        steps = getattr(self, 'steps', None)
+        return {
+            'wizard': '%s.%s' % (self.__class__.__module__, self.__class__.__name__),
+            'method': request.method,
+            'path': request.path,
+            'step': self.kwargs.get('step'),
+            'current_step': steps.current if steps is not None else None,
+            'num_steps': steps.count if steps is not None else None,
+            'request_bytes': int(request.META.get('CONTENT_LENGTH') or 0),
+            'response_bytes': len(response.content) if response is not None and not response.streaming else None,
+            'status_code': response.status_code if response is not None else None,
+            'storage': self.storage_name,
+            'duration': duration,
+        }
+
+    def save_profile(self, config, profiler, request, response, duration):
+        directory = config['DIRECTORY']
+        name = '%s-%s-%s' % (datetime.now().strftime('%Y%m%d-%H%M%S'), self.__class__.__name__,
+                             uuid.uuid4().hex[:8])
+        context = self.get_profile_context(request, response, duration)
+        context['profiler'] = profiler.name
+        context['profile'] = '%s.%s' % (name, profiler.extension)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            profiler.save(os.path.join(directory, context['profile']))
+            with io.open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+                f.write(six.text_type(json.dumps(context, indent=2)))
+        except (IOError, OSError):
+            # Profiling should never break a request
+            logger.exception('Failed to write wizard profile to %s', directory)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+A faster drop-in for ``form.as_p()``.
+
+Django builds every row of ``as_p`` from scratch: CSS classes, label tag,
+label suffix and help text are formatted again for every form rendered. The
+markup around the widgets only depends on the form class and a few options
+(prefix, ``auto_id``, label suffix, language), so `render_as_p` compiles it
+once into a layout and only fills in the widgets and errors per form. The
+output is the same as ``as_p``.
+"""
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+import six
+from django import forms
+from django.utils.encoding import force_text
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language, ugettext as _
+
+from .cache import LRUCache
+
+NORMAL_ROW = '<p%(html_class_attr)s>%(label)s %(field)s%(help_text)s</p>'
+ERROR_ROW = '%s'
+ROW_ENDER = '</p>'
+HELP_TEXT_HTML = ' <span class="helptext">%s</span>'
+
+layout_cache = LRUCache(512)
+
+
+class FieldLayout(namedtuple('FieldLayout', 'name hidden row_start error_row_start row_end '
+                                            'html_class_attr error_html_class_attr')):
+    """
+    The static markup of a field's row, with and without errors.
+    """
+    __slots__ = ()
+
+
+def get_css_classes(form, field, has_errors):
+    # Same as BoundField.css_classes(), without looking up the errors
+    css_classes = set()
+    if has_errors and hasattr(form, 'error_css_class'):
+        css_classes.add(form.error_css_class)
+    if field.required and hasattr(form, 'required_css_class'):
+        css_classes.add(form.required_css_class)
+    return ' '.join(css_classes)
+
+
+def get_layout_key(form):
+    """
+    Returns the key of the layout of `form`, or None if it can't be compiled.
+    """
+    fields = []
+    for name, field in form.fields.items():
+        widget = field.widget
+        fields.append((name, field.label, field.help_text, field.required, field.label_suffix,
+                       widget.__class__, widget.is_hidden, widget.attrs.get('id')))
+    key = (form.__class__, form.prefix, form.auto_id, form.label_suffix,
+           getattr(form, 'error_css_class', None), getattr(form, 'required_css_class', None),
+           get_language(), tuple(fields))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def compile_layout(form):
+    """
+    Returns the `FieldLayout` of every field of `form`.
+    """
+    layout = []
+    for name, field in form.fields.items():
+        bf = form[name]
+        if bf.is_hidden:
+            layout.append(FieldLayout(name, True, None, None, None, '', ''))
+            continue
+
+        if bf.label:
+            label = force_text(bf.label_tag(conditional_escape(force_text(bf.label))) or '')
+        else:
+            label = ''
+        if field.help_text:
+            help_text = HELP_TEXT_HTML % force_text(field.help_text)
+        else:
+            help_text = ''
+
+        html_class_attrs = []
+        for has_errors in (False, True):
+            css_classes = get_css_classes(form, field, has_errors)
+            html_class_attrs.append(' class="%s"' % css_classes if css_classes else '')
+        row_starts = ['<p%s>%s ' % (html_class_attr, label) for html_class_attr in html_class_attrs]
+        layout.append(FieldLayout(name, False, row_starts[0], row_starts[1], help_text + ROW_ENDER,
+                                  html_class_attrs[0], html_class_attrs[1]))
+    return layout
+
+
+def uses_default_as_p(form):
+    return (six.get_unbound_function(form.__class__.as_p) is six.get_unbound_function(forms.BaseForm.as_p) and
+            six.get_unbound_function(form.__class__._html_output) is
+            six.get_unbound_function(forms.BaseForm._html_output))
+
+
+def get_layout(form):
+    key = get_layout_key(form)
+    if key is None:
+        return compile_layout(form)
+    layout = layout_cache.get(key)
+    if layout is None:
+        layout = compile_layout(form)
+        layout_cache.set(key, layout)
+    return layout
+
+
+def render_as_p(form):
+    """
+    Returns the same HTML as ``form.as_p()``. Forms overriding ``as_p`` (or
+    ``_html_output``) and objects that aren't forms are rendered with their
+    own ``as_p``.
+    """
+    if not isinstance(form, forms.BaseForm) or not uses_default_as_p(form):
+        return form.as_p()
+
+    top_errors = form.non_field_errors()
+    errors = form.errors
+    output, hidden_fields = [], []
+    html_class_attr = ''
+
+    for entry in get_layout(form):
+        bf = form[entry.name]
+        bf_errors = form.error_class([conditional_escape(error)
+                                      for error in errors.get(entry.name, form.error_class())])
+        if entry.hidden:
+            html_class_attr = ''
+            if bf_errors:
+                top_errors.extend(
+                    [_('(Hidden field %(name)s) %(error)s') % {'name': entry.name, 'error': force_text(e)}
+                     for e in bf_errors])
+            hidden_fields.append(six.text_type(bf))
+        elif bf_errors:
+            html_class_attr = entry.error_html_class_attr
+            output.append(ERROR_ROW % force_text(bf_errors))
+            output.append(entry.error_row_start + six.text_type(bf) + entry.row_end)
+        else:
+            html_class_attr = entry.html_class_attr
+            output.append(entry.row_start + six.text_type(bf) + entry.row_end)
+
+    if top_errors:
+        output.insert(0, ERROR_ROW % force_text(top_errors))
+
+    if hidden_fields:
+        str_hidden = ''.join(hidden_fields)
+        if output:
+            last_row = output[-1]
+            if not last_row.endswith(ROW_ENDER):
+                last_row = NORMAL_ROW % {'label': '', 'field': '', 'help_text': '',
+                                         'html_class_attr': html_class_attr}
+                output.append(last_row)
+            output[-1] = last_row[:-len(ROW_ENDER)] + str_hidden + ROW_ENDER
+        else:
+            output.append(str_hidden)
+    return mark_safe('\n'.join(output))
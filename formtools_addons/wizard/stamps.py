@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Validation stamps let a wizard skip revalidating steps when it's committed.
+
+When a step is validated and stored, the view records a stamp: an HMAC over
+the stored step data, the form classes (and their `validation_version`) and a
+random nonce of the wizard run. The cleaned data of the step is kept in a cache
+under that stamp. When the wizard is committed, steps whose stamp still
+matches the stored data get their cleaned data restored from the cache instead
+of being validated again.
+
+Only plain forms are stamped. Model forms (which update their instance while
+validating), formsets and forms with `validation_time_dependent = True` are
+always revalidated.
+"""
+from __future__ import unicode_literals
+
+import json
+import pickle
+import uuid
+
+from django import forms
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.utils import ErrorDict
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+STAMPS_KEY = 'validation_stamps'
+NONCE_KEY = 'validation_stamp_nonce'
+
+
+class ValidationStampMixin(object):
+    """
+    * `validation_stamps` - enables validation stamps
+    * `validation_stamp_cache` - name of the cache holding the cleaned data
+    * `validation_stamp_timeout` - seconds the cleaned data is cached
+    """
+    validation_stamps = False
+    validation_stamp_cache = 'default'
+    validation_stamp_timeout = 3600
+
+    def is_stampable_form(self, form):
+        return (isinstance(form, forms.BaseForm) and
+                not isinstance(form, forms.BaseModelForm) and
+                not getattr(form, 'validation_time_dependent', False))
+
+    def get_validation_stamp(self, step, form_classes):
+        """
+        Returns the stamp of the currently stored data of `step`, or None if
+        the step can't be stamped.
+        """
+        data = self.storage.data
+        step_data = data[self.storage.step_data_key].get(step)
+        if step_data is None or data[self.storage.step_files_key].get(step):
+            return None
+
+        nonce = data.get(NONCE_KEY)
+        if nonce is None:
+            nonce = data[NONCE_KEY] = uuid.uuid4().hex
+
+        versions = ['%s.%s:%s' % (form_class.__module__, form_class.__name__,
+                                  getattr(form_class, 'validation_version', ''))
+                    for form_class in form_classes]
+        value = json.dumps([nonce, step, versions, step_data], sort_keys=True, cls=DjangoJSONEncoder)
+        return salted_hmac('formtools_addons.wizard.stamps', value).hexdigest()
+
+    def get_validation_stamp_cache_key(self, stamp):
+        return 'formtools_addons.validation_stamp.%s' % stamp
+
+    def stamp_step(self, step, form_objs):
+        """
+        Records a validation stamp for the stored data of `step`, validated by
+        `form_objs`. Call this after the step has been stored.
+        """
+        if not self.validation_stamps:
+            return
+
+        stamps = self.storage.data.setdefault(STAMPS_KEY, {})
+        stamps.pop(step, None)
+        if not all(self.is_stampable_form(form_obj) for form_obj in form_objs):
+            return
+
+        stamp = self.get_validation_stamp(step, [form_obj.__class__ for form_obj in form_objs])
+        if stamp is None:
+            return
+
+        cleaned_data = [form_obj.cleaned_data for form_obj in form_objs]
+        try:
+            caches[self.validation_stamp_cache].set(self.get_validation_stamp_cache_key(stamp), cleaned_data,
+                                                    self.validation_stamp_timeout)
+        except (pickle.PicklingError, TypeError):
+            # The cleaned data can't be cached, the step will be revalidated
+            return
+        stamps[step] = stamp
+
+    def restore_stamped_forms(self, step, form_objs):
+        """
+        Restores the cleaned data of the (bound, not yet validated) `form_objs`
+        of `step` if the step has a matching validation stamp. Returns False if
+        the forms need to be validated.
+        """
+        if not self.validation_stamps:
+            return False
+
+        stored_stamp = self.storage.data.get(STAMPS_KEY, {}).get(step)
+        if stored_stamp is None or not all(self.is_stampable_form(form_obj) for form_obj in form_objs):
+            return False
+
+        stamp = self.get_validation_stamp(step, [form_obj.__class__ for form_obj in form_objs])
+        if stamp is None or not constant_time_compare(stamp, stored_stamp):
+            return False
+
+        cleaned_data = caches[self.validation_stamp_cache].get(self.get_validation_stamp_cache_key(stamp))
+        self.record_cache_lookup('validation_stamp', cleaned_data is not None)
+        if cleaned_data is None or len(cleaned_data) != len(form_objs):
+            return False
+
+        for form_obj, form_cleaned_data in zip(form_objs, cleaned_data):
+            form_obj.cleaned_data = form_cleaned_data
+            form_obj._errors = ErrorDict()
+        return True
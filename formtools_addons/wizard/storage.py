@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Wizard storage backends keeping track of their files, see
+`formtools_addons.wizard.files`.
+
+The manifest storages list the files of the wizard state in a manifest, so
+the files of abandoned wizards can be deleted by `FileSweeper` (the
+``sweep_wizard_files`` command). The chunk directories of unfinished uploads
+(see `formtools_addons.wizard.uploads`) are listed too, as ``<directory>/``.
+
+The content addressed storages also store uploads once per content. The wizard
+state counts its references to every blob (one per step field holding the
+file). Resubmitting a step with the same file only updates these counts, the
+file isn't written again.
+
+The background storages hand the files of a submitted step to a
+`FileCopyExecutor`, see `formtools_addons.wizard.persistence`. Until a copy is
+done the file is pending: it's listed under its task in the state instead of
+the step files.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import posixpath
+import time
+import uuid
+
+import six
+from django.core.files.uploadedfile import UploadedFile
+from formtools.wizard.storage.cookie import CookieStorage
+from formtools.wizard.storage.exceptions import NoFileStorageConfigured
+from formtools.wizard.storage.session import SessionStorage
+
+from six.moves import queue
+
+from .files import BlobStore, FileManifest, get_content_digest
+from .persistence import FileCopyTask, get_file_executor, get_status_name, read_task_status, stage_file
+from .uploads import UPLOADS_KEY
+
+FILE_REFS_KEY = 'file_refs'
+FILE_OWNER_KEY = 'file_owner'
+FILE_MANIFEST_KEY = 'file_manifest'
+PENDING_FILES_KEY = 'pending_files'
+FAILED_FILES_KEY = 'failed_files'
+
+
+class ManifestStorageMixin(object):
+    """
+    * `manifest_location` - directory of the manifests in the wizard's
+      `file_storage`
+    * `manifest_interval` - seconds per manifest bucket, an active wizard
+      rewrites its manifest at most once per interval unless its files change
+    * `file_location` - directory of the step files in the wizard's
+      `file_storage`, `FileSweeper` only deletes files below it
+    """
+    manifest_location = 'wizard_manifests'
+    manifest_interval = 3600
+    file_location = 'wizard_files'
+
+    def __init__(self, *args, **kwargs):
+        super(ManifestStorageMixin, self).__init__(*args, **kwargs)
+        # (bucket, owner) of the manifests of reset wizard states
+        self._stale_manifests = []
+
+    def get_file_manifest(self):
+        return FileManifest(self.file_storage, self.manifest_location, self.manifest_interval)
+
+    def get_file_owner(self):
+        owner = self.data.get(FILE_OWNER_KEY)
+        if owner is None:
+            owner = self.data[FILE_OWNER_KEY] = uuid.uuid4().hex
+        return owner
+
+    def get_file_names(self):
+        names = [file_dict['tmp_name']
+                 for step_files in six.itervalues(self.data[self.step_files_key])
+                 for file_dict in six.itervalues(step_files)]
+        names.extend(upload['location'] + '/' for upload in six.itervalues(self.data.get(UPLOADS_KEY, {})))
+        return sorted(names)
+
+    def set_step_files(self, step, files):
+        if files and not self.file_storage:
+            raise NoFileStorageConfigured(
+                "You need to define 'file_storage' in your "
+                "wizard view in order to handle file uploads.")
+
+        step_files = self.data[self.step_files_key].setdefault(step, {})
+        for field, field_file in six.iteritems(files or {}):
+            step_files[field] = {
+                'tmp_name': self.file_storage.save(posixpath.join(self.file_location, field_file.name), field_file),
+                'name': field_file.name,
+                'content_type': field_file.content_type,
+                'size': field_file.size,
+                'charset': field_file.charset,
+            }
+
+    def reset(self):
+        recorded = self.data.get(FILE_MANIFEST_KEY)
+        if recorded:
+            self._stale_manifests.append((recorded[0], self.data[FILE_OWNER_KEY]))
+        # The chunks of unfinished uploads aren't listed anymore once the
+        # manifest is deleted
+        for upload in six.itervalues(self.data.get(UPLOADS_KEY, {})):
+            try:
+                directories, chunks = self.file_storage.listdir(upload['location'])
+            except (OSError, IOError):
+                continue
+            self._tmp_files.extend(posixpath.join(upload['location'], chunk) for chunk in chunks)
+        super(ManifestStorageMixin, self).reset()
+
+    def update_manifest(self):
+        """
+        Writes the manifest of the wizard state if its files changed or its
+        bucket expired, or deletes it if the state has no files.
+        """
+        if not self.file_storage:
+            return
+        manifest = self.get_file_manifest()
+        for bucket, owner in self._stale_manifests:
+            manifest.delete(bucket, owner)
+        self._stale_manifests = []
+
+        names = self.get_file_names()
+        recorded = self.data.get(FILE_MANIFEST_KEY)
+        if not names:
+            if recorded:
+                manifest.delete(recorded[0], self.data[FILE_OWNER_KEY])
+                del self.data[FILE_MANIFEST_KEY]
+            return
+
+        bucket = manifest.get_bucket()
+        checksum = hashlib.sha1('\n'.join(names).encode('utf-8')).hexdigest()
+        if recorded == [bucket, checksum]:
+            return
+        owner = self.get_file_owner()
+        manifest.write(bucket, owner, names)
+        if recorded and recorded[0] != bucket:
+            manifest.delete(recorded[0], owner)
+        self.data[FILE_MANIFEST_KEY] = [bucket, checksum]
+
+    def update_response(self, response):
+        # Before the data is saved (e.g. in a cookie)
+        self.update_manifest()
+        super(ManifestStorageMixin, self).update_response(response)
+
+
+class ContentAddressedStorageMixin(ManifestStorageMixin):
+    """
+    * `blob_location` - directory of the blobs in the wizard's `file_storage`
+    """
+    blob_location = 'wizard_blobs'
+
+    def __init__(self, *args, **kwargs):
+        super(ContentAddressedStorageMixin, self).__init__(*args, **kwargs)
+        # (digest, owner) of the references to release after the response
+        self._released_refs = []
+
+    def get_blob_store(self):
+        return BlobStore(self.file_storage, self.blob_location)
+
+    def add_file_ref(self, field_file):
+        """
+        Stores `field_file` if this wizard doesn't reference its content yet,
+        and returns the name of its blob.
+        """
+        blob_store = self.get_blob_store()
+        owner = self.get_file_owner()
+        digest = get_content_digest(field_file)
+        refs = self.data.setdefault(FILE_REFS_KEY, {})
+        if (digest, owner) in self._released_refs:
+            # Released earlier in this request, the blob is still stored
+            self._released_refs.remove((digest, owner))
+        elif not refs.get(digest):
+            blob_store.add(field_file, owner)
+        refs[digest] = refs.get(digest, 0) + 1
+        return blob_store.get_blob_name(digest)
+
+    def release_file(self, file_dict):
+        """
+        Removes the reference of this wizard to a stored file, once it isn't
+        used by the response.
+        """
+        digest = self.get_blob_store().get_digest(file_dict['tmp_name'])
+        if digest is None:
+            # Stored before the storage was content addressed
+            self._tmp_files.append(file_dict['tmp_name'])
+            return
+
+        refs = self.data.get(FILE_REFS_KEY, {})
+        count = refs.get(digest, 0) - 1
+        if count > 0:
+            refs[digest] = count
+            return
+        refs.pop(digest, None)
+        owner = self.data.get(FILE_OWNER_KEY)
+        if owner is not None:
+            self._released_refs.append((digest, owner))
+
+    def set_step_files(self, step, files):
+        if files and not self.file_storage:
+            raise NoFileStorageConfigured(
+                "You need to define 'file_storage' in your "
+                "wizard view in order to handle file uploads.")
+
+        step_files = self.data[self.step_files_key].setdefault(step, {})
+        for field, field_file in six.iteritems(files or {}):
+            # The new reference is added before the replaced file is
+            # released, so resubmitting the same file doesn't touch storage
+            tmp_name = self.add_file_ref(field_file)
+            if field in step_files:
+                self.release_file(step_files[field])
+            step_files[field] = {
+                'tmp_name': tmp_name,
+                'name': field_file.name,
+                'content_type': field_file.content_type,
+                'size': field_file.size,
+                'charset': field_file.charset,
+            }
+
+    def reset(self):
+        for step_files in six.itervalues(self.data[self.step_files_key]):
+            for file_dict in six.itervalues(step_files):
+                self.release_file(file_dict)
+        self.data[self.step_files_key] = {}
+        super(ContentAddressedStorageMixin, self).reset()
+
+    def update_response(self, response):
+        super(ContentAddressedStorageMixin, self).update_response(response)
+
+        def post_render_callback(response):
+            blob_store = self.get_blob_store()
+            for digest, owner in self._released_refs:
+                blob_store.release(digest, owner)
+            self._released_refs = []
+
+        if hasattr(response, 'render'):
+            response.add_post_render_callback(post_render_callback)
+        else:
+            post_render_callback(response)
+
+
+class BackgroundFileStorageMixin(object):
+    """
+    * `file_status_location` - directory of the status files of the copies
+      in the wizard's `file_storage`
+    * `file_submit_timeout` - seconds to wait for a free slot in the queue of
+      the executor, before the file is copied in the request
+    * `file_poll_interval` - seconds between checks for the status file of a
+      copy started by another process
+    """
+    file_status_location = 'wizard_file_status'
+    file_submit_timeout = 1
+    file_poll_interval = 0.1
+    sleep = staticmethod(time.sleep)
+
+    def __init__(self, *args, **kwargs):
+        super(BackgroundFileStorageMixin, self).__init__(*args, **kwargs)
+        # Pending files are resolved once per request, see get_step_files()
+        self._pending_resolved = False
+        # Ids of the tasks whose status was collected, forgotten (and their
+        # status files deleted) once the state is saved
+        self._collected_tasks = []
+
+    def get_file_executor(self):
+        return get_file_executor()
+
+    def submit_file(self, field_file):
+        """
+        Stages `field_file` and queues its copy. Returns the task, or None if
+        the queue of the executor is full.
+        """
+        task = FileCopyTask(self.file_storage, field_file.name, stage_file(field_file), self.file_status_location)
+        try:
+            return self.get_file_executor().submit(task, timeout=self.file_submit_timeout)
+        except queue.Full:
+            os.unlink(task.staged_path)
+            return None
+
+    def discard_file(self, step, field):
+        """
+        Removes the stored, pending or failed file of `field` of `step`.
+        """
+        stored = self.data[self.step_files_key].get(step, {}).pop(field, None)
+        if stored is not None:
+            self._tmp_files.append(stored['tmp_name'])
+        self.data.get(PENDING_FILES_KEY, {}).get(step, {}).pop(field, None)
+        failed = self.data.get(FAILED_FILES_KEY, {}).get(step)
+        if failed and field in failed:
+            failed.remove(field)
+
+    def set_step_files(self, step, files):
+        if files and not self.file_storage:
+            raise NoFileStorageConfigured(
+                "You need to define 'file_storage' in your "
+                "wizard view in order to handle file uploads.")
+
+        copied_files = {}
+        for field, field_file in six.iteritems(files or {}):
+            self.discard_file(step, field)
+            task = self.submit_file(field_file)
+            if task is None:
+                # Backpressure, the copy is made in the request
+                copied_files[field] = field_file
+                continue
+            self.data.setdefault(PENDING_FILES_KEY, {}).setdefault(step, {})[field] = {
+                'task': task.task_id,
+                'name': field_file.name,
+                'content_type': field_file.content_type,
+                'size': field_file.size,
+                'charset': field_file.charset,
+            }
+        super(BackgroundFileStorageMixin, self).set_step_files(step, copied_files)
+
+    def get_task_status(self, task_id, timeout=0):
+        """
+        Returns the status of the copy `task_id`, or None if it isn't done
+        within `timeout` seconds.
+        """
+        executor = self.get_file_executor()
+        status_name = get_status_name(self.file_status_location, task_id)
+        task = executor.get_task(task_id)
+        if task is not None:
+            if not task.done.wait(timeout):
+                return None
+            status = task.get_status()
+        else:
+            # Started by another process
+            deadline = time.time() + timeout
+            status = read_task_status(self.file_storage, status_name)
+            while status is None and time.time() < deadline:
+                self.sleep(self.file_poll_interval)
+                status = read_task_status(self.file_storage, status_name)
+            if status is None:
+                return None
+        self._collected_tasks.append(task_id)
+        return status
+
+    def resolve_pending_files(self, timeout=0):
+        """
+        Moves the pending files whose copy is done to the step files, or to
+        the failed files if it failed. Waits at most `timeout` seconds in
+        total.
+        """
+        pending = self.data.get(PENDING_FILES_KEY)
+        if not pending:
+            return
+        deadline = time.time() + timeout
+        for step, fields in list(pending.items()):
+            for field, pending_file in list(fields.items()):
+                status = self.get_task_status(pending_file['task'], max(deadline - time.time(), 0))
+                if status is None:
+                    continue
+                del fields[field]
+                if status['error'] is None:
+                    file_dict = dict(pending_file, tmp_name=status['name'])
+                    del file_dict['task']
+                    self.data[self.step_files_key].setdefault(step, {})[field] = file_dict
+                else:
+                    self.data.setdefault(FAILED_FILES_KEY, {}).setdefault(step, []).append(field)
+            if not fields:
+                del pending[step]
+        if not pending:
+            del self.data[PENDING_FILES_KEY]
+
+    def wait_for_files(self, timeout):
+        """
+        Waits at most `timeout` seconds for the pending files, the files that
+        aren't stored by then are failed.
+        """
+        self.resolve_pending_files(timeout)
+        for step, fields in six.iteritems(self.data.pop(PENDING_FILES_KEY, {})):
+            for field, pending_file in six.iteritems(fields):
+                self.discard_task(pending_file['task'])
+                self.data.setdefault(FAILED_FILES_KEY, {}).setdefault(step, []).append(field)
+
+    def discard_task(self, task_id):
+        """
+        Deletes the file copied by `task_id`, now or once the copy is done.
+        Copies of other processes that aren't done yet are left behind.
+        """
+        status = self.get_task_status(task_id)
+        if status is not None:
+            if status['name']:
+                self._tmp_files.append(status['name'])
+            return
+        task = self.get_file_executor().get_task(task_id)
+        if task is not None:
+            task.discard()
+
+    def get_failed_files(self, step):
+        return self.data.get(FAILED_FILES_KEY, {}).get(step, [])
+
+    def get_pending_files(self, step):
+        """
+        Returns the pending files of `step` staged by this process.
+        """
+        files = {}
+        executor = self.get_file_executor()
+        for field, pending_file in six.iteritems(self.data.get(PENDING_FILES_KEY, {}).get(step, {})):
+            task = executor.get_task(pending_file['task'])
+            if task is None:
+                continue
+            if (step, field) not in self._files:
+                try:
+                    staged = open(task.staged_path, 'rb')
+                except (OSError, IOError):
+                    # Copied and deleted meanwhile
+                    continue
+                file_dict = dict(pending_file)
+                del file_dict['task']
+                self._files[(step, field)] = UploadedFile(file=staged, **file_dict)
+            files[field] = self._files[(step, field)]
+        return files
+
+    def get_step_files(self, step):
+        if not self._pending_resolved:
+            self._pending_resolved = True
+            self.resolve_pending_files()
+        files = super(BackgroundFileStorageMixin, self).get_step_files(step) or {}
+        files.update(self.get_pending_files(step))
+        return files or None
+
+    def reset(self):
+        for fields in six.itervalues(self.data.get(PENDING_FILES_KEY, {})):
+            for pending_file in six.itervalues(fields):
+                self.discard_task(pending_file['task'])
+        super(BackgroundFileStorageMixin, self).reset()
+
+    def update_response(self, response):
+        super(BackgroundFileStorageMixin, self).update_response(response)
+        # The statuses are only dropped with the state that holds their
+        # files, a request failing before this leaves them to the next one
+        executor = self.get_file_executor()
+        for task_id in self._collected_tasks:
+            executor.forget(task_id)
+            self.file_storage.delete(get_status_name(self.file_status_location, task_id))
+        self._collected_tasks = []
+
+
+class ManifestSessionStorage(ManifestStorageMixin, SessionStorage):
+    pass
+
+
+class ManifestCookieStorage(ManifestStorageMixin, CookieStorage):
+    pass
+
+
+class ContentAddressedSessionStorage(ContentAddressedStorageMixin, SessionStorage):
+    pass
+
+
+class ContentAddressedCookieStorage(ContentAddressedStorageMixin, CookieStorage):
+    pass
+
+
+class BackgroundSessionStorage(BackgroundFileStorageMixin, SessionStorage):
+    pass
+
+
+class BackgroundCookieStorage(BackgroundFileStorageMixin, CookieStorage):
+    pass
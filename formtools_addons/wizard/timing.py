@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import timeit
+from collections import OrderedDict
+
+_timing_callbacks = []
+
+
+def register_timing_callback(callback):
+    """
+    Registers `callback` to be called after every timed wizard request with
+    the view instance and an ordered dict of `{phase: seconds}`.
+
+    Registering a callback enables phase timing for all wizard views.
+    """
+    if callback not in _timing_callbacks:
+        _timing_callbacks.append(callback)
+
+
+def unregister_timing_callback(callback):
+    if callback in _timing_callbacks:
+        _timing_callbacks.remove(callback)
+
+
+class _NullPhase(object):
+    """
+    Context manager used when timing is disabled, it does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        # Only the outermost phase of a given name is timed, so a phase that
+        # re-enters itself (e.g. a condition evaluating conditions) is not
+        # counted twice.
+        depth = self.timer.depth.get(self.name, 0)
+        self.timer.depth[self.name] = depth + 1
+        if depth == 0:
+            self.start = self.timer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.depth[self.name] -= 1
+        if self.start is not None:
+            self.timer.add(self.name, self.timer.clock() - self.start)
+        return False
+
+
+class PhaseTimer(object):
+    """
+    Sums the time spent per phase during a single request.
+    """
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.depth = {}
+        self.started = self.clock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def get_timings(self):
+        timings = OrderedDict(self.timings)
+        timings['total'] = self.clock() - self.started
+        return timings
+
+
+def format_server_timing(timings):
+    """
+    Returns the value of a `Server-Timing` header for `timings`.
+    """
+    return ', '.join('%s;dur=%.3f' % (name, duration * 1000)
+                     for name, duration in timings.items())
+
+
+class PhaseTimingMixin(object):
+    """
+    Times the phases of a wizard request: storage load and save, form
+    construction (`forms`), validation (`is_valid`), condition evaluation
+    (`conditions`) and rendering. The views add more specific phases where
+    they apply (`render_form`, `render_preview`, `json`, `render`).
+
+    Phases can be nested, e.g. the `conditions` phase includes the validation
+    done by condition callables.
+
+    Timing is enabled by setting `server_timing = True`, which adds a
+    `Server-Timing` header to the response, or by registering a callback
+    with `register_timing_callback`. When disabled, the overhead is a
+    no-op context manager per phase.
+    """
+    server_timing = False
+    phase_timer = None
+
+    def is_phase_timing_enabled(self):
+        return self.server_timing or bool(_timing_callbacks)
+
+    def time_phase(self, name):
+        if self.phase_timer is None:
+            return NULL_PHASE
+        return self.phase_timer.phase(name)
+
+    def instrument_form(self, form):
+        """
+        Times the validation of `form` as the `is_valid` phase.
+        """
+        if self.phase_timer is None:
+            return form
+
+        full_clean = form.full_clean
+
+        def timed_full_clean():
+            with self.time_phase('is_valid'):
+                full_clean()
+        form.full_clean = timed_full_clean
+        return form
+
+    def dispatch(self, request, *args, **kwargs):
+        self.phase_timer = PhaseTimer() if self.is_phase_timing_enabled() else None
+        response = super(PhaseTimingMixin, self).dispatch(request, *args, **kwargs)
+        if self.phase_timer is not None:
+            self.finish_phase_timing(response)
+        return response
+
+    def get_prefix(self, request, *args, **kwargs):
+        prefix = super(PhaseTimingMixin, self).get_prefix(request, *args, **kwargs)
+        # `WizardView.dispatch` loads the storage right after getting the
+        # prefix, the phase ends when the storage is set
+        if self.phase_timer is not None:
+            self._storage_load_phase = self.time_phase('storage_load')
+            self._storage_load_phase.__enter__()
+        return prefix
+
+    def _get_storage(self):
+        try:
+            return self.__dict__['storage']
+        except KeyError:
+            raise AttributeError('storage')
+
+    def _set_storage(self, storage):
+        storage_load_phase = self.__dict__.pop('_storage_load_phase', None)
+        if storage_load_phase is not None:
+            storage_load_phase.__exit__(None, None, None)
+
+        if self.phase_timer is not None:
+            update_response = storage.update_response
+
+            def timed_update_response(response):
+                with self.time_phase('storage_save'):
+                    update_response(response)
+            storage.update_response = timed_update_response
+        self.__dict__['storage'] = storage
+
+    storage = property(_get_storage, _set_storage)
+
+    def finish_phase_timing(self, response):
+        timer = self.phase_timer
+
+        def report(response):
+            timings = timer.get_timings()
+            if self.server_timing:
+                response['Server-Timing'] = format_server_timing(timings)
+            for callback in list(_timing_callbacks):
+                callback(self, timings)
+
+        if getattr(response, 'is_rendered', True):
+            report(response)
+            return
+
+        # Template responses are rendered after the view returns, so the
+        # timings are reported once rendering is done.
+        render_phase = timer.phase('render')
+        render_phase.__enter__()
+
+        def post_render_callback(response):
+            render_phase.__exit__(None, None, None)
+            report(response)
+        response.add_post_render_callback(post_render_callback)
+
+    def get_form_list(self):
+        with self.time_phase('conditions'):
+            return super(PhaseTimingMixin, self).get_form_list()
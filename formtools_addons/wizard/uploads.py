@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked, resumable uploads for the file fields of `WizardAPIView`.
+
+An upload is sent as a sequence of raw chunks (``POST upload/<step>/``), each
+saved as a file of its own in the wizard's `file_storage`
+(``<location>/<upload_id>/<offset>``), as storages can't append to files. The
+offset and the chunks of every upload are kept in the wizard state, so an
+interrupted upload is resumed from the last stored chunk. A chunk stored
+without its state being saved is overwritten when it's sent again.
+
+The manifest storages (see `formtools_addons.wizard.storage`) list the chunk
+directories of unfinished uploads in their manifest, so the chunks of
+abandoned uploads are deleted by the `FileSweeper`. Finalizing an upload
+(``POST finalize/<step>/``) assembles the chunks into a single file
+(``<location>/<upload_id>/file/<name>``, only the base name sent by the client
+is used), checks its checksum and binds it to the file field of the step: it's
+used for the field when the step is submitted without a file for it. Uploads
+are limited to `upload_max_size` bytes (100 MB by default).
+
+Chunks and assembled files are checked with SHA-256 checksums (hex digests,
+in the ``checksum`` query parameter).
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import posixpath
+import uuid
+
+from django import forms
+from django.core.files.base import File
+from django.utils.crypto import constant_time_compare
+from django.utils.datastructures import MultiValueDict
+
+UPLOADS_KEY = 'chunked_uploads'
+UPLOADED_FILES_KEY = 'chunked_files'
+
+
+class HashingReader(object):
+    """
+    Reads from `stream`, counting and hashing the data read.
+    """
+    def __init__(self, stream, limit=None):
+        self.stream = stream
+        self.limit = limit
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        if self.limit is not None:
+            remaining = self.limit - self.size
+            size = remaining if size is None or size < 0 else min(size, remaining)
+            if size <= 0:
+                return b''
+        data = self.stream.read(size)
+        self.hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+class ConcatenatedReader(HashingReader):
+    """
+    Reads the files `names` of `file_storage` one after the other.
+    """
+    def __init__(self, file_storage, names):
+        super(ConcatenatedReader, self).__init__(None)
+        self.file_storage = file_storage
+        self.names = list(names)
+
+    def read(self, size=-1):
+        while self.names or self.stream is not None:
+            if self.stream is None:
+                self.stream = self.file_storage.open(self.names.pop(0))
+            data = super(ConcatenatedReader, self).read(size)
+            if data:
+                return data
+            self.close()
+        return b''
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class ChunkedUploadMixin(object):
+    """
+    * `upload_location` - directory of the chunks in the wizard's
+      `file_storage`
+    * `upload_max_size` - maximum size of an uploaded file (None for no limit)
+    * `upload_chunk_max_size` - maximum size of a chunk
+    """
+    upload_location = 'wizard_uploads'
+    upload_max_size = 100 * 1024 * 1024
+    upload_chunk_max_size = 8 * 1024 * 1024
+
+    def get_upload_field(self, step, field_name):
+        """
+        Returns the file field `field_name` of the form of `step`, or None.
+        """
+        form_class = self.form_list.get(step)
+        field = getattr(form_class, 'base_fields', {}).get(field_name)
+        return field if isinstance(field, forms.FileField) else None
+
+    def get_chunk_name(self, upload_id, offset):
+        # Zero padded, so the names sort by offset
+        return posixpath.join(self.upload_location, upload_id, '%016d' % offset)
+
+    def get_upload_name(self, name, field_name):
+        """
+        Returns the file name of an upload sent as `name` by the client,
+        without directories.
+        """
+        name = self.file_storage.get_valid_name(posixpath.basename((name or '').replace('\\', '/')))
+        if not name.strip('.'):
+            name = self.file_storage.get_valid_name(field_name)
+        return name
+
+    def get_upload(self, step):
+        """
+        Returns the (upload_id, upload) of the upload of the request, or an
+        error response.
+        """
+        upload_id = self.request.GET.get('upload_id')
+        upload = self.storage.data.get(UPLOADS_KEY, {}).get(upload_id)
+        if upload is None or upload['step'] != step:
+            return None, self.render_response_error('unknown upload', status_code=404)
+        return upload_id, upload
+
+    def render_upload(self, upload_id, upload, status_code=200):
+        return self.render_response({'upload_id': upload_id, 'offset': upload['offset']}, status_code=status_code)
+
+    def start_upload(self, step):
+        field_name = self.request.GET.get('field')
+        if not getattr(self, 'file_storage', None) or self.get_upload_field(step, field_name) is None:
+            return None, self.render_response_error('unknown file field', status_code=400)
+
+        upload_id = uuid.uuid4().hex
+        upload = {
+            'step': step,
+            'field': field_name,
+            'name': self.get_upload_name(self.request.GET.get('name'), field_name),
+            'content_type': self.request.GET.get('content_type') or 'application/octet-stream',
+            'location': posixpath.join(self.upload_location, upload_id),
+            'offset': 0,
+            'chunks': [],
+        }
+        self.storage.data.setdefault(UPLOADS_KEY, {})[upload_id] = upload
+        return upload_id, upload
+
+    def get_upload_status(self, step):
+        upload_id, upload = self.get_upload(step)
+        if upload_id is None:
+            return upload
+        return self.render_upload(upload_id, upload)
+
+    def upload_chunk(self, step):
+        """
+        Stores the body of the request as the next chunk of an upload.
+        Without an `upload_id` parameter a new upload of the `field`
+        parameter is started.
+
+        Responds with the `upload_id` and `offset` of the upload, with status
+        409 if the `offset` parameter isn't the offset of the upload.
+        """
+        if self.request.GET.get('upload_id'):
+            upload_id, upload = self.get_upload(step)
+        else:
+            upload_id, upload = self.start_upload(step)
+        if upload_id is None:
+            return upload
+
+        try:
+            offset = int(self.request.GET.get('offset', 0))
+            content_length = int(self.request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return self.render_response_error('invalid offset', status_code=400)
+        if offset != upload['offset']:
+            # e.g. a chunk that was stored, but its response was lost
+            return self.render_upload(upload_id, upload, status_code=409)
+        if content_length > self.upload_chunk_max_size or (
+                self.upload_max_size is not None and offset + content_length > self.upload_max_size):
+            return self.render_response_error('too large', status_code=413)
+
+        name = self.get_chunk_name(upload_id, offset)
+        if self.file_storage.exists(name):
+            # Stored by a request whose state was lost
+            self.file_storage.delete(name)
+        reader = HashingReader(self.request, limit=content_length)
+        saved_name = self.file_storage.save(name, File(reader, name=name))
+        checksum = self.request.GET.get('checksum')
+        if (saved_name != name or reader.size != content_length or
+                (checksum and not constant_time_compare(checksum.lower(), reader.hexdigest()))):
+            self.file_storage.delete(saved_name)
+            return self.render_response_error('invalid chunk', status_code=400, offset=upload['offset'])
+
+        upload['offset'] += reader.size
+        upload['chunks'].append(offset)
+        return self.render_upload(upload_id, upload)
+
+    def get_chunk_names(self, upload_id):
+        """
+        Returns the names of all stored chunks of `upload_id`, including the
+        chunks of requests whose state was lost.
+        """
+        chunk_dir = posixpath.join(self.upload_location, upload_id)
+        try:
+            directories, chunks = self.file_storage.listdir(chunk_dir)
+        except (OSError, IOError):
+            return []
+        return [posixpath.join(chunk_dir, chunk) for chunk in sorted(chunks)]
+
+    def delete_chunks(self, upload_id):
+        for name in self.get_chunk_names(upload_id):
+            self.file_storage.delete(name)
+
+    def finalize_upload(self, step):
+        """
+        Assembles the chunks of an upload, and binds the file to its field if
+        it matches the `checksum` parameter.
+        """
+        upload_id, upload = self.get_upload(step)
+        if upload_id is None:
+            return upload
+
+        reader = ConcatenatedReader(self.file_storage,
+                                    [self.get_chunk_name(upload_id, offset) for offset in upload['chunks']])
+        assembled = File(reader, name=upload['name'])
+        assembled.size = upload['offset']
+        try:
+            # Next to the chunks, never where the client's name points to
+            tmp_name = self.file_storage.save(posixpath.join(upload['location'], 'file', upload['name']), assembled)
+        finally:
+            reader.close()
+        checksum = self.request.GET.get('checksum', '')
+        if reader.size != upload['offset'] or not constant_time_compare(checksum.lower(), reader.hexdigest()):
+            self.file_storage.delete(tmp_name)
+            return self.render_response_error('checksum mismatch', status_code=400, offset=upload['offset'])
+
+        self.delete_chunks(upload_id)
+        del self.storage.data[UPLOADS_KEY][upload_id]
+        self.bind_uploaded_file(step, upload['field'], {
+            'tmp_name': tmp_name,
+            'name': upload['name'],
+            'content_type': upload['content_type'],
+            'size': reader.size,
+            'charset': None,
+        })
+        return self.render_response({'upload_id': upload_id, 'size': reader.size, 'checksum': reader.hexdigest()})
+
+    def bind_uploaded_file(self, step, field_name, file_dict):
+        """
+        Stores the assembled file as file of `field_name` of `step`, which is
+        used until the step is submitted with another file for the field.
+        """
+        step_files = self.storage.data[self.storage.step_files_key].setdefault(step, {})
+        replaced = step_files.get(field_name)
+        if replaced is not None:
+            self.storage._tmp_files.append(replaced['tmp_name'])
+        step_files[field_name] = file_dict
+        uploaded_files = self.storage.data.setdefault(UPLOADED_FILES_KEY, {}).setdefault(step, [])
+        if field_name not in uploaded_files:
+            uploaded_files.append(field_name)
+
+    def get_uploaded_files(self, step):
+        """
+        Returns the files of `step` that were uploaded in chunks.
+        """
+        field_names = self.storage.data.get(UPLOADED_FILES_KEY, {}).get(step)
+        if not field_names:
+            return {}
+        stored_files = self.storage.get_step_files(step) or {}
+        return dict((field_name, stored_files[field_name])
+                    for field_name in field_names if field_name in stored_files)
+
+    def get_post_files(self, step):
+        """
+        Returns the files of the request, with the files uploaded in chunks
+        for the fields without a file.
+        """
+        uploaded_files = self.get_uploaded_files(step)
+        if not uploaded_files:
+            return self.request.FILES
+        files = MultiValueDict()
+        for field_name, field_file in uploaded_files.items():
+            files[field_name] = field_file
+        for field_name, field_files in self.request.FILES.lists():
+            files.setlist(field_name, field_files)
+        return files
+
+    def get_files_to_store(self, step, files):
+        """
+        Returns `files` without the files uploaded in chunks, which are stored
+        already. Fields submitted with another file aren't bound anymore.
+        """
+        uploaded = self.storage.data.get(UPLOADED_FILES_KEY, {}).get(step)
+        if not uploaded:
+            return files
+        for field_name in list(uploaded):
+            if field_name in self.request.FILES:
+                uploaded.remove(field_name)
+        return dict((field_name, field_file) for field_name, field_file in files.items()
+                    if field_name not in uploaded)
@@ -1,23 +1,71 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import six
-from collections import OrderedDict
+import json
+import hashlib
+from collections import OrderedDict, namedtuple
 
 from django import forms
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ValidationError
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
 from django.forms import formsets
 from django.shortcuts import redirect
+from django.utils.cache import patch_vary_headers
+from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 
 from formtools.wizard.storage.exceptions import NoFileStorageConfigured
 from formtools.wizard.views import ManagementForm, WizardView as BaseWizardView
 
+from formtools_addons.metrics import WizardMetricsMixin
+from formtools_addons.wizard.cache import get_class_cache
+from formtools_addons.wizard.persistence import PendingFilesMixin
+from formtools_addons.wizard.profiling import ProfilingMixin
+from formtools_addons.wizard.stamps import ValidationStampMixin
+from formtools_addons.wizard.timing import PhaseTimingMixin
 
-class MultipleFormWizardView(BaseWizardView):
+
+class FormListVariant(namedtuple('FormListVariant', ['key', 'form_list'])):
+    """
+    Can be returned by a form list factory to cache the computed form list by
+    `key` (e.g. a tenant or variant id). `form_list` is a form list or a
+    callable returning one, which is only called when `key` isn't cached.
+    """
+    __slots__ = ()
+
+
+class FormPlan(namedtuple('FormPlan', ['form_struct', 'multiple', 'needs_instance', 'entries'])):
+    """
+    How the forms of a step are constructed, computed once per step by
+    `MultipleFormWizardView.compute_form_plan`. `entries` is a tuple of
+    `FormPlanEntry`.
+    """
+    __slots__ = ()
+
+
+class FormPlanEntry(namedtuple('FormPlanEntry', ['name', 'form_class', 'prefix', 'instance_kwarg'])):
+    """
+    A single form of a step. `prefix` is None if it's computed per request,
+    `instance_kwarg` is 'instance', 'queryset' or None.
+    """
+    __slots__ = ()
+
+
+class MultipleFormWizardView(ProfilingMixin, WizardMetricsMixin, PhaseTimingMixin, ValidationStampMixin,
+                             PendingFilesMixin, BaseWizardView):
     template_name = 'formtools_addons/wizard/wizard_form.html'
+    fragment_template_name = 'formtools_addons/wizard/wizard_forms.html'
+    fragment_header = 'X-Wizard-Fragment'
+    fragment_param = 'fragment'
     cleaned_data_in_context = False
+    compiled_renderer = False
+    cleaned_data_cache = None
+    cleaned_data_cache_timeout = 300
+    form_list_cache_size = 128
     _form_list_factory = None
+    _form_plans = None
 
     @classmethod
     def get_initkwargs(cls, form_list=None, initial_dict=None,
@@ -64,6 +112,7 @@ class MultipleFormWizardView(BaseWizardView):
 
         # build the kwargs for the wizardview instances
         kwargs['form_list'] = cls.compute_form_list(form_list, *args, **kwargs)
+        kwargs['_form_plans'] = cls.compute_form_plans(kwargs['form_list'])
         return kwargs
 
     @classmethod
@@ -120,14 +169,109 @@ class MultipleFormWizardView(BaseWizardView):
 
         return computed_form_list
 
+    @classmethod
+    def compute_form_plans(cls, computed_form_list):
+        """
+        Returns a `FormPlan` per step of a computed form list.
+        """
+        return dict((step, cls.compute_form_plan(step, form_struct))
+                    for step, form_struct in six.iteritems(computed_form_list))
+
+    @classmethod
+    def compute_form_plan(cls, step, form_struct):
+        """
+        Determines how the forms of `step` are constructed, so `get_forms`
+        doesn't need to inspect the form classes on every call.
+        """
+        # Prefixes can only be computed in advance if get_form_prefix isn't overridden
+        static_prefix = (six.get_unbound_function(cls.get_form_prefix) is
+                         six.get_unbound_function(MultipleFormWizardView.get_form_prefix))
+
+        entries = []
+        if isinstance(form_struct, dict):
+            for form_name, form_class in form_struct.items():
+                if issubclass(form_class, (forms.ModelForm, forms.models.BaseInlineFormSet)):
+                    # If the form is based on ModelForm or InlineFormSet,
+                    # add instance if available and not previously set.
+                    instance_kwarg = 'instance'
+                elif issubclass(form_class, forms.models.BaseModelFormSet):
+                    # If the form is based on ModelFormSet, add queryset if available
+                    # and not previous set.
+                    instance_kwarg = 'queryset'
+                else:
+                    instance_kwarg = None
+                prefix = str('%s-%s' % (step, form_name)) if static_prefix else None
+                entries.append(FormPlanEntry(form_name, form_class, prefix, instance_kwarg))
+        elif issubclass(form_struct, (forms.ModelForm, forms.models.BaseInlineFormSet)):
+            entries.append(FormPlanEntry(None, form_struct, str(step) if static_prefix else None, 'instance'))
+        elif issubclass(form_struct, (forms.Form, forms.BaseFormSet)):
+            entries.append(FormPlanEntry(None, form_struct, str(step) if static_prefix else None, None))
+        elif issubclass(form_struct, forms.models.BaseModelFormSet):
+            entries.append(FormPlanEntry(None, form_struct, str(step) if static_prefix else None, 'queryset'))
+
+        multiple = isinstance(form_struct, dict)
+        needs_instance = multiple or any(entry.instance_kwarg for entry in entries)
+        return FormPlan(form_struct, multiple, needs_instance, tuple(entries))
+
+    def get_form_plan(self, step):
+        """
+        Returns the `FormPlan` of `step`, computed along with the form list.
+        """
+        form_struct = self.form_list[step]
+        plan = self._form_plans.get(step) if self._form_plans else None
+        if plan is None or plan.form_struct is not form_struct:
+            # The form list was changed after it was computed
+            plan = self.compute_form_plan(step, form_struct)
+        return plan
 
     def render(self, forms=None, **kwargs):
         """
-        Returns a ``HttpResponse`` containing all needed context data.
+        Returns a ``HttpResponse`` containing all needed context data, or
+        only the forms of the step for fragment requests.
         """
         forms = forms or self.get_forms()
-        context = self.get_context_data(forms=forms, **kwargs)
-        return self.render_to_response(context)
+        self.incr_metric('steps.rendered')
+        if self.is_fragment_request():
+            response = self.response_class(
+                request=self.request,
+                template=[self.fragment_template_name],
+                context=self.get_fragment_context_data(forms=forms, **kwargs),
+                using=self.template_engine,
+            )
+        else:
+            context = self.get_context_data(forms=forms, **kwargs)
+            response = self.render_to_response(context)
+        if self.fragment_header:
+            patch_vary_headers(response, [self.fragment_header])
+        return response
+
+    def is_fragment_request(self):
+        """
+        Returns True if only the forms of the step should be rendered: when the
+        request has the `fragment_header` header or `fragment_param` query
+        parameter.
+        """
+        if self.fragment_header and self.request.META.get(
+                'HTTP_' + self.fragment_header.upper().replace('-', '_')):
+            return True
+        return bool(self.fragment_param and self.request.GET.get(self.fragment_param))
+
+    def get_fragment_context_data(self, forms, **kwargs):
+        """
+        Returns the context for `fragment_template_name`, which only contains
+        the forms, steps and management form (no extra data or cleaned data).
+        """
+        context = kwargs
+        context['view'] = self
+        context['wizard'] = {
+            'forms': forms,
+            'steps': self.steps,
+            'management_form': ManagementForm(prefix=self.prefix, initial={
+                'current_step': self.steps.current,
+            }),
+            'compiled_renderer': self.compiled_renderer,
+        }
+        return context
 
     def render_next_step(self, form, **kwargs):
         """
@@ -164,14 +308,20 @@ class MultipleFormWizardView(BaseWizardView):
         If everything is fine call `done`.
         """
         final_forms = OrderedDict()
+        # files still being stored in the background are needed now
+        self.wait_for_files()
         # walk through the form list and try to validate the data again.
         for form_key in self.get_form_list():
             form_objs = self.get_forms(step=form_key,
                 data=self.storage.get_step_data(form_key),
                 files=self.storage.get_step_files(form_key))
             final_forms[form_key] = []
+            if self.add_file_errors(form_key, form_objs):
+                return self.render_revalidation_failure(form_key, form_objs[0], **kwargs)
+            # steps with a matching validation stamp don't need to be validated again
+            stamped = self.restore_stamped_forms(form_key, form_objs)
             for form_obj in form_objs:
-                if not form_obj.is_valid():
+                if not stamped and not form_obj.is_valid():
                     return self.render_revalidation_failure(form_key, form_obj, **kwargs)
                 final_forms[form_key].append(form_obj)
 
@@ -203,6 +353,7 @@ class MultipleFormWizardView(BaseWizardView):
         # same data twice.
         done_response = self.done(form_list=form_list, form_dict=result_forms_dict, **kwargs)
         self.storage.reset()
+        self.incr_metric('commits')
         return done_response
     
     def get_form_prefix(self, step=None, form=None):
@@ -217,7 +368,7 @@ class MultipleFormWizardView(BaseWizardView):
         Also appends form key to the form prefix, so django can render different management_forms
         """
         # appends form key to form prefix
-        if isinstance(form, str):
+        if isinstance(form, six.string_types):
             step = step + "-" + form
         else:
             step = super(MultipleFormWizardView, self).get_form_prefix(step, form)
@@ -283,6 +434,7 @@ class MultipleFormWizardView(BaseWizardView):
             # if the form is valid, store the cleaned data and files.
             self.storage.set_step_data(self.steps.current, self.process_step(form))
             self.storage.set_step_files(self.steps.current, self.process_step_files(form))
+            self.stamp_step(self.steps.current, forms)
 
             # check if the current step is the last step
             if self.steps.current == self.steps.last:
@@ -303,74 +455,43 @@ class MultipleFormWizardView(BaseWizardView):
         new form. If needed, instance or queryset (for `ModelForm` or
         `ModelFormSet`) will be added too.
         """
-        if step is None:
-            step = self.steps.current
-        form_struct = self.form_list[step]
-        # prepare the kwargs for the form instance.
+        with self.time_phase('forms'):
+            if step is None:
+                step = self.steps.current
+            plan = self.get_form_plan(step)
+
+            # prepare the kwargs for the form instances, shared by all forms of the step.
+            base_kwargs = self.get_form_kwargs(step)
+            initial = self.get_form_initial(step)
+            instance = self.get_form_instance(step) if plan.needs_instance else None
 
-        form_collection = []
-        if isinstance(form_struct, dict):
-            initial_dict = self.get_form_initial(step)
-            instance_dict = self.get_form_instance(step)
             form_collection = []
-            for form_name, form_class in form_struct.items():
-                initial = initial_dict.get(form_name, None) if initial_dict else None
-                instance = instance_dict.get(form_name, None) if instance_dict else None
-                kwargs = self.get_form_kwargs(step)
+            for entry in plan.entries:
+                if plan.multiple:
+                    form_initial = initial.get(entry.name, None) if initial else None
+                    form_instance = instance.get(entry.name, None) if instance else None
+                else:
+                    form_initial = initial
+                    form_instance = instance
+
+                prefix = entry.prefix
+                if prefix is None:
+                    prefix = self.get_form_prefix(step, entry.name if plan.multiple else entry.form_class)
+
+                kwargs = dict(base_kwargs)
                 kwargs.update({
                     'data': data,
                     'files': files,
-                    'prefix': self.get_form_prefix(step, form_name),
-                    'initial': initial
+                    'prefix': prefix,
+                    'initial': form_initial
                 })
-                if issubclass(form_class, (forms.ModelForm, forms.models.BaseInlineFormSet)):
-                    # If the form is based on ModelForm or InlineFormSet,
-                    # add instance if available and not previously set.
-                    kwargs.setdefault('instance', instance)
-                elif issubclass(form_class, forms.models.BaseModelFormSet):
-                    # If the form is based on ModelFormSet, add queryset if available
-                    # and not previous set.
-                    kwargs.setdefault('queryset', instance)
-                form = form_class(**kwargs)
-                form._tag = form_name
+                if entry.instance_kwarg is not None:
+                    kwargs.setdefault(entry.instance_kwarg, form_instance)
+                form = entry.form_class(**kwargs)
+                if plan.multiple:
+                    form._tag = entry.name
                 form_collection.append(form)
-        elif issubclass(form_struct, (forms.ModelForm, forms.models.BaseInlineFormSet)):
-            # If the form is based on ModelForm or InlineFormSet,
-            # add instance if available and not previously set.
-            form_class = form_struct
-            kwargs = self.get_form_kwargs(step)
-            kwargs.update({
-                'data': data,
-                'files': files,
-                'prefix': self.get_form_prefix(step, form_class),
-                'initial': self.get_form_initial(step)
-            })
-            kwargs.setdefault('instance', self.get_form_instance(step))
-            form_collection = [form_class(**kwargs)]
-        elif issubclass(form_struct, (forms.Form, forms.BaseFormSet)):
-            form_class = form_struct
-            kwargs = self.get_form_kwargs(step)
-            kwargs.update({
-                'data': data,
-                'files': files,
-                'prefix': self.get_form_prefix(step, form_class),
-                'initial': self.get_form_initial(step)
-            })
-            form_collection = [form_class(**kwargs)]
-        elif issubclass(form_struct, forms.models.BaseModelFormSet):
-            # If the form is based on ModelFormSet, add queryset if available
-            # and not previous set.
-            form_class = form_struct
-            kwargs = self.get_form_kwargs(step)
-            kwargs.update({
-                'data': data,
-                'files': files,
-                'prefix': self.get_form_prefix(step, form_class),
-                'initial': self.get_form_initial(step)
-            })
-            kwargs.setdefault('queryset', self.get_form_instance(step))
-            form_collection = [form_class(**kwargs)]
-        return form_collection
+        return [self.instrument_form(form) for form in form_collection]
 
     def get_context_data(self, forms, **kwargs):
         """
@@ -409,6 +530,7 @@ class MultipleFormWizardView(BaseWizardView):
             'management_form': ManagementForm(prefix=self.prefix, initial={
                 'current_step': self.steps.current,
             }),
+            'compiled_renderer': self.compiled_renderer,
         }
         return context
 
@@ -420,19 +542,15 @@ class MultipleFormWizardView(BaseWizardView):
         """
         cleaned_data = {}
         for form_key in self.get_form_list():
-            form_collection = self.get_forms(
-                step=form_key,
-                data=self.storage.get_step_data(form_key),
-                files=self.storage.get_step_files(form_key)
-            )
-            for form_obj in form_collection:
-                if form_obj.is_valid():
-                    if isinstance(form_obj.cleaned_data, (tuple, list)):
-                        cleaned_data.update({
-                            'formset-%s' % form_key: form_obj.cleaned_data
-                        })
-                    else:
-                        cleaned_data.update(form_obj.cleaned_data)
+            for form_name, form_data in self.get_step_cleaned_forms(form_key):
+                if form_data is None:
+                    continue
+                if isinstance(form_data, (tuple, list)):
+                    cleaned_data.update({
+                        'formset-%s' % form_key: [dict(data) for data in form_data]
+                    })
+                else:
+                    cleaned_data.update(form_data)
         return cleaned_data
 
     def get_cleaned_data_for_step(self, step):
@@ -443,29 +561,88 @@ class MultipleFormWizardView(BaseWizardView):
         """
         cleaned_data = {}
         if step in self.form_list:
+            multiple_forms = isinstance(self.form_list[step], dict)
+
+            for form_name, form_data in self.get_step_cleaned_forms(step):
+                if form_data is None:
+                    continue
+                if isinstance(form_data, (tuple, list)):
+                    form_key = step
+                    cleaned_data.update({
+                        'formset-%s' % form_key: [dict(data) for data in form_data]
+                    })
+                elif multiple_forms:
+                    cleaned_data[form_name] = dict(form_data)
+                else:
+                    cleaned_data.update(form_data)
+        return cleaned_data
+
+    def get_step_revision(self, step):
+        """
+        Returns the stored (raw) data and files of `step`. The storage replaces
+        these whenever the step is stored or the wizard is reset, so they
+        identify the revision of the step data.
+        """
+        data = self.storage.data
+        return (data[self.storage.step_data_key].get(step),
+                data[self.storage.step_files_key].get(step))
+
+    def get_step_cleaned_forms(self, step):
+        """
+        Returns a list of (`form_name`, `cleaned_data`) for the forms of `step`,
+        `cleaned_data` is None if the form isn't valid and `form_name` is None
+        for steps with a single form.
+
+        The result is memoized for the rest of the request until the stored
+        data of `step` changes, and, if `cleaned_data_cache` is set, cached
+        across requests in that cache.
+        """
+        revision = self.get_step_revision(step)
+        memo = self.__dict__.setdefault('_cleaned_data_memo', {})
+        memoized = memo.get(step)
+        if memoized is not None and memoized[0][0] is revision[0] and memoized[0][1] is revision[1]:
+            self.record_cache_lookup('cleaned_data', True)
+            return memoized[1]
+        self.record_cache_lookup('cleaned_data', False)
+
+        cache_key = self.get_cleaned_data_cache_key(step, revision)
+        cleaned_forms = None
+        if cache_key is not None:
+            cleaned_forms = caches[self.cleaned_data_cache].get(cache_key)
+            self.record_cache_lookup('cleaned_data_shared', cleaned_forms is not None)
+
+        if cleaned_forms is None:
+            plan = self.get_form_plan(step)
             form_collection = self.get_forms(
                 step=step,
                 data=self.storage.get_step_data(step),
                 files=self.storage.get_step_files(step))
+            cleaned_forms = [(entry.name, form_obj.cleaned_data if form_obj.is_valid() else None)
+                             for entry, form_obj in zip(plan.entries, form_collection)]
+            if cache_key is not None:
+                caches[self.cleaned_data_cache].set(cache_key, cleaned_forms, self.cleaned_data_cache_timeout)
 
-            multiple_forms = isinstance(self.form_list[step], dict)
+        memo[step] = (revision, cleaned_forms)
+        return cleaned_forms
 
-            if multiple_forms:
-                multiple_form_keys = list(self.form_list[step].keys())
-
-            for i, form_obj in enumerate(form_collection):
-                if form_obj.is_valid():
-                    form_data = form_obj.cleaned_data
-                    if isinstance(form_data, (tuple, list)):
-                        form_key = step
-                        cleaned_data.update({
-                            'formset-%s' % form_key: form_data
-                        })
-                    elif multiple_forms and multiple_form_keys:
-                        cleaned_data[multiple_form_keys[i]] = form_data
-                    else:
-                        cleaned_data.update(form_data)
-        return cleaned_data
+    def get_cleaned_data_cache_key(self, step, revision):
+        """
+        Returns the key of the cleaned data of `step` in `cleaned_data_cache`,
+        a digest of the stored step data and the form classes. Steps with
+        files aren't cached.
+
+        Only enable the cache if the cleaned data only depends on the
+        submitted data (and not e.g. on the current user or time).
+        """
+        data, files = revision
+        if self.cleaned_data_cache is None or data is None or files:
+            return None
+        form_classes = ['%s.%s' % (entry.form_class.__module__, entry.form_class.__name__)
+                        for entry in self.get_form_plan(step).entries]
+        payload = json.dumps([step, form_classes, data], sort_keys=True, cls=DjangoJSONEncoder)
+        return 'formtools_addons.cleaned_data.%s.%s.%s' % (
+            self.__class__.__module__, self.__class__.__name__,
+            hashlib.sha1(payload.encode('utf-8')).hexdigest())
 
     def get_all_cleaned_data_dict(self):
         """
@@ -505,18 +682,50 @@ class MultipleFormWizardView(BaseWizardView):
         # Make sure we retrieved a factory function
         assert factory_fnc is not None
 
-        # Call form_list_factory method on object, which should return a conventional form_list structure
+        # Call form_list_factory method on object, which should return a conventional form_list structure,
+        # or a FormListVariant to cache the computed form list
         form_list = factory_fnc(self)
 
-        # Compute the internal form list from that
-        computed_form_list = self.__class__.compute_form_list(form_list=form_list)
+        if isinstance(form_list, FormListVariant):
+            computed_form_list, form_plans = self.get_cached_form_list(form_list)
+        else:
+            # Compute the internal form list from that
+            computed_form_list = self.__class__.compute_form_list(form_list=form_list)
+            form_plans = self.__class__.compute_form_plans(computed_form_list)
 
         # Overwrite the form_list on 'self'
         self.form_list = computed_form_list
+        self._form_plans = form_plans
 
         # Make sure we won't repeat ourselves
         self._form_list_initialized = True
 
+    @classmethod
+    def get_form_list_cache(cls):
+        """
+        Returns the cache of computed form lists of this class, holding at most
+        `form_list_cache_size` variants.
+        """
+        return get_class_cache(cls, '_form_list_cache', cls.form_list_cache_size)
+
+    def get_cached_form_list(self, variant):
+        """
+        Returns the computed form list and form plans for a `FormListVariant`,
+        computing them only once per variant key. The computed form list is
+        shared between requests and shouldn't be modified.
+        """
+        cache = self.get_form_list_cache()
+        cached = cache.get(variant.key)
+        self.record_cache_lookup('form_list', cached is not None)
+        if cached is None:
+            form_list = variant.form_list
+            if callable(form_list):
+                form_list = form_list()
+            computed_form_list = self.__class__.compute_form_list(form_list=form_list)
+            cached = (computed_form_list, self.__class__.compute_form_plans(computed_form_list))
+            cache.set(variant.key, cached)
+        return cached
+
 
 class SessionMultipleFormWizardView(MultipleFormWizardView):
     """
@@ -538,6 +747,8 @@ class NamedUrlMultipleFormWizardView(MultipleFormWizardView):
     """
     url_name = None
     done_step_name = None
+    step_url_cache_size = 1024
+    redirect_free = False
 
     @classmethod
     def get_initkwargs(cls, *args, **kwargs):
@@ -561,9 +772,29 @@ class NamedUrlMultipleFormWizardView(MultipleFormWizardView):
         return initkwargs
 
     def get_step_url(self, step):
-        kwargs = self.kwargs
-        kwargs.update({'step': step})
-        return reverse(self.url_name, kwargs=kwargs)
+        """
+        Returns the URL of `step`. URLs are reversed once per step, URL
+        configuration, language (for `i18n_patterns`) and non-step URL
+        kwargs, and then cached per class.
+        """
+        url_kwargs = tuple(sorted((key, value) for key, value in six.iteritems(self.kwargs) if key != 'step'))
+        cache_key = (get_urlconf(), get_script_prefix(), translation.get_language(), self.url_name, url_kwargs,
+                     step)
+        cache = get_class_cache(self.__class__, '_step_url_cache', self.step_url_cache_size)
+        try:
+            url = cache.get(cache_key)
+        except TypeError:
+            # unhashable URL kwargs
+            cache_key = url = None
+        self.record_cache_lookup('step_url', url is not None)
+
+        if url is None:
+            kwargs = dict(url_kwargs)
+            kwargs['step'] = step
+            url = reverse(self.url_name, kwargs=kwargs)
+            if cache_key is not None:
+                cache.set(cache_key, url)
+        return url
 
     def get(self, *args, **kwargs):
         """
@@ -633,12 +864,30 @@ class NamedUrlMultipleFormWizardView(MultipleFormWizardView):
         context['wizard']['url_name'] = self.url_name
         return context
 
+    def render_step_in_place(self, step):
+        """
+        Renders `step` in the response to the current request instead of
+        redirecting to it (if `redirect_free` is set). The step's URL is set
+        as `Content-Location` header, so clients can update the browser's URL
+        (e.g. with `history.pushState`).
+        """
+        self.storage.current_step = step
+        response = self.render(self.get_forms(
+            step=step,
+            data=self.storage.get_step_data(step),
+            files=self.storage.get_step_files(step),
+        ))
+        response['Content-Location'] = self.get_step_url(step)
+        return response
+
     def render_next_step(self, form, **kwargs):
         """
         When using the NamedUrlWizardView, we have to redirect to update the
         browser's URL to match the shown step.
         """
         next_step = self.get_next_step()
+        if self.redirect_free:
+            return self.render_step_in_place(next_step)
         self.storage.current_step = next_step
         return redirect(self.get_step_url(next_step))
 
@@ -647,6 +896,8 @@ class NamedUrlMultipleFormWizardView(MultipleFormWizardView):
         This method gets called when the current step has to be changed.
         `goto_step` contains the requested step to go to.
         """
+        if self.redirect_free:
+            return self.render_step_in_place(goto_step)
         self.storage.current_step = goto_step
         return redirect(self.get_step_url(goto_step))
 
@@ -655,17 +906,26 @@ class NamedUrlMultipleFormWizardView(MultipleFormWizardView):
         When a step fails, we have to redirect the user to the first failing
         step.
         """
+        if self.redirect_free:
+            return self.render_step_in_place(failed_step)
         self.storage.current_step = failed_step
         return redirect(self.get_step_url(failed_step))
 
     def render_done(self, form, **kwargs):
         """
         When rendering the done view, we have to redirect first (if the URL
-        name doesn't fit).
+        name doesn't fit), unless `redirect_free` is set.
         """
-        if kwargs.get('step', None) != self.done_step_name:
+        if kwargs.get('step', None) == self.done_step_name:
+            return super(NamedUrlMultipleFormWizardView, self).render_done(form, **kwargs)
+        if not self.redirect_free:
             return redirect(self.get_step_url(self.done_step_name))
-        return super(NamedUrlMultipleFormWizardView, self).render_done(form, **kwargs)
+
+        kwargs['step'] = self.done_step_name
+        response = super(NamedUrlMultipleFormWizardView, self).render_done(form, **kwargs)
+        if not response.has_header('Location') and not response.has_header('Content-Location'):
+            response['Content-Location'] = self.get_step_url(self.done_step_name)
+        return response
 
 
 class NamedUrlSessionMultipleFormWizardView(NamedUrlMultipleFormWizardView):
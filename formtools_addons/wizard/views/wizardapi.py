@@ -8,19 +8,42 @@ import logging
 from collections import OrderedDict
 
 import six
-from django.core.serializers.json import DjangoJSONEncoder as JsonEncoder
+from django.core.files.base import File
+from django.core.serializers.json import DjangoJSONEncoder
 from django.forms import forms, formsets
 from django.http.response import JsonResponse
 from django.shortcuts import redirect
+from django.utils.cache import patch_vary_headers
 from formtools.wizard.storage.exceptions import NoFileStorageConfigured
 from formtools.wizard.views import NamedUrlWizardView
 
 from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.metrics import WizardMetricsMixin
+from formtools_addons.wizard.downloads import StepFileDownloadMixin
+from formtools_addons.wizard.errorlog import ValidationErrorLogger
+from formtools_addons.wizard.persistence import PendingFilesMixin
+from formtools_addons.wizard.profiling import ProfilingMixin
+from formtools_addons.wizard.rendering import render_as_p
+from formtools_addons.wizard.stamps import ValidationStampMixin
+from formtools_addons.wizard.timing import PhaseTimingMixin
+from formtools_addons.wizard.uploads import ChunkedUploadMixin
 
 logger = logging.getLogger('formtools_addons.wizard.wizardapi')
+validation_error_logger = ValidationErrorLogger(logger)
 
 
-class WizardAPIView(NamedUrlWizardView):
+class JsonEncoder(DjangoJSONEncoder):
+    """
+    Encodes files (e.g. in the cleaned data of file fields) as their name.
+    """
+    def default(self, o):
+        if isinstance(o, File):
+            return o.name
+        return super(JsonEncoder, self).default(o)
+
+
+class WizardAPIView(ProfilingMixin, WizardMetricsMixin, PhaseTimingMixin, ValidationStampMixin, ChunkedUploadMixin,
+                    StepFileDownloadMixin, PendingFilesMixin, NamedUrlWizardView):
     FORCE_JSON_REQUESTS = True
 
     data_step_name = None
@@ -29,9 +52,18 @@ class WizardAPIView(NamedUrlWizardView):
     next_step_name = None
     new_step_name = None
     commit_step_name = None
+    upload_step_name = None
+    finalize_step_name = None
+    file_step_name = None
+    peek_step_name = None
+    sync_step_name = None
     substep_separator = None
     json_encoder_class = None
     _json_encoder = None
+    validation_error_logger = validation_error_logger
+    validation_log_level = logging.ERROR
+    compiled_renderer = False
+    step_versions_header = 'X-Wizard-Step-Versions'
 
     @classmethod
     def get_initkwargs(cls, form_list=None, initial_dict=None,
@@ -57,10 +89,18 @@ class WizardAPIView(NamedUrlWizardView):
           callables. If the value of for a specific `step_name` is callable it
           will be called with the wizardview instance as the only argument.
           If the return value is true, the step's form will be used.
-        * `json_encoder_class` - Subclass of 'json.JSONEncoder', used for serialization. Defaults to DjangoJSONEncoder
+        * `json_encoder_class` - Subclass of 'json.JSONEncoder', used for serialization. Defaults to a DjangoJSONEncoder
+          encoding files as their name
         * `data_step_name` - String to override 'data_step' url pathcomponent. Defaults to 'data'
         * `commit_step_name` - String to override 'commit_step' url pathcomponent. Defaults to 'commit'
+        * `upload_step_name` - String to enable the 'upload_step' url pathcomponent. Defaults to None (disabled)
+        * `finalize_step_name` - String to enable the 'finalize_step' url pathcomponent. Defaults to None (disabled)
+        * `file_step_name` - String to enable the 'file_step' url pathcomponent. Defaults to None (disabled)
+        * `peek_step_name` - String to enable the 'peek_step' url pathcomponent. Defaults to None (disabled)
+        * `sync_step_name` - String to enable the 'sync_step' url pathcomponent. Defaults to None (disabled)
         * `substep_separator` - String to override 'substep_separator'. Defaults to '|'
+
+        Step names can't be one of the enabled upload, finalize, file, peek or sync names.
         """
 
         kwargs.update({
@@ -77,6 +117,11 @@ class WizardAPIView(NamedUrlWizardView):
             'prev_step_name': kwargs.pop('prev_step_name', 'prev'),
             'next_step_name': kwargs.pop('next_step_name', 'next'),
             'commit_step_name': kwargs.pop('commit_step_name', 'commit'),
+            'upload_step_name': kwargs.pop('upload_step_name', getattr(cls, 'upload_step_name', None)),
+            'finalize_step_name': kwargs.pop('finalize_step_name', getattr(cls, 'finalize_step_name', None)),
+            'file_step_name': kwargs.pop('file_step_name', getattr(cls, 'file_step_name', None)),
+            'peek_step_name': kwargs.pop('peek_step_name', getattr(cls, 'peek_step_name', None)),
+            'sync_step_name': kwargs.pop('sync_step_name', getattr(cls, 'sync_step_name', None)),
             'substep_separator': kwargs.pop('substep_separator', '|'),
         })
 
@@ -116,6 +161,14 @@ class WizardAPIView(NamedUrlWizardView):
                 # if not, add the form with a zero based counter as unicode
                 computed_form_list[six.text_type(i)] = form
 
+        # the names of the enabled API views are matched before the step names
+        reserved_names = dict((kwargs[name], name) for name in (
+            'upload_step_name', 'finalize_step_name', 'file_step_name', 'peek_step_name', 'sync_step_name')
+            if kwargs[name] is not None)
+        for step_name in computed_form_list:
+            assert step_name not in reserved_names, \
+                'step name "%s" is reserved, see `%s`' % (step_name, reserved_names[step_name])
+
         # walk through the new created list of forms
         for form_struct in six.itervalues(computed_form_list):
             formset = []
@@ -149,6 +202,10 @@ class WizardAPIView(NamedUrlWizardView):
         """
         This renders the form or, if needed, does the http redirects.
         """
+        if self.file_step_name is not None and kwargs.get('step') == self.file_step_name:
+            # Stored files are also requested by the browser (e.g. previews)
+            return self.serve_step_file(kwargs.get('substep'))
+
         if self.FORCE_JSON_REQUESTS and not self.is_json_request(request):
             return self.get_failure_redirect_view(request, *args, **kwargs)
 
@@ -159,8 +216,16 @@ class WizardAPIView(NamedUrlWizardView):
             done = self.is_valid()
             return self.render_state(step=self.storage.current_step, done=done)
 
+        elif self.upload_step_name is not None and step_url == self.upload_step_name:
+            # Offset of a chunked upload, to resume it
+            return self.get_upload_status(kwargs.pop('substep', None))
+
+        elif self.peek_step_name is not None and step_url == self.peek_step_name:
+            # Data of a single step, e.g. to prefetch the next step
+            return self.render_peek(kwargs.pop('substep', None))
+
         elif step_url not in self.steps.all:
-            return JsonResponse('Not found: {0}'.format(step_url), status=404)
+            return self.render_response_error('Not found: {0}'.format(step_url), status_code=404)
 
         # is the url step name not equal to the step in the storage?
         # if yes, change the step in the storage (if name exists)
@@ -195,6 +260,13 @@ class WizardAPIView(NamedUrlWizardView):
                 return self.render_response_error('unknown step', status_code=400)
             self.storage.current_step = goto_step
             return self.render_state(step=self.storage.current_step)
+        elif self.sync_step_name is not None and step == self.sync_step_name:
+            # Move to a step the client shows already, without rendering the state
+            sync_step = kwargs.pop('substep', None)
+            if sync_step not in self.steps.all:
+                return self.render_response_error('unknown step', status_code=400)
+            self.storage.current_step = sync_step
+            return self.render_response({'current_step': sync_step})
         elif step == self.prev_step_name:
             # Go to previous step
             self.storage.current_step = self.get_prev_step()
@@ -203,6 +275,12 @@ class WizardAPIView(NamedUrlWizardView):
             # Go to next step
             self.storage.current_step = self.get_next_step()
             return self.render_state(step=self.storage.current_step)
+        elif self.upload_step_name is not None and step == self.upload_step_name:
+            # Store a chunk of a file
+            return self.upload_chunk(kwargs.pop('substep', None))
+        elif self.finalize_step_name is not None and step == self.finalize_step_name:
+            # Bind a file uploaded in chunks to its field
+            return self.finalize_upload(kwargs.pop('substep', None))
 
         if step not in self.steps.all:
            return self.render_response_error('Missing required parameter "step"')
@@ -212,7 +290,7 @@ class WizardAPIView(NamedUrlWizardView):
 
         # Store data
         form_data = self.request.POST
-        form_files = self.request.FILES
+        form_files = self.get_post_files(step)
 
         # get the form for the current step
         form = self.get_form(data=form_data, files=form_files)
@@ -223,7 +301,8 @@ class WizardAPIView(NamedUrlWizardView):
             self.storage.set_step_data(self.steps.current,
                                        self.process_step(form))
             self.storage.set_step_files(self.steps.current,
-                                        self.process_step_files(form))
+                                        self.get_files_to_store(step, self.process_step_files(form)))
+            self.stamp_step(self.steps.current, [form])
 
             # proceed to the next step, since the input was valid
             done = step == self.steps.last
@@ -232,13 +311,24 @@ class WizardAPIView(NamedUrlWizardView):
             return self.render_state(step=goto_step, done=done)
 
         # Log errors
-        for field, errors in form.errors.items():
-            for error in errors:
-                logger.error('field error: "{0}": "{1}"'.format(field, error))
+        self.log_validation_errors(step, form)
 
         # Return current step_data, since the data was invalid
         return self.render_state(step=step, form=form, form_data=form_data, form_files=form_files, status_code=400)
 
+    def dispatch(self, request, *args, **kwargs):
+        # Log a summary that is due even if this request has no errors, so
+        # that a burst of errors followed by valid requests is reported too
+        self.validation_error_logger.flush_due(self.validation_log_level)
+        return super(WizardAPIView, self).dispatch(request, *args, **kwargs)
+
+    def log_validation_errors(self, step, form):
+        """
+        Logs the errors of an invalid step, rate limited and aggregated by
+        `validation_error_logger`, at `validation_log_level`.
+        """
+        self.validation_error_logger.log(self.validation_log_level, self.__class__.__name__, step, form.errors)
+
     def get_failure_redirect_view(self, request, *args, **kwargs):
         return redirect('/')
 
@@ -246,6 +336,11 @@ class WizardAPIView(NamedUrlWizardView):
         # Not using prefixes
         return ''
 
+    def get_form(self, step=None, data=None, files=None):
+        with self.time_phase('forms'):
+            form = super(WizardAPIView, self).get_form(step=step, data=data, files=files)
+        return self.instrument_form(form)
+
     def get_current_step(self, step=None):
         return step or self.storage.current_step
 
@@ -260,12 +355,17 @@ class WizardAPIView(NamedUrlWizardView):
         If everything is fine call `done`.
         """
         final_forms = OrderedDict()
+        # files still being stored in the background are needed now
+        self.wait_for_files()
         # walk through the form list and try to validate the data again.
         for form_key in self.get_form_list():
             form_obj = self.get_form(step=form_key,
                                      data=self.storage.get_step_data(form_key),
                                      files=self.storage.get_step_files(form_key))
-            if not form_obj.is_valid():
+            if self.add_file_errors(form_key, [form_obj]):
+                return self.render_state(step=form_key, status_code=400)
+            # steps with a matching validation stamp don't need to be validated again
+            if not self.restore_stamped_forms(form_key, [form_obj]) and not form_obj.is_valid():
                 # Not all forms all valid: Fail Fast!
                 return self.render_state(step=form_key, status_code=400)
             else:
@@ -276,9 +376,12 @@ class WizardAPIView(NamedUrlWizardView):
         # same data twice.
         response = self.done(final_forms.values(), form_dict=final_forms, step=None)
         self.storage.reset()
+        self.incr_metric('commits')
         return response
 
     def render_form(self, step, form):
+        if self.compiled_renderer:
+            return render_as_p(form)
         return form.as_p()
 
     def render_preview(self, step, form):
@@ -297,6 +400,7 @@ class WizardAPIView(NamedUrlWizardView):
             'done': done,
             'valid': valid,
             'structure': self.get_structure(),
+            'navigation': self.get_navigation(),
             'steps': {}
         }
 
@@ -314,16 +418,86 @@ class WizardAPIView(NamedUrlWizardView):
         # Allow for manipulating state data before returning
         data = self.clean_state_data(data)
 
-        return JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
+        # After clean_state_data(), which may use the HTML of every step
+        client_versions = self.get_client_step_versions()
+        for step_data in six.itervalues(data['steps']):
+            self.omit_cached_html(client_versions, step_data)
+
+        with self.time_phase('json'):
+            response = JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
+        if self.step_versions_header:
+            patch_vary_headers(response, [self.step_versions_header])
+        self.observe_metric('state.bytes', len(response.content))
+        return response
+
+    def render_peek(self, step=None):
+        """
+        Renders the data of `step` (by default the step after the current
+        step) only, without changing the current step.
+        """
+        if step is None:
+            step = self.get_next_step()
+            if step is None:
+                return self.render_response_error('no next step', status_code=404)
+        elif step not in self.get_form_list():
+            return self.render_response_error('unknown step', status_code=404)
+
+        data = {
+            'step': step,
+            'current_step': self.steps.current,
+            'data': self.omit_cached_html(self.get_client_step_versions(), self.get_step_data(step)),
+        }
+        with self.time_phase('json'):
+            response = JsonResponse(data, encoder=self.json_encoder_class)
+        if self.step_versions_header:
+            patch_vary_headers(response, [self.step_versions_header])
+        return response
+
+    def omit_cached_html(self, client_versions, step_data):
+        """
+        Leaves the HTML out of `step_data` if the client holds its version.
+        """
+        version = step_data.get('version')
+        if version is not None and client_versions.get(six.text_type(step_data.get('form_id'))) == version:
+            step_data.pop('form', None)
+            step_data.pop('preview', None)
+            step_data['cached'] = True
+        return step_data
+
+    def get_client_step_versions(self):
+        """
+        Returns the versions of the step HTML held by the client, by form id,
+        from the `step_versions_header` header (``<form_id>:<version>,...``).
+        """
+        if not self.step_versions_header:
+            return {}
+        header = self.request.META.get('HTTP_' + self.step_versions_header.upper().replace('-', '_'), '')
+        versions = {}
+        for item in header.split(','):
+            form_id, sep, version = item.strip().partition(':')
+            if sep:
+                versions[form_id] = version
+        return versions
+
+    def get_step_version(self, rendered_form, rendered_preview):
+        """
+        Returns the version of the HTML of a step, which changes with its
+        rendered form or preview.
+        """
+        m = hashlib.sha1()
+        m.update(('%s\0%s' % (rendered_form or '', rendered_preview or '')).encode('utf-8'))
+        return m.hexdigest()[:16]
 
     def render_response(self, data=None, status_code=200):
         data = data or {}
-        return JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
+        with self.time_phase('json'):
+            return JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
 
     def render_response_error(self, reason='', status_code=400, **kwargs):
         data = {'reason': reason}
         data.update(**kwargs)
-        return JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
+        with self.time_phase('json'):
+            return JsonResponse(data, status=status_code, encoder=self.json_encoder_class)
 
     def is_valid(self, form=None):
         if form is not None:
@@ -342,17 +516,42 @@ class WizardAPIView(NamedUrlWizardView):
     def get_structure(self):
         return self.steps.all
 
+    def get_navigation(self):
+        """
+        Returns the navigation metadata of the wizard: the `order` of all
+        steps, the `conditional` steps (shown depending on the data of the
+        wizard) and the steps that are always `reachable`, which clients can
+        move to without asking the server first. `peek` and `sync` are the
+        names of these API views, None if they're disabled.
+        """
+        conditional = [step for step in self.form_list if callable(self.condition_dict.get(step, True))]
+        return {
+            'order': list(self.form_list),
+            'conditional': conditional,
+            'reachable': [step for step in self.steps.all if step not in conditional],
+            'peek': self.peek_step_name,
+            'sync': self.sync_step_name,
+        }
+
     def get_step_data(self, step, form=None, empty=False, form_data=None, form_files=None):
         if form is None:
             form_data = form_data or (self.storage.get_step_data(step) if not empty else None)
             form_files = form_files or (self.storage.get_step_files(step) if not empty else None)
 
             form = self.get_form(step, data=form_data, files=form_files)
+            self.add_file_errors(step, [form])
+
+        self.incr_metric('steps.rendered')
+        with self.time_phase('render_form'):
+            rendered_form = self.render_form(step, form)
+        with self.time_phase('render_preview'):
+            rendered_preview = self.render_preview(step, form)
 
         return {
             'form_id': self.get_form_uuid(step),
-            'form': self.render_form(step, form),
-            'preview': self.render_preview(step, form),
+            'form': rendered_form,
+            'preview': rendered_preview,
+            'version': self.get_step_version(rendered_form, rendered_preview),
             'valid': form.is_bound and form.is_valid(),
             'data': form.cleaned_data if (form.is_bound and form.is_valid()) else (form_data or {})
         }
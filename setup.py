@@ -50,7 +50,9 @@ setup(
     ],
     include_package_data=True,
     install_requires=requirements,
-    extras_require={},
+    extras_require={
+        'profiling': ['pyinstrument'],
+    },
     license="BSD",
     zip_safe=False,
     keywords='django-formtools-addons',
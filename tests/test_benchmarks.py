@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import TestCase, override_settings
+
+from benchmarks.cases import BENCHMARKS
+from benchmarks.loadgen import WIZARDS, Stats, get_report, percentile, run_journey
+from benchmarks.run import compare
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_benchmarks_run(self):
+        # Every case should at least run once, so the suite doesn't rot
+        for name, setup in BENCHMARKS.items():
+            setup()()
+
+    def test_compare(self):
+        baseline = {
+            'fast': {'median': 1.0},
+            'slow': {'median': 1.0},
+            'same': {'median': 1.0},
+        }
+        results = {
+            'fast': {'median': 0.5},
+            'slow': {'median': 1.5},
+            'same': {'median': 1.05},
+            'added': {'median': 1.0},
+        }
+        statuses = dict((row[0], row[4]) for row in compare(results, baseline, threshold=0.1))
+        self.assertEqual(statuses, {
+            'fast': 'improved',
+            'slow': 'REGRESSION',
+            'same': 'ok',
+            'added': 'new',
+        })
+
+
+@override_settings(
+    ROOT_URLCONF='benchmarks.urls',
+    SESSION_ENGINE='django.contrib.sessions.backends.cache',
+    MIDDLEWARE_CLASSES=(
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'formtools_addons.middleware.JSONMiddleware',
+    ),
+)
+class LoadGeneratorTests(TestCase):
+    def test_journeys(self):
+        stats = Stats()
+        for wizard in WIZARDS:
+            run_journey(wizard, WSGIHandler(), stats, (3, 3, 8))
+
+        self.assertEqual(stats.journeys, len(WIZARDS))
+        self.assertEqual(dict(stats.errors), {})
+        self.assertEqual(len(stats.session_bytes), len(WIZARDS))
+        self.assertTrue(all(size > 0 for size in stats.session_bytes))
+
+        report = get_report(stats, elapsed=1.0)
+        self.assertEqual(report['requests'], stats.requests)
+        self.assertIn('api POST commit', report['endpoints'])
+        self.assertIn('named GET done', report['endpoints'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0.0)
@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.tests.utils import skipIfCustomUser
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+
+from formtools_addons.wizard.files import BlobStore, get_content_digest
+from formtools_addons.wizard.storage import (
+    FILE_REFS_KEY, ContentAddressedCookieStorage, ContentAddressedSessionStorage)
+
+from .storage import TestStorage, get_request
+
+
+class CountingStorage(FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        super(CountingStorage, self).__init__(*args, **kwargs)
+        self.saved = []
+
+    def _save(self, name, content):
+        self.saved.append(name)
+        return super(CountingStorage, self)._save(name, content)
+
+
+class FileStorageTestMixin(object):
+    def setUp(self):
+        super(FileStorageTestMixin, self).setUp()
+        self.location = tempfile.mkdtemp()
+        self.file_storage = CountingStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        super(FileStorageTestMixin, self).tearDown()
+
+
+def digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class BlobStoreTests(FileStorageTestMixin, TestCase):
+    def test_add_and_release(self):
+        blob_store = BlobStore(self.file_storage)
+        name = blob_store.add(SimpleUploadedFile('a.txt', b'content'), 'owner1')
+        self.assertEqual(name, 'wizard_blobs/%s/%s' % (digest(b'content')[:2], digest(b'content')))
+        self.assertEqual(blob_store.add(SimpleUploadedFile('b.txt', b'content'), 'owner2'), name)
+        self.assertEqual(self.file_storage.saved, [
+            name + '.refs/owner1', name, name + '.refs/owner2'])
+        self.assertEqual(blob_store.get_digest(name), digest(b'content'))
+        self.assertIsNone(blob_store.get_digest('a.txt'))
+
+        blob_store.release(digest(b'content'), 'owner1')
+        self.assertTrue(self.file_storage.exists(name))
+        blob_store.release(digest(b'content'), 'owner2')
+        self.assertFalse(self.file_storage.exists(name))
+
+    def test_add_during_release(self):
+        blob_store = BlobStore(self.file_storage)
+        name = blob_store.add(SimpleUploadedFile('a.txt', b'content'), 'owner1')
+        threads = []
+
+        def delete(name_to_delete):
+            if name_to_delete == name and not threads:
+                # owner2 adds the file after the release listed the references
+                thread = threading.Thread(target=blob_store.add,
+                                          args=(SimpleUploadedFile('b.txt', b'content'), 'owner2'))
+                threads.append(thread)
+                thread.start()
+                time.sleep(0.1)
+            original_delete(name_to_delete)
+
+        original_delete = self.file_storage.delete
+        self.file_storage.delete = delete
+        blob_store.release(digest(b'content'), 'owner1')
+        threads[0].join(5)
+        # The add waited for the deletion and stored the blob again
+        self.assertTrue(self.file_storage.exists(name))
+        self.assertTrue(self.file_storage.exists(name + '.refs/owner2'))
+
+    def test_add_before_deletion(self):
+        blob_store = BlobStore(self.file_storage)
+        name = blob_store.add(SimpleUploadedFile('a.txt', b'content'), 'owner1')
+        original_save = self.file_storage.save
+
+        def save(name_to_save, content):
+            saved_name = original_save(name_to_save, content)
+            if '.releasing/' in name_to_save:
+                # owner2 adds its reference while the release is marked
+                original_save(name + '.refs/owner2', ContentFile(b''))
+            return saved_name
+
+        self.file_storage.save = save
+        blob_store.release(digest(b'content'), 'owner1')
+        self.assertTrue(self.file_storage.exists(name))
+        self.assertEqual(blob_store.list_dir(name + '.releasing'), [])
+
+    def test_content_digest(self):
+        field_file = SimpleUploadedFile('a.txt', b'content')
+        field_file.read(2)
+        self.assertEqual(get_content_digest(field_file), digest(b'content'))
+        self.assertEqual(field_file.read(), b'content')
+
+
+class ContentAddressedStorageTestMixin(FileStorageTestMixin, TestStorage):
+    def test_reset_deletes_tmp_files(self):
+        storage = self.get_storage()('wizard1', get_request(), self.file_storage)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        tmp_name = storage.data[storage.step_files_key]['start']['file']['tmp_name']
+        self.assertTrue(self.file_storage.exists(tmp_name))
+        self.assertEqual(storage.get_step_files('start')['file'].read(), b'content')
+
+        storage.reset()
+        storage.update_response(HttpResponse())
+        self.assertFalse(self.file_storage.exists(tmp_name))
+
+    def test_resubmit_same_file(self):
+        storage = self.get_storage()('wizard1', get_request(), self.file_storage)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.update_response(HttpResponse())
+        saved = list(self.file_storage.saved)
+
+        storage.set_step_files('start', {'file': SimpleUploadedFile('renamed.txt', b'content')})
+        storage.update_response(HttpResponse())
+        self.assertEqual(self.file_storage.saved, saved)
+        self.assertEqual(storage.data[FILE_REFS_KEY], {digest(b'content'): 1})
+        self.assertEqual(storage.get_step_files('start')['file'].name, 'renamed.txt')
+
+    def test_replace_file(self):
+        storage = self.get_storage()('wizard1', get_request(), self.file_storage)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'old')})
+        old_name = storage.data[storage.step_files_key]['start']['file']['tmp_name']
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'new')})
+        # Not deleted before the response is done
+        self.assertTrue(self.file_storage.exists(old_name))
+        storage.update_response(HttpResponse())
+        self.assertFalse(self.file_storage.exists(old_name))
+        self.assertEqual(storage.data[FILE_REFS_KEY], {digest(b'new'): 1})
+
+    def test_shared_files(self):
+        storage = self.get_storage()('wizard1', get_request(), self.file_storage)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.set_step_files('step2', {'file': SimpleUploadedFile('other.txt', b'content')})
+        other_storage = self.get_storage()('wizard1', get_request(), self.file_storage)
+        other_storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        self.assertEqual(len(self.file_storage.saved), 3)
+        tmp_name = storage.data[storage.step_files_key]['start']['file']['tmp_name']
+
+        storage.reset()
+        storage.update_response(HttpResponse())
+        self.assertTrue(self.file_storage.exists(tmp_name))
+        other_storage.reset()
+        other_storage.update_response(HttpResponse())
+        self.assertFalse(self.file_storage.exists(tmp_name))
+
+
+@skipIfCustomUser
+class ContentAddressedSessionStorageTests(ContentAddressedStorageTestMixin, TestCase):
+    def get_storage(self):
+        return ContentAddressedSessionStorage
+
+
+@skipIfCustomUser
+class ContentAddressedCookieStorageTests(ContentAddressedStorageTestMixin, TestCase):
+    def get_storage(self):
+        return ContentAddressedCookieStorage
+
+
+class HashingUploadHandlerTests(TestCase):
+    def get_uploaded_file(self):
+        request = RequestFactory().post('/', {'file': SimpleUploadedFile('file.txt', b'content' * 100)})
+        return request.FILES['file']
+
+    @override_settings(FILE_UPLOAD_HANDLERS=[
+        'formtools_addons.wizard.files.HashingMemoryFileUploadHandler',
+        'formtools_addons.wizard.files.HashingTemporaryFileUploadHandler',
+    ])
+    def test_memory(self):
+        self.assertEqual(self.get_uploaded_file().content_digest, digest(b'content' * 100))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10, FILE_UPLOAD_HANDLERS=[
+        'formtools_addons.wizard.files.HashingMemoryFileUploadHandler',
+        'formtools_addons.wizard.files.HashingTemporaryFileUploadHandler',
+    ])
+    def test_temporary_file(self):
+        uploaded_file = self.get_uploaded_file()
+        self.assertTrue(hasattr(uploaded_file, 'temporary_file_path'))
+        self.assertEqual(uploaded_file.content_digest, digest(b'content' * 100))
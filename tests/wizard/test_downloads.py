@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+
+import shutil
+
+from django.conf.urls import url
+from django.core.files.storage import Storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.wizard.downloads import parse_range
+
+from .test_uploads import UploadWizard, upload_storage
+
+
+class RemoteStorage(Storage):
+    """
+    A storage without paths, reading the files of `upload_storage`.
+    """
+    def _open(self, name, mode='rb'):
+        return upload_storage.open(name, mode)
+
+    def exists(self, name):
+        return upload_storage.exists(name)
+
+    def size(self, name):
+        return upload_storage.size(name)
+
+    def modified_time(self, name):
+        return upload_storage.modified_time(name)
+
+
+urlpatterns = [
+    url(r'^wizard/(?P<step>[^/]+)/(?P<substep>[^/]+)/$',
+        UploadWizard.as_view(url_name='wizard_step', download_chunk_size=4), name='wizard_step'),
+    url(r'^wizard/(?P<step>[^/]+)/$', UploadWizard.as_view(url_name='wizard_step'), name='wizard_step'),
+    url(r'^accel/(?P<step>[^/]+)/(?P<substep>[^/]+)/$',
+        UploadWizard.as_view(url_name='wizard_step', download_accel_header='X-Accel-Redirect',
+                             download_accel_location='/protected/'), name='accel_step'),
+    url(r'^remote/(?P<step>[^/]+)/(?P<substep>[^/]+)/$',
+        UploadWizard.as_view(url_name='wizard_step', download_accel_header='X-Sendfile',
+                             file_storage=RemoteStorage()), name='remote_step'),
+]
+
+
+class ParseRangeTests(TestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        self.assertFalse(parse_range('bytes=100-', 100))
+        self.assertFalse(parse_range('bytes=5-1', 100))
+        self.assertFalse(parse_range('bytes=-0', 100))
+
+
+@override_settings(ROOT_URLCONF='tests.wizard.test_downloads')
+class StepFileDownloadTests(TestCase):
+    content = b'0123456789abcdefghij'
+
+    def setUp(self):
+        response = self.client.post('/wizard/start/', {
+            'name': 'joe', 'document': SimpleUploadedFile('doc.txt', self.content, content_type='text/plain'),
+        }, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(response.status_code, 200)
+
+    def tearDown(self):
+        shutil.rmtree(upload_storage.location, ignore_errors=True)
+
+    def get_file(self, path='/wizard/file/start/?field=document', **headers):
+        return self.client.get(path, **headers)
+
+    def test_stream(self):
+        response = self.get_file()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(list(response.streaming_content), [b'0123', b'4567', b'89ab', b'cdef', b'ghij'])
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="doc.txt"; filename*=UTF-8\'\'doc.txt')
+        self.assertEqual(response['Content-Length'], '20')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_attachment(self):
+        self.client.post('/wizard/start/', {
+            'name': 'joe', 'document': SimpleUploadedFile('page.html', b'<script></script>', content_type='text/html'),
+        }, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        response = self.get_file()
+        self.assertEqual(response['Content-Type'], 'text/html')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment; filename="page.html"'))
+
+    def test_not_found(self):
+        self.assertEqual(self.get_file('/wizard/file/start/?field=name').status_code, 404)
+        self.assertEqual(self.get_file('/wizard/file/step2/?field=document').status_code, 404)
+
+    def test_range(self):
+        response = self.get_file(HTTP_RANGE='bytes=5-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[5:11])
+        self.assertEqual(response['Content-Range'], 'bytes 5-10/20')
+        self.assertEqual(response['Content-Length'], '6')
+
+        response = self.get_file(HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'hij')
+
+        response = self.get_file(HTTP_RANGE='bytes=30-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */20')
+
+    def test_if_range(self):
+        etag = self.get_file()['ETag']
+        response = self.get_file(HTTP_RANGE='bytes=5-10', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get_file(HTTP_RANGE='bytes=5-10', HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_conditional(self):
+        response = self.get_file()
+        self.assertEqual(self.get_file(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get_file(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get_file(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get_file(HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code, 200)
+
+    def test_accel_redirect(self):
+        response = self.get_file('/accel/file/start/?field=document')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        tmp_name = self.client.session['wizard_upload_wizard']['step_files']['start']['document']['tmp_name']
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + tmp_name)
+
+    def test_accel_without_path(self):
+        # Streamed from storages without paths
+        response = self.get_file('/remote/file/start/?field=document')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
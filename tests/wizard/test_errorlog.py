@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+
+import logging
+
+from django import http
+from django.test import TestCase
+
+from formtools_addons.wizard.errorlog import TokenBucket, ValidationErrorLogger
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import Step1, Step2
+from .test_timing import get_json_request
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ErrorLogAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', Step1), ('step2', Step2)]
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse()
+
+
+class ErrorLoggerTestMixin(object):
+    def setUp(self):
+        self.logger = logging.getLogger('tests.errorlog')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def get_error_logger(self, **kwargs):
+        error_logger = ValidationErrorLogger(self.logger, **kwargs)
+        error_logger.clock = error_logger.bucket.clock = self.clock
+        error_logger._reset()
+        error_logger.bucket.updated = self.clock()
+        return error_logger
+
+
+class ValidationErrorLoggerTests(ErrorLoggerTestMixin, TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        bucket.clock = self.clock
+        bucket.updated = self.clock()
+        self.assertEqual([bucket.consume() for i in range(3)], [True, True, False])
+        self.clock.now = 1.5
+        self.assertEqual([bucket.consume() for i in range(2)], [True, False])
+
+    def test_structured_record(self):
+        error_logger = self.get_error_logger()
+        error_logger.log(logging.WARNING, 'Wizard', 'start', {'name': ['Required.', 'Too short.'], 'age': ['Bad.']})
+
+        record, = self.handler.records
+        self.assertEqual(record.levelno, logging.WARNING)
+        self.assertEqual(record.wizard, 'Wizard')
+        self.assertEqual(record.step, 'start')
+        self.assertEqual(record.fields, {'name': 2, 'age': 1})
+        self.assertEqual(record.error_count, 3)
+        self.assertIn('name: "Required.", "Too short."', record.getMessage())
+
+    def test_rate_limit_and_summary(self):
+        error_logger = self.get_error_logger(rate=1, burst=2, summary_interval=60)
+        for i in range(5):
+            error_logger.log(logging.ERROR, 'Wizard', 'start', {'name': ['Required.']})
+        self.assertEqual(len(self.handler.records), 2)
+
+        self.clock.now = 61
+        error_logger.log(logging.ERROR, 'Wizard', 'step2', {'name': ['Required.']})
+        self.assertEqual(len(self.handler.records), 4)
+        summary = self.handler.records[-1]
+        self.assertEqual(summary.validation_summary, [
+            {'wizard': 'Wizard', 'step': 'start', 'count': 5},
+            {'wizard': 'Wizard', 'step': 'step2', 'count': 1},
+        ])
+        self.assertEqual(summary.suppressed, 3)
+
+        error_logger.flush()
+        self.assertEqual(len(self.handler.records), 4)
+
+    def test_flush_due(self):
+        error_logger = self.get_error_logger(summary_interval=60)
+        error_logger.log(logging.ERROR, 'Wizard', 'start', {'name': ['Required.']})
+        error_logger.flush_due()
+        self.assertEqual(len(self.handler.records), 1)
+
+        # The summary is logged without a new error once the interval is over
+        self.clock.now = 61
+        error_logger.flush_due()
+        self.assertEqual(len(self.handler.records), 2)
+        self.assertEqual(self.handler.records[-1].validation_summary, [
+            {'wizard': 'Wizard', 'step': 'start', 'count': 1},
+        ])
+
+    def test_disabled_level(self):
+        error_logger = self.get_error_logger()
+        self.logger.setLevel(logging.ERROR)
+        error_logger.log(logging.INFO, 'Wizard', 'start', {'name': ['Required.']})
+        self.assertEqual(self.handler.records, [])
+        self.assertEqual(dict(error_logger.counts), {})
+
+
+class WizardAPIViewErrorLogTests(ErrorLoggerTestMixin, TestCase):
+    def test_invalid_step(self):
+        view = ErrorLogAPIWizard.as_view(url_name='wizard_step', validation_log_level=logging.INFO,
+                                         validation_error_logger=self.get_error_logger())
+        response = view(get_json_request({'name': ''}), step='start')
+        self.assertEqual(response.status_code, 400)
+
+        record, = self.handler.records
+        self.assertEqual(record.levelno, logging.INFO)
+        self.assertEqual(record.wizard, 'ErrorLogAPIWizard')
+        self.assertEqual(record.fields, {'name': 1})
+
+    def test_summary_of_valid_request(self):
+        error_logger = self.get_error_logger(summary_interval=60)
+        view = ErrorLogAPIWizard.as_view(url_name='wizard_step', validation_error_logger=error_logger)
+        view(get_json_request({'name': ''}), step='start')
+        self.assertEqual(len(self.handler.records), 1)
+
+        self.clock.now = 61
+        response = view(get_json_request({'name': 'data1'}), step='start')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.handler.records), 2)
+        self.assertEqual(self.handler.records[-1].suppressed, 0)
@@ -4,14 +4,17 @@ from importlib import import_module
 
 from django import forms, http
 from django.conf import settings
+from django.core.cache import caches
 from django.db import models
 from django.test import TestCase
 from django.template.response import TemplateResponse
 
 from django.contrib.auth.models import User
 
+from formtools_addons.metrics import InMemoryMetrics, set_metrics
+from formtools_addons.wizard.cache import LRUCache
 from formtools_addons.wizard.views import (
-    MultipleFormWizardView, SessionMultipleFormWizardView, CookieMultipleFormWizardView)
+    FormListVariant, MultipleFormWizardView, SessionMultipleFormWizardView, CookieMultipleFormWizardView)
 
 
 class DummyRequest(http.HttpRequest):
@@ -195,6 +198,7 @@ class FormTests(TestCase):
 
         self.assertEqual(instance.get_form_prefix(), 'start')
         self.assertEqual(instance.get_form_prefix('another'), 'another')
+        self.assertEqual(instance.get_form_prefix('another', 'form1'), 'another-form1')
 
     def test_form_initial(self):
         request = get_request()
@@ -344,6 +348,170 @@ class FormTests(TestCase):
         self.assertEqual(instance.storage.current_step, 'start')
 
 
+class CountingWizard(TestWizard):
+    def get_form_kwargs(self, step, *args, **kwargs):
+        self.form_kwargs_calls = getattr(self, 'form_kwargs_calls', 0) + 1
+        return super(CountingWizard, self).get_form_kwargs(step, *args, **kwargs)
+
+
+class CustomPrefixWizard(TestWizard):
+    def get_form_prefix(self, step=None, form=None):
+        return 'custom-%s' % super(CustomPrefixWizard, self).get_form_prefix(step, form)
+
+
+class FormPlanTests(TestCase):
+    form_list = [
+        ('start', Step1),
+        ('user', (('substep_1', Step6Model), ('substep_2', Step2))),
+    ]
+
+    def test_plans(self):
+        initkwargs = TestWizard.get_initkwargs(self.form_list)
+        plans = initkwargs['_form_plans']
+
+        self.assertFalse(plans['start'].multiple)
+        self.assertFalse(plans['start'].needs_instance)
+        self.assertEqual(plans['start'].entries[0].prefix, 'start')
+        self.assertTrue(plans['user'].multiple)
+        self.assertEqual([(entry.name, entry.prefix, entry.instance_kwarg) for entry in plans['user'].entries], [
+            ('substep_1', 'user-substep_1', 'instance'),
+            ('substep_2', 'user-substep_2', None),
+        ])
+
+    def test_multiple_forms(self):
+        response, instance = CountingWizard.as_view(self.form_list)(get_request())
+        instance.form_kwargs_calls = 0
+
+        forms = instance.get_forms('user')
+        self.assertEqual([form.prefix for form in forms], ['user-substep_1', 'user-substep_2'])
+        self.assertEqual([form._tag for form in forms], ['substep_1', 'substep_2'])
+        self.assertEqual(instance.form_kwargs_calls, 1)
+
+    def test_custom_prefix(self):
+        response, instance = CustomPrefixWizard.as_view(self.form_list)(get_request())
+        self.assertIsNone(instance._form_plans['user'].entries[0].prefix)
+        forms = instance.get_forms('user')
+        self.assertEqual([form.prefix for form in forms], ['custom-user-substep_1', 'custom-user-substep_2'])
+
+    def test_changed_form_list(self):
+        response, instance = TestWizard.as_view(self.form_list)(get_request())
+        instance.form_list['start'] = Step2
+        form, = instance.get_forms('start')
+        self.assertIsInstance(form, Step2)
+
+
+class CleanedDataWizard(TestWizard):
+    def get_forms(self, *args, **kwargs):
+        self.get_forms_calls = getattr(self, 'get_forms_calls', 0) + 1
+        return super(CleanedDataWizard, self).get_forms(*args, **kwargs)
+
+
+class CleanedDataMemoTests(TestCase):
+    form_list = [
+        ('start', Step1),
+        ('user', (('substep_1', Step1), ('substep_2', Step2))),
+    ]
+
+    def get_instance(self, **initkwargs):
+        response, instance = CleanedDataWizard.as_view(self.form_list, **initkwargs)(get_request())
+        instance.storage.set_step_data('start', {'start-name': ['data1']})
+        instance.storage.set_step_data('user', {'user-substep_1-name': ['data2'], 'user-substep_2-name': ['data3']})
+        instance.get_forms_calls = 0
+        return instance
+
+    def test_memo(self):
+        instance = self.get_instance()
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'name': 'data1'})
+        self.assertEqual(instance.get_cleaned_data_for_step('user'), {
+            'substep_1': {'name': 'data2'},
+            'substep_2': {'name': 'data3'},
+        })
+        self.assertEqual(instance.get_all_cleaned_data(), {'name': 'data3'})
+        self.assertEqual(instance.get_all_cleaned_data_dict()['start'], {'name': 'data1'})
+        self.assertEqual(instance.get_forms_calls, 2)
+
+        # returned data can be modified without affecting the memo
+        instance.get_cleaned_data_for_step('user')['substep_1']['name'] = 'changed'
+        self.assertEqual(instance.get_cleaned_data_for_step('user')['substep_1'], {'name': 'data2'})
+
+    def test_formset_memo(self):
+        form_list = [('start', forms.formset_factory(Step1))]
+        response, instance = CleanedDataWizard.as_view(form_list)(get_request())
+        instance.storage.set_step_data('start', {
+            'start-TOTAL_FORMS': ['1'], 'start-INITIAL_FORMS': ['0'], 'start-0-name': ['data1']})
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'formset-start': [{'name': 'data1'}]})
+
+        # returned formset data can be modified without affecting the memo
+        instance.get_cleaned_data_for_step('start')['formset-start'][0]['name'] = 'changed'
+        instance.get_all_cleaned_data()['formset-start'][0]['name'] = 'changed'
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'formset-start': [{'name': 'data1'}]})
+        self.assertEqual(instance.get_all_cleaned_data(), {'formset-start': [{'name': 'data1'}]})
+
+    def test_invalidated_by_storage(self):
+        instance = self.get_instance()
+        instance.get_cleaned_data_for_step('start')
+        instance.storage.set_step_data('start', {'start-name': ['other']})
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'name': 'other'})
+        instance.storage.reset()
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {})
+        self.assertEqual(instance.get_forms_calls, 3)
+
+    def test_cross_request_cache(self):
+        caches['default'].clear()
+        instance = self.get_instance(cleaned_data_cache='default')
+        instance.get_cleaned_data_for_step('start')
+        self.assertEqual(instance.get_forms_calls, 1)
+
+        instance = self.get_instance(cleaned_data_cache='default')
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'name': 'data1'})
+        self.assertEqual(instance.get_forms_calls, 0)
+
+        instance.storage.set_step_data('start', {'start-name': ['other']})
+        self.assertEqual(instance.get_cleaned_data_for_step('start'), {'name': 'other'})
+        self.assertEqual(instance.get_forms_calls, 1)
+
+
+class ExtraDataWizard(TestWizard):
+    cleaned_data_in_context = True
+
+    def get_all_cleaned_data_dict(self):
+        raise AssertionError('cleaned data is not needed for fragments')
+
+
+class FragmentTests(TestCase):
+    form_list = [('start', Step1), ('step2', (('form1', Step1), ('form2', Step2)))]
+
+    def test_full_page(self):
+        response, instance = TestWizard.as_view(self.form_list)(get_request())
+        response.render()
+        self.assertEqual(response.template_name, ['formtools_addons/wizard/wizard_form.html'])
+        self.assertContains(response, '<form')
+        self.assertContains(response, 'name="test_wizard-current_step"')
+        self.assertContains(response, 'name="start-name"')
+        self.assertEqual(response['Vary'], 'X-Wizard-Fragment')
+
+    def test_header(self):
+        request = get_request()
+        request.META['HTTP_X_WIZARD_FRAGMENT'] = '1'
+        response, instance = ExtraDataWizard.as_view(self.form_list)(request)
+        response.render()
+        self.assertEqual(response.template_name, ['formtools_addons/wizard/wizard_forms.html'])
+        self.assertNotContains(response, '<form')
+        self.assertContains(response, 'name="extra_data_wizard-current_step"')
+        self.assertContains(response, 'name="start-name"')
+        self.assertNotIn('cleaned_data', response.context_data)
+
+    def test_query_parameter(self):
+        request = get_request({'test_wizard-current_step': 'start', 'start-name': 'data1'})
+        request.GET = request.GET.copy()
+        request.GET['fragment'] = '1'
+        response, instance = TestWizard.as_view(self.form_list)(request)
+        response.render()
+        self.assertNotContains(response, '<form')
+        self.assertContains(response, 'name="step2-form1-name"')
+        self.assertContains(response, 'name="step2-form2-name"')
+
+
 class SessionFormTests(TestCase):
     def test_init(self):
         request = get_request()
@@ -356,3 +524,67 @@ class CookieFormTests(TestCase):
         request = get_request()
         testform = CookieMultipleFormWizardView.as_view([('start', Step1)])
         self.assertIsInstance(testform(request), TemplateResponse)
+
+
+class VariantWizard(TestWizard):
+    form_list_cache_size = 2
+    factory_calls = []
+
+    def get_variant_form_list(self):
+        variant = self.request.GET.get('variant', 'a')
+
+        def build_form_list():
+            self.factory_calls.append(variant)
+            return [('start', Step1), ('step2', Step2)] if variant == 'a' else [('start', Step2)]
+        return FormListVariant(variant, build_form_list)
+
+
+class FormListCacheTests(TestCase):
+    def setUp(self):
+        VariantWizard.factory_calls = []
+        VariantWizard.get_form_list_cache().clear()
+        self.metrics = InMemoryMetrics()
+        set_metrics(self.metrics)
+
+    def tearDown(self):
+        set_metrics(None)
+
+    def get_response(self, variant):
+        request = get_request()
+        request.GET['variant'] = variant
+        view = VariantWizard.as_view(form_list=lambda view: view.get_variant_form_list())
+        return view(request)
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 2)
+
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_cached_variants(self):
+        response, instance = self.get_response('a')
+        self.assertEqual(list(instance.form_list.keys()), ['start', 'step2'])
+        response, instance = self.get_response('b')
+        self.assertEqual(list(instance.form_list.keys()), ['start'])
+        response, other_instance = self.get_response('b')
+        self.assertIs(other_instance.form_list, instance.form_list)
+
+        self.assertEqual(VariantWizard.factory_calls, ['a', 'b'])
+        self.assertEqual(self.metrics.get_counter('cache.hits', cache='form_list'), 1)
+        self.assertEqual(self.metrics.get_counter('cache.misses', cache='form_list'), 2)
+
+    def test_eviction(self):
+        for variant in ('a', 'b', 'c', 'a'):
+            self.get_response(variant)
+        self.assertEqual(VariantWizard.factory_calls, ['a', 'b', 'c', 'a'])
+        self.assertEqual(len(VariantWizard.get_form_list_cache()), 2)
+        # the cache is per class
+        self.assertIsNot(TestWizard.get_form_list_cache(), VariantWizard.get_form_list_cache())
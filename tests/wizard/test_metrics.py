@@ -0,0 +1,166 @@
+from __future__ import unicode_literals
+
+import socket
+
+from django import http
+from django.test import TestCase, override_settings
+
+from formtools_addons.metrics import InMemoryMetrics, NullMetrics, StatsdMetrics, get_metrics, set_metrics
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import TestWizard, get_request, Step1, Step2
+from .test_timing import get_json_request
+
+
+class MetricsAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', Step1), ('step2', Step2)]
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse()
+
+
+class MetricsCookieAPIWizard(MetricsAPIWizard):
+    storage_name = 'formtools.wizard.storage.cookie.CookieStorage'
+
+
+class MetricsTestMixin(object):
+    def setUp(self):
+        self.metrics = InMemoryMetrics()
+        set_metrics(self.metrics)
+
+    def tearDown(self):
+        set_metrics(None)
+
+
+class InMemoryMetricsTests(TestCase):
+    def test_counters_and_histograms(self):
+        metrics = InMemoryMetrics()
+        metrics.incr('commits', tags={'wizard': 'A'})
+        metrics.incr('commits', 2, tags={'wizard': 'B'})
+        metrics.observe('state.bytes', 10, tags={'wizard': 'A'})
+        metrics.observe('state.bytes', 20, tags={'wizard': 'B'})
+
+        self.assertEqual(metrics.get_counter('commits'), 3)
+        self.assertEqual(metrics.get_counter('commits', wizard='B'), 2)
+        self.assertEqual(metrics.get_counter('missing'), 0)
+        self.assertEqual(sorted(metrics.get_histogram('state.bytes')), [10, 20])
+        self.assertEqual(metrics.get_histogram('state.bytes', wizard='A'), [10])
+
+        metrics.reset()
+        self.assertEqual(metrics.get_counter('commits'), 0)
+
+    def test_settings(self):
+        set_metrics(None)
+        self.assertIsInstance(get_metrics(), NullMetrics)
+        with override_settings(FORMTOOLS_ADDONS_METRICS={'BACKEND': 'formtools_addons.metrics.InMemoryMetrics'}):
+            self.assertIsInstance(get_metrics(), InMemoryMetrics)
+        self.assertIsInstance(get_metrics(), NullMetrics)
+
+
+class StatsdMetricsTests(TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(5)
+
+    def tearDown(self):
+        self.server.close()
+
+    def receive(self):
+        return self.server.recv(1024).decode('utf-8')
+
+    def test_packets(self):
+        metrics = StatsdMetrics(*self.server.getsockname(), prefix='wizards')
+        metrics.incr('commits', tags={'wizard': 'A', 'step': 'start'})
+        self.assertEqual(self.receive(), 'wizards.commits:1|c|#step:start,wizard:A')
+        metrics.observe('state.bytes', 120)
+        self.assertEqual(self.receive(), 'wizards.state.bytes:120|h')
+
+        metrics = StatsdMetrics(*self.server.getsockname(), prefix='', tags=False)
+        metrics.incr('commits', 3, tags={'wizard': 'A'})
+        self.assertEqual(self.receive(), 'commits:3|c')
+
+    def test_send_error(self):
+        metrics = StatsdMetrics(*self.server.getsockname())
+        metrics._socket.close()
+        # doesn't raise
+        metrics.incr('commits')
+
+
+class WizardAPIViewMetricsTests(MetricsTestMixin, TestCase):
+    def test_metrics(self):
+        view = MetricsAPIWizard.as_view(url_name='wizard_step')
+        response = view(get_json_request({'name': 'data1'}), step='start')
+        self.assertEqual(response.status_code, 200)
+
+        metrics = self.metrics
+        self.assertEqual(metrics.get_counter('forms.constructed', wizard='MetricsAPIWizard'),
+                         metrics.get_counter('forms.constructed'))
+        self.assertTrue(metrics.get_counter('forms.constructed') >= 2)
+        self.assertTrue(metrics.get_counter('forms.validated') >= 1)
+        self.assertEqual(metrics.get_counter('steps.rendered'), 2)
+        self.assertEqual(metrics.get_histogram('state.bytes'), [len(response.content)])
+        self.assertEqual(metrics.get_counter('storage.bytes_read'), 0)
+        self.assertTrue(metrics.get_counter('storage.bytes_written') > 0)
+        self.assertEqual(metrics.get_counter('commits'), 0)
+
+    def test_cookie_storage(self):
+        view = MetricsCookieAPIWizard.as_view(url_name='wizard_step')
+        response = view(get_json_request({'name': 'data1'}), step='start')
+        cookie = response.cookies['wizard_metrics_cookie_api_wizard']
+        self.assertEqual(self.metrics.get_counter('storage.bytes_written'), len(cookie.value))
+
+        request = get_json_request()
+        request.COOKIES[cookie.key] = cookie.value
+        view(request, step='data')
+        self.assertEqual(self.metrics.get_counter('storage.bytes_read'), len(cookie.value))
+        # The unchanged state isn't counted as written
+        self.assertEqual(self.metrics.get_counter('storage.bytes_written'), len(cookie.value))
+
+    def test_unchanged_session(self):
+        view = MetricsAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'data1'})
+        view(request, step='start')
+        written = self.metrics.get_counter('storage.bytes_written')
+        self.assertTrue(written > 0)
+
+        request.POST = {}
+        view(request, step='data')
+        self.assertEqual(self.metrics.get_counter('storage.bytes_read'), written)
+        self.assertEqual(self.metrics.get_counter('storage.bytes_written'), written)
+
+    def test_commit(self):
+        view = MetricsAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'data1'})
+        view(request, step='start')
+        request.POST = {'name': 'data2'}
+        view(request, step='step2')
+        request.POST = {}
+        response = view(request, step='commit')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.metrics.get_counter('commits', wizard='MetricsAPIWizard'), 1)
+
+    def test_cache_lookup(self):
+        instance = MetricsAPIWizard()
+        instance.record_cache_lookup('form_list', True)
+        instance.record_cache_lookup('form_list', False)
+        self.assertEqual(self.metrics.get_counter('cache.hits', cache='form_list'), 1)
+        self.assertEqual(self.metrics.get_counter('cache.misses', cache='form_list'), 1)
+
+
+class MultipleFormWizardViewMetricsTests(MetricsTestMixin, TestCase):
+    def test_metrics(self):
+        view = TestWizard.as_view([('start', Step1), ('step2', Step2)])
+        view(get_request())
+        view(get_request({'test_wizard-current_step': 'start', 'start-name': 'data1'}))
+
+        self.assertEqual(self.metrics.get_counter('steps.rendered', wizard='TestWizard'), 2)
+        self.assertTrue(self.metrics.get_counter('forms.constructed') >= 2)
+        self.assertTrue(self.metrics.get_counter('forms.validated') >= 1)
+
+    def test_disabled(self):
+        set_metrics(NullMetrics())
+        view = TestWizard.as_view([('start', Step1), ('step2', Step2)])
+        response, instance = view(get_request())
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+
+from django import http
+from django.conf.urls import url
+from django.conf.urls.i18n import i18n_patterns
+from django.core.urlresolvers import set_script_prefix
+from django.test import TestCase, override_settings
+from django.utils import translation
+
+from formtools_addons.metrics import InMemoryMetrics, set_metrics
+from formtools_addons.wizard.views import NamedUrlSessionMultipleFormWizardView
+
+from .test_forms import Step1, Step2
+
+
+class NamedWizard(NamedUrlSessionMultipleFormWizardView):
+    form_list = [('start', Step1), ('step2', (('form1', Step1), ('form2', Step2)))]
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse('done')
+
+
+named_wizard = NamedWizard.as_view(url_name='named_step')
+
+urlpatterns = [
+    url(r'^named/(?P<step>[-\w]+)/$', named_wizard, name='named_step'),
+    url(r'^named/$', named_wizard, name='named_start'),
+    url(r'^objects/(?P<pk>\d+)/named/(?P<step>[-\w]+)/$', named_wizard, name='object_named_step'),
+    url(r'^free/(?P<step>[-\w]+)/$', NamedWizard.as_view(url_name='free_step', redirect_free=True),
+        name='free_step'),
+]
+urlpatterns += i18n_patterns(
+    url(r'^i18n/(?P<step>[-\w]+)/$', named_wizard, name='i18n_named_step'),
+)
+
+
+@override_settings(ROOT_URLCONF='tests.wizard.test_namedurl')
+class StepUrlTests(TestCase):
+    def setUp(self):
+        NamedWizard._step_url_cache = None
+        self.metrics = InMemoryMetrics()
+        set_metrics(self.metrics)
+
+    def tearDown(self):
+        set_metrics(None)
+
+    def get_instance(self, url_name='named_step', **kwargs):
+        instance = NamedWizard(**NamedWizard.get_initkwargs(url_name=url_name))
+        instance.kwargs = kwargs
+        return instance
+
+    def test_step_url(self):
+        instance = self.get_instance(step='start')
+        self.assertEqual(instance.get_step_url('step2'), '/named/step2/')
+        self.assertEqual(instance.get_step_url('done'), '/named/done/')
+        self.assertEqual(instance.get_step_url('step2'), '/named/step2/')
+        # the view's kwargs aren't changed
+        self.assertEqual(instance.kwargs, {'step': 'start'})
+        self.assertEqual(self.metrics.get_counter('cache.hits', cache='step_url'), 1)
+        self.assertEqual(self.metrics.get_counter('cache.misses', cache='step_url'), 2)
+
+    def test_url_kwargs(self):
+        instance = self.get_instance('object_named_step', pk='1', step='start')
+        self.assertEqual(instance.get_step_url('step2'), '/objects/1/named/step2/')
+        instance = self.get_instance('object_named_step', pk='2', step='start')
+        self.assertEqual(instance.get_step_url('step2'), '/objects/2/named/step2/')
+
+    def test_script_prefix(self):
+        instance = self.get_instance(step='start')
+        self.assertEqual(instance.get_step_url('step2'), '/named/step2/')
+        set_script_prefix('/prefix/')
+        try:
+            self.assertEqual(instance.get_step_url('step2'), '/prefix/named/step2/')
+        finally:
+            set_script_prefix('/')
+
+    @override_settings(LANGUAGES=[('en', 'English'), ('de', 'German')])
+    def test_language(self):
+        instance = self.get_instance('i18n_named_step', step='start')
+        with translation.override('en'):
+            self.assertEqual(instance.get_step_url('step2'), '/en/i18n/step2/')
+        with translation.override('de'):
+            self.assertEqual(instance.get_step_url('step2'), '/de/i18n/step2/')
+        with translation.override('en'):
+            self.assertEqual(instance.get_step_url('step2'), '/en/i18n/step2/')
+
+    def test_wizard(self):
+        response = self.client.get('/named/')
+        self.assertRedirects(response, '/named/start/')
+        response = self.client.post('/named/start/', {
+            'named_wizard-current_step': 'start', 'start-name': 'data1'})
+        self.assertRedirects(response, '/named/step2/')
+        response = self.client.post('/named/step2/', {
+            'named_wizard-current_step': 'step2', 'step2-form1-name': 'data2', 'step2-form2-name': 'data3'})
+        self.assertRedirects(response, '/named/done/', fetch_redirect_response=False)
+        response = self.client.get('/named/done/')
+        self.assertEqual(response.content, b'done')
+
+
+@override_settings(ROOT_URLCONF='tests.wizard.test_namedurl')
+class RedirectFreeTests(TestCase):
+    def test_wizard(self):
+        response = self.client.get('/free/start/')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/free/start/', {
+            'named_wizard-current_step': 'start', 'start-name': 'data1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Location'], '/free/step2/')
+        self.assertEqual(response.context['wizard']['steps'].current, 'step2')
+
+        # go back and forth without redirects
+        response = self.client.post('/free/step2/', {'wizard_goto_step': 'start'})
+        self.assertEqual(response['Content-Location'], '/free/start/')
+        self.assertEqual(response.context['wizard']['forms'][0]['name'].value(), 'data1')
+        response = self.client.post('/free/start/', {
+            'named_wizard-current_step': 'start', 'start-name': 'data1'})
+        self.assertEqual(response['Content-Location'], '/free/step2/')
+
+        # the URL the client posts to doesn't need to match the step
+        response = self.client.post('/free/start/', {
+            'named_wizard-current_step': 'step2', 'step2-form1-name': 'data2', 'step2-form2-name': 'data3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'done')
+        self.assertEqual(response['Content-Location'], '/free/done/')
+
+    def test_revalidation_failure(self):
+        self.client.get('/free/start/')
+        session = self.client.session
+        session['wizard_named_wizard']['step_data']['start'] = {'start-name': ['']}
+        session['wizard_named_wizard']['step'] = 'step2'
+        session.save()
+
+        response = self.client.post('/free/step2/', {
+            'named_wizard-current_step': 'step2', 'step2-form1-name': 'data2', 'step2-form2-name': 'data3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Location'], '/free/start/')
+        self.assertEqual(response.context['wizard']['steps'].current, 'start')
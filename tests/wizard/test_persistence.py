@@ -0,0 +1,248 @@
+from __future__ import unicode_literals
+
+import copy
+import json
+import threading
+
+from django import forms
+from django.conf.urls import url
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.wizard.persistence import FileCopyExecutor, PendingFilesMixin, set_file_executor
+from formtools_addons.wizard.storage import FAILED_FILES_KEY, PENDING_FILES_KEY, BackgroundSessionStorage
+
+from .storage import get_request
+from .test_contentaddressedstorage import CountingStorage, FileStorageTestMixin
+from .test_uploads import UploadWizard
+
+
+class GatedStorage(CountingStorage):
+    """
+    Holds the copies of step files until `gate` is set, and fails them if
+    `fail` is set.
+    """
+    def __init__(self, *args, **kwargs):
+        super(GatedStorage, self).__init__(*args, **kwargs)
+        self.gate = threading.Event()
+        self.fail = False
+
+    def _save(self, name, content):
+        if not name.startswith('wizard_file_status/'):
+            self.gate.wait(5)
+            if self.fail:
+                raise IOError('storage unavailable')
+        return super(GatedStorage, self)._save(name, content)
+
+
+class BackgroundWizard(UploadWizard):
+    storage_name = 'formtools_addons.wizard.storage.BackgroundSessionStorage'
+    pending_files_timeout = 5
+
+
+urlpatterns = [
+    url(r'^wizard/(?P<step>[^/]+)/$', BackgroundWizard.as_view(url_name='wizard_step'), name='wizard_step'),
+]
+
+
+class BackgroundFileTestMixin(FileStorageTestMixin):
+    def setUp(self):
+        super(BackgroundFileTestMixin, self).setUp()
+        self.file_storage = GatedStorage(location=self.location)
+        self.executor = FileCopyExecutor(max_workers=1, max_queue=1)
+        set_file_executor(self.executor)
+
+    def tearDown(self):
+        self.file_storage.gate.set()
+        self.executor.queue.join()
+        set_file_executor(None)
+        super(BackgroundFileTestMixin, self).tearDown()
+
+
+class BackgroundFileStorageTests(BackgroundFileTestMixin, TestCase):
+    def get_storage(self, request=None):
+        storage = BackgroundSessionStorage('wizard1', request or get_request(), self.file_storage)
+        storage.file_submit_timeout = 0.01
+        return storage
+
+    def test_pending_and_stored(self):
+        request = get_request()
+        storage = self.get_storage(request)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        self.assertEqual(list(storage.data[PENDING_FILES_KEY]['start'].keys()), ['file'])
+        self.assertEqual(storage.data[storage.step_files_key]['start'], {})
+        # Read from the staged copy while pending
+        self.assertEqual(storage.get_step_files('start')['file'].read(), b'content')
+        storage.update_response(HttpResponse())
+
+        self.file_storage.gate.set()
+        storage = self.get_storage(request)
+        storage.wait_for_files(5)
+        self.assertNotIn(PENDING_FILES_KEY, storage.data)
+        file_dict = storage.data[storage.step_files_key]['start']['file']
+        self.assertEqual(file_dict['name'], 'file.txt')
+        with self.file_storage.open(file_dict['tmp_name']) as stored:
+            self.assertEqual(stored.read(), b'content')
+        # The status file is deleted once the state is saved
+        self.assertEqual(len(self.file_storage.listdir('wizard_file_status')[1]), 1)
+        storage.update_response(HttpResponse())
+        self.assertEqual(self.file_storage.listdir('wizard_file_status')[1], [])
+
+    def test_lost_state(self):
+        request = get_request()
+        storage = self.get_storage(request)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.update_response(HttpResponse())
+        task_id = storage.data[PENDING_FILES_KEY]['start']['file']['task']
+        self.file_storage.gate.set()
+        self.executor.get_task(task_id).done.wait(5)
+
+        # The request collecting the file fails before its state is saved
+        saved_state = copy.deepcopy(request.session[storage.prefix])
+        self.assertEqual(self.get_storage(request).get_step_files('start')['file'].read(), b'content')
+        request.session[storage.prefix] = saved_state
+        # and the next request is handled by another process
+        self.executor.forget(task_id)
+        storage = self.get_storage(request)
+        self.assertEqual(storage.get_step_files('start')['file'].read(), b'content')
+        self.assertNotIn(PENDING_FILES_KEY, storage.data)
+
+    def test_resolved_once(self):
+        storage = self.get_storage()
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        task_id = storage.data[PENDING_FILES_KEY]['start']['file']['task']
+        storage.get_step_files('start')
+        self.file_storage.gate.set()
+        self.executor.get_task(task_id).done.wait(5)
+        # Still pending in this request
+        storage.get_step_files('start')
+        self.assertIn(PENDING_FILES_KEY, storage.data)
+
+    def test_other_process(self):
+        storage = self.get_storage()
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        task_id = storage.data[PENDING_FILES_KEY]['start']['file']['task']
+        self.file_storage.gate.set()
+        self.executor.get_task(task_id).done.wait(5)
+        # The task isn't known to other processes, they read its status file
+        self.executor.forget(task_id)
+        self.assertEqual(storage.get_step_files('start')['file'].read(), b'content')
+        self.assertNotIn(PENDING_FILES_KEY, storage.data)
+
+    def test_failed(self):
+        self.file_storage.fail = True
+        self.file_storage.gate.set()
+        storage = self.get_storage()
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.wait_for_files(5)
+        self.assertEqual(storage.get_failed_files('start'), ['file'])
+        self.assertIsNone(storage.get_step_files('start'))
+
+        # Submitting the step again clears the failure
+        self.file_storage.fail = False
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        self.assertEqual(storage.get_failed_files('start'), [])
+
+    def test_timeout(self):
+        storage = self.get_storage()
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.wait_for_files(0.01)
+        self.assertEqual(storage.data[FAILED_FILES_KEY], {'start': ['file']})
+
+        # The copy is deleted when it's done
+        self.file_storage.gate.set()
+        self.executor.queue.join()
+        self.assertEqual(self.file_storage.listdir('')[1], [])
+
+    def test_backpressure(self):
+        storage = self.get_storage()
+        for step in ('step1', 'step2'):
+            storage.set_step_files(step, {'file': SimpleUploadedFile('file.txt', b'content')})
+        self.assertEqual(sorted(storage.data[PENDING_FILES_KEY].keys()), ['step1', 'step2'])
+
+        # The worker holds the first copy and the queue the second one, the
+        # third is copied in the request
+        storage.file_submit_timeout = 0
+        thread = threading.Thread(target=storage.set_step_files,
+                                  args=('step3', {'file': SimpleUploadedFile('file.txt', b'content')}))
+        thread.start()
+        self.file_storage.gate.set()
+        thread.join(5)
+        self.assertNotIn('step3', storage.data[PENDING_FILES_KEY])
+        self.assertIn('file', storage.data[storage.step_files_key]['step3'])
+
+    def test_reset(self):
+        storage = self.get_storage()
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.reset()
+        self.assertNotIn(PENDING_FILES_KEY, storage.data)
+        self.file_storage.gate.set()
+        self.executor.queue.join()
+        self.assertEqual(self.file_storage.listdir('')[1], [])
+
+
+@override_settings(ROOT_URLCONF='tests.wizard.test_persistence')
+class BackgroundFileViewTests(BackgroundFileTestMixin, TestCase):
+    def setUp(self):
+        super(BackgroundFileViewTests, self).setUp()
+        BackgroundWizard.file_storage = self.file_storage
+
+    def tearDown(self):
+        super(BackgroundFileViewTests, self).tearDown()
+        del BackgroundWizard.file_storage
+
+    def post(self, step, data=None):
+        return self.client.post('/wizard/%s/' % step, data or {}, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+
+    def submit(self):
+        response = self.post('start', {'name': 'joe', 'document': SimpleUploadedFile('doc.txt', b'document')})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        # The pending file is used for the state of the step
+        self.assertTrue(data['steps']['start']['valid'])
+        self.post('step2', {'name': 'other'})
+
+    def test_commit(self):
+        self.submit()
+        self.file_storage.gate.set()
+        response = self.post('commit')
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {
+            'content': 'document', 'file_name': 'doc.txt'})
+
+    def test_commit_failed(self):
+        self.submit()
+        self.file_storage.fail = True
+        self.file_storage.gate.set()
+        response = self.post('commit')
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['current_step'], 'start')
+        self.assertFalse(data['steps']['start']['valid'])
+        self.assertIn('could not be stored', data['steps']['start']['form'])
+
+
+class NameForm(forms.Form):
+    name = forms.CharField()
+
+
+class FailedFilesView(PendingFilesMixin):
+    def get_failed_files(self, step):
+        return ['form-0-document']
+
+
+class FileErrorTests(TestCase):
+    formset_data = {'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0', 'form-0-name': 'joe'}
+
+    def test_formset(self):
+        formset = forms.formset_factory(UploadWizard.form_list[0][1])(self.formset_data)
+        self.assertTrue(FailedFilesView().add_file_errors('start', [formset]))
+        self.assertFalse(formset.is_valid())
+        self.assertIn('could not be stored', ' '.join(formset.forms[0].errors['document']))
+
+    def test_formset_without_field(self):
+        formset = forms.formset_factory(NameForm)(self.formset_data)
+        self.assertTrue(FailedFilesView().add_file_errors('start', [formset]))
+        self.assertFalse(formset.is_valid())
+        self.assertIn('could not be stored', formset.non_form_errors()[0])
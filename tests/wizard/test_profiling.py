@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+
+from django import http
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from formtools_addons.wizard.profiling import get_profiler, get_profiling_config
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import TestWizard, get_request, Step1, Step2
+from .test_timing import get_json_request
+
+
+class ProfiledAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', Step1), ('step2', Step2)]
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse()
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profiling_settings(self, **config):
+        config.setdefault('DIRECTORY', self.directory)
+        config.setdefault('PROFILER', 'cprofile')
+        return override_settings(FORMTOOLS_ADDONS_PROFILING=config)
+
+    def get_contexts(self):
+        contexts = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                with io.open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    contexts.append(json.load(f))
+        return contexts
+
+    def test_config(self):
+        self.assertIsNone(get_profiling_config())
+        with override_settings(FORMTOOLS_ADDONS_PROFILING={'ENABLED': True}):
+            self.assertRaises(ImproperlyConfigured, get_profiling_config)
+        with self.profiling_settings(HEADER='X-Wizard-Profile'):
+            self.assertRaises(ImproperlyConfigured, get_profiling_config)
+        self.assertRaises(ImproperlyConfigured, get_profiler, 'unknown')
+
+    def test_profile_api_view(self):
+        view = ProfiledAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'data1'})
+        request.META['CONTENT_LENGTH'] = '10'
+        with self.profiling_settings(ENABLED=True):
+            response = view(request, step='start')
+        self.assertEqual(response.status_code, 200)
+
+        contexts = self.get_contexts()
+        self.assertEqual(len(contexts), 1)
+        context = contexts[0]
+        self.assertEqual(context['wizard'], 'tests.wizard.test_profiling.ProfiledAPIWizard')
+        self.assertEqual(context['step'], 'start')
+        self.assertEqual(context['current_step'], 'step2')
+        self.assertEqual(context['num_steps'], 2)
+        self.assertEqual(context['request_bytes'], 10)
+        self.assertEqual(context['response_bytes'], len(response.content))
+        self.assertEqual(context['storage'], 'formtools.wizard.storage.session.SessionStorage')
+        self.assertEqual(context['profiler'], 'cprofile')
+
+        stats = pstats.Stats(os.path.join(self.directory, context['profile']))
+        self.assertTrue(stats.total_calls > 0)
+
+    def test_header(self):
+        view = ProfiledAPIWizard.as_view(url_name='wizard_step')
+        with self.profiling_settings(HEADER='X-Wizard-Profile', SECRET='s3cret'):
+            view(get_json_request(), step='data')
+            self.assertEqual(self.get_contexts(), [])
+
+            # The header has to send the secret
+            request = get_json_request()
+            request.META['HTTP_X_WIZARD_PROFILE'] = '1'
+            view(request, step='data')
+            self.assertEqual(self.get_contexts(), [])
+
+            request = get_json_request()
+            request.META['HTTP_X_WIZARD_PROFILE'] = 's3cret'
+            view(request, step='data')
+        self.assertEqual(len(self.get_contexts()), 1)
+
+    def test_rate(self):
+        view = ProfiledAPIWizard.as_view(url_name='wizard_step')
+        with self.profiling_settings(ENABLED=True, RATE=0):
+            for i in range(5):
+                view(get_json_request(), step='data')
+        self.assertEqual(self.get_contexts(), [])
+
+    def test_profile_template_response(self):
+        view = TestWizard.as_view([('start', Step1), ('step2', Step2)])
+        with self.profiling_settings(ENABLED=True):
+            response, instance = view(get_request())
+            self.assertEqual(self.get_contexts(), [])
+            response.render()
+
+        context = self.get_contexts()[0]
+        self.assertEqual(context['wizard'], 'tests.wizard.test_forms.TestWizard')
+        self.assertEqual(context['current_step'], 'start')
+        self.assertEqual(context['response_bytes'], len(response.content))
@@ -0,0 +1,155 @@
+from __future__ import unicode_literals
+
+from django import forms, http
+from django.forms.formsets import formset_factory
+from django.test import TestCase
+from django.utils import translation
+
+from formtools_addons.wizard import rendering
+from formtools_addons.wizard.rendering import render_as_p
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import Step1, Step2, TestWizard, get_request
+
+
+class SimpleForm(forms.Form):
+    name = forms.CharField(help_text='Your <b>full</b> name')
+    age = forms.IntegerField(required=False, label='Age?')
+    email = forms.EmailField(label='')
+    token = forms.CharField(widget=forms.HiddenInput)
+
+
+class ChoicesForm(forms.Form):
+    color = forms.ChoiceField(choices=[('r', 'Red'), ('g', 'Green')], widget=forms.RadioSelect)
+    sizes = forms.MultipleChoiceField(choices=[('s', 'S'), ('m', 'M')], widget=forms.CheckboxSelectMultiple,
+                                      required=False)
+    when = forms.SplitDateTimeField(required=False)
+    notes = forms.CharField(widget=forms.Textarea(attrs={'id': 'custom-notes'}), label='Notes & <remarks>')
+    accept = forms.BooleanField(label_suffix='!')
+
+
+class StyledForm(SimpleForm):
+    error_css_class = 'error'
+    required_css_class = 'required'
+
+    def clean(self):
+        cleaned_data = super(StyledForm, self).clean()
+        if cleaned_data.get('name') == 'invalid':
+            raise forms.ValidationError('Form <level> error')
+        return cleaned_data
+
+
+class HiddenOnlyForm(forms.Form):
+    first = forms.CharField(widget=forms.HiddenInput)
+    second = forms.CharField(widget=forms.HiddenInput, required=False)
+
+    def clean(self):
+        raise forms.ValidationError('Always invalid')
+
+
+class HiddenLastForm(StyledForm):
+    def __init__(self, *args, **kwargs):
+        super(HiddenLastForm, self).__init__(*args, **kwargs)
+        self.fields['name'].widget = forms.HiddenInput()
+
+
+class CustomAsPForm(SimpleForm):
+    def as_p(self):
+        return 'custom'
+
+
+class RenderAsPTests(TestCase):
+    def setUp(self):
+        rendering.layout_cache.clear()
+
+    def assertRendersAsP(self, form_class, *args, **kwargs):
+        # as_p() adds the errors of hidden fields to the form's non field
+        # errors, so every render gets a new form. The first render compiles
+        # the layout, the second one uses it.
+        for i in range(2):
+            self.assertEqual(render_as_p(form_class(*args, **kwargs)), form_class(*args, **kwargs).as_p())
+
+    def test_unbound(self):
+        for form_class in (SimpleForm, ChoicesForm, StyledForm, HiddenOnlyForm, HiddenLastForm, Step1):
+            self.assertRendersAsP(form_class)
+            self.assertRendersAsP(form_class, prefix='step')
+            self.assertRendersAsP(form_class, auto_id=False)
+            self.assertRendersAsP(form_class, auto_id='field_%s', label_suffix=' ->')
+            self.assertRendersAsP(form_class, initial={'name': 'a "quoted" <name>', 'color': 'g'})
+
+    def test_bound(self):
+        data_sets = [
+            {},
+            {'name': 'joe', 'age': 'x', 'email': 'invalid', 'token': ''},
+            {'name': 'joe', 'age': '3', 'email': 'joe@example.com', 'token': 't'},
+            {'name': 'invalid', 'age': '3', 'email': 'joe@example.com', 'token': 't'},
+            {'name': '<script>', 'color': 'x', 'sizes': ['m'], 'when_0': '2015-01-01', 'notes': 'n'},
+            {'first': 'a'},
+        ]
+        for form_class in (SimpleForm, ChoicesForm, StyledForm, HiddenOnlyForm, HiddenLastForm):
+            for data in data_sets:
+                self.assertRendersAsP(form_class, data)
+                self.assertRendersAsP(form_class, dict(('form-' + key, value) for key, value in data.items()),
+                                      prefix='form')
+
+    def test_changed_fields(self):
+        def changed_form():
+            form = SimpleForm({'name': ''})
+            form.fields['name'].label = 'Changed'
+            form.fields['age'].required = True
+            del form.fields['email']
+            return form
+
+        self.assertRendersAsP(SimpleForm, {'name': ''})
+        self.assertRendersAsP(changed_form)
+        self.assertEqual(len(rendering.layout_cache), 2)
+
+    def test_language(self):
+        self.assertRendersAsP(SimpleForm, {})
+        with translation.override('de'):
+            self.assertRendersAsP(SimpleForm, {})
+        self.assertEqual(len(rendering.layout_cache), 2)
+
+    def test_formset(self):
+        def get_forms():
+            return formset_factory(StyledForm, extra=2)({
+                'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '0',
+                'form-0-name': 'joe', 'form-1-age': 'x',
+            }).forms
+
+        for i in range(2):
+            self.assertRendersAsP(lambda: get_forms()[i])
+        self.assertEqual(len(rendering.layout_cache), 2)
+
+    def test_custom_as_p(self):
+        self.assertEqual(render_as_p(CustomAsPForm()), 'custom')
+        self.assertEqual(len(rendering.layout_cache), 0)
+
+
+class CompiledAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', SimpleForm), ('step2', Step2)]
+    compiled_renderer = True
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse()
+
+
+class CompiledRendererViewTests(TestCase):
+    def test_wizard_api_view(self):
+        instance = CompiledAPIWizard(**CompiledAPIWizard.get_initkwargs(url_name='wizard_step'))
+        form = SimpleForm({'name': 'joe'})
+        self.assertEqual(instance.render_form('start', form), form.as_p())
+
+    def test_template(self):
+        form_list = [('start', StyledForm), ('step2', (('form1', Step1), ('form2', Step2)))]
+        data = {'test_wizard-current_step': 'start', 'start-name': ''}
+        request = get_request(data)
+        request.META['HTTP_X_WIZARD_FRAGMENT'] = '1'
+        response, instance = TestWizard.as_view(form_list)(request)
+        expected = response.render().content
+        self.assertIn(b'errorlist', expected)
+
+        response, instance = TestWizard.as_view(form_list, compiled_renderer=True)(request)
+        self.assertTrue(response.context_data['wizard']['compiled_renderer'])
+        self.assertEqual(response.render().content, expected)
@@ -0,0 +1,141 @@
+from __future__ import unicode_literals
+
+from django import forms, http
+from django.core.cache import caches
+from django.test import TestCase
+
+from formtools_addons.wizard.stamps import STAMPS_KEY
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import TestWizard, get_request
+from .test_timing import get_json_request
+
+clean_calls = []
+
+
+class CountingForm(forms.Form):
+    name = forms.CharField()
+
+    def clean_name(self):
+        clean_calls.append(self.__class__.__name__)
+        return self.cleaned_data['name'].upper()
+
+
+class OtherCountingForm(CountingForm):
+    pass
+
+
+class TimeDependentForm(CountingForm):
+    validation_time_dependent = True
+
+
+class StampWizard(TestWizard):
+    def done(self, form_list, form_dict, **kwargs):
+        self.done_data = [dict((name, form.cleaned_data) for name, form in forms.items())
+                          if isinstance(forms, dict) else forms.cleaned_data for forms in form_list]
+        return http.HttpResponse()
+
+
+class StampAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', CountingForm), ('step2', TimeDependentForm)]
+    validation_stamps = True
+
+    def done(self, form_list, **kwargs):
+        return http.JsonResponse(dict((form.__class__.__name__, form.cleaned_data) for form in form_list))
+
+
+class StampTestMixin(object):
+    def setUp(self):
+        del clean_calls[:]
+        caches['default'].clear()
+
+
+class MultipleFormWizardViewStampTests(StampTestMixin, TestCase):
+    def run_wizard(self, form_list, **initkwargs):
+        view = StampWizard.as_view(form_list, **initkwargs)
+        request = get_request({'stamp_wizard-current_step': 'start', 'start-name': 'first'})
+        response, instance = view(request)
+        self.assertEqual(instance.steps.current, 'step2')
+
+        request.POST = {'stamp_wizard-current_step': 'step2', 'step2-form1-name': 'second',
+                        'step2-form2-name': 'third'}
+        response, instance = view(request)
+        return instance
+
+    def test_skip_revalidation(self):
+        instance = self.run_wizard([
+            ('start', CountingForm),
+            ('step2', (('form1', CountingForm), ('form2', OtherCountingForm))),
+        ], validation_stamps=True)
+        self.assertEqual(instance.done_data, [
+            {'name': 'FIRST'},
+            {'form1': {'name': 'SECOND'}, 'form2': {'name': 'THIRD'}},
+        ])
+        # start was validated once when posted, step2 when posted and then stamped
+        self.assertEqual(clean_calls, ['CountingForm', 'CountingForm', 'OtherCountingForm'])
+
+    def test_disabled(self):
+        instance = self.run_wizard([
+            ('start', CountingForm),
+            ('step2', (('form1', CountingForm), ('form2', OtherCountingForm))),
+        ])
+        self.assertEqual(len(clean_calls), 6)
+        self.assertNotIn(STAMPS_KEY, instance.storage.data)
+
+    def test_time_dependent(self):
+        self.run_wizard([
+            ('start', CountingForm),
+            ('step2', (('form1', CountingForm), ('form2', TimeDependentForm))),
+        ], validation_stamps=True)
+        self.assertEqual(clean_calls.count('TimeDependentForm'), 2)
+        self.assertEqual(clean_calls.count('CountingForm'), 3)
+
+
+class WizardAPIViewStampTests(StampTestMixin, TestCase):
+    def test_skip_revalidation(self):
+        view = StampAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'first'})
+        view(request, step='start')
+        request.POST = {'name': 'second'}
+        view(request, step='step2')
+        # time dependent forms aren't stamped
+        stamps = request.session['wizard_stamp_api_wizard'][STAMPS_KEY]
+        self.assertEqual(list(stamps.keys()), ['start'])
+
+        del clean_calls[:]
+        request.POST = {}
+        response = view(request, step='commit')
+        self.assertEqual(response.status_code, 200)
+        # only the time dependent step is validated again
+        self.assertEqual(clean_calls, ['TimeDependentForm'])
+
+    def test_changed_data(self):
+        view = StampAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'first'})
+        view(request, step='start')
+        request.POST = {'name': 'second'}
+        view(request, step='step2')
+
+        # stored data changed after it was stamped
+        request.session['wizard_stamp_api_wizard']['step_data']['start'] = {'name': ['changed']}
+        del clean_calls[:]
+        request.POST = {}
+        view(request, step='commit')
+        self.assertEqual(clean_calls, ['CountingForm', 'TimeDependentForm'])
+
+    def test_version(self):
+        view = StampAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'first'})
+        view(request, step='start')
+        request.POST = {'name': 'second'}
+        view(request, step='step2')
+
+        CountingForm.validation_version = '2'
+        try:
+            del clean_calls[:]
+            request.POST = {}
+            view(request, step='commit')
+        finally:
+            del CountingForm.validation_version
+        self.assertEqual(clean_calls, ['CountingForm', 'TimeDependentForm'])
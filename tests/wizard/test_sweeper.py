@@ -0,0 +1,168 @@
+from __future__ import unicode_literals
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from formtools_addons.wizard.files import FileManifest, FileSweeper
+from formtools_addons.wizard.storage import (
+    FILE_MANIFEST_KEY, ContentAddressedSessionStorage, ManifestCookieStorage, ManifestSessionStorage)
+from formtools_addons.wizard.uploads import UPLOADS_KEY
+
+from .storage import get_request, temp_storage
+from .test_contentaddressedstorage import FileStorageTestMixin
+from .test_errorlog import Clock
+
+HOUR = 3600
+
+
+class SweeperTestMixin(FileStorageTestMixin):
+    def setUp(self):
+        super(SweeperTestMixin, self).setUp()
+        self.clock = Clock()
+        self.clock.now = 100 * HOUR
+        self.sleeps = []
+        self.manifest_clock = FileManifest.__dict__['clock']
+        FileManifest.clock = self.clock
+
+    def tearDown(self):
+        FileManifest.clock = self.manifest_clock
+        super(SweeperTestMixin, self).tearDown()
+
+    def get_sweeper(self, **kwargs):
+        sweeper = FileSweeper(self.file_storage, 24 * HOUR, **kwargs)
+        sweeper.clock = self.clock
+        sweeper.sleep = self.sleeps.append
+        return sweeper
+
+    def store_files(self, storage_class=ManifestSessionStorage, *contents):
+        storage = storage_class('wizard1', get_request(), self.file_storage)
+        for i, content in enumerate(contents):
+            storage.set_step_files('step%d' % i, {'file': SimpleUploadedFile('file%d.txt' % i, content)})
+        storage.update_response(HttpResponse())
+        return storage
+
+
+class ManifestStorageTests(SweeperTestMixin, TestCase):
+    def test_manifest(self):
+        storage = self.store_files(ManifestSessionStorage, b'one', b'two')
+        bucket, checksum = storage.data[FILE_MANIFEST_KEY]
+        self.assertEqual(bucket, '%d' % (100 * HOUR))
+        manifest = storage.get_file_manifest()
+        self.assertEqual(manifest.read(bucket, storage.get_file_owner()), storage.get_file_names())
+
+        # Unchanged within the bucket
+        saved = len(self.file_storage.saved)
+        storage.update_response(HttpResponse())
+        self.assertEqual(len(self.file_storage.saved), saved)
+
+        # Moved to the current bucket
+        self.clock.now += HOUR
+        storage.update_response(HttpResponse())
+        self.assertEqual(storage.data[FILE_MANIFEST_KEY][0], '%d' % (101 * HOUR))
+        self.assertEqual(manifest.get_owners(bucket), [])
+        self.assertEqual(manifest.get_owners('%d' % (101 * HOUR)), [storage.get_file_owner()])
+
+    def test_reset(self):
+        storage = self.store_files(ManifestCookieStorage, b'one')
+        manifest = storage.get_file_manifest()
+        bucket = storage.data[FILE_MANIFEST_KEY][0]
+        storage.reset()
+        storage.update_response(HttpResponse())
+        self.assertEqual(manifest.get_owners(bucket), [])
+        self.assertNotIn(FILE_MANIFEST_KEY, storage.data)
+
+
+class FileSweeperTests(SweeperTestMixin, TestCase):
+    def test_sweep(self):
+        abandoned = self.store_files(ManifestSessionStorage, b'one', b'two')
+        abandoned_names = abandoned.get_file_names()
+        blobs = self.store_files(ContentAddressedSessionStorage, b'shared', b'blob')
+        self.clock.now += 12 * HOUR
+        active = self.store_files(ContentAddressedSessionStorage, b'shared')
+
+        self.clock.now += 20 * HOUR
+        stats = self.get_sweeper().sweep()
+        self.assertEqual((stats.manifests, stats.files, stats.errors), (2, 4, 0))
+        for name in abandoned_names:
+            self.assertFalse(self.file_storage.exists(name))
+        # The shared blob is still referenced by the active wizard
+        shared_name, = active.get_file_names()
+        self.assertIn(shared_name, blobs.get_file_names())
+        for name in blobs.get_file_names():
+            self.assertEqual(self.file_storage.exists(name), name == shared_name)
+
+        stats = self.get_sweeper().sweep()
+        self.assertEqual((stats.manifests, stats.files), (0, 0))
+
+    def test_sweep_uploads(self):
+        storage = ManifestSessionStorage('wizard1', get_request(), self.file_storage)
+        storage.data[UPLOADS_KEY] = {'upload1': {'location': 'wizard_uploads/upload1'}}
+        for offset in ('0000', '0010'):
+            self.file_storage.save('wizard_uploads/upload1/%s' % offset, ContentFile(b'chunk'))
+        storage.update_response(HttpResponse())
+        self.assertEqual(storage.get_file_names(), ['wizard_uploads/upload1/'])
+
+        self.clock.now += 48 * HOUR
+        stats = self.get_sweeper().sweep()
+        self.assertEqual((stats.manifests, stats.files, stats.errors), (1, 1, 0))
+        self.assertEqual(self.file_storage.listdir('wizard_uploads/upload1')[1], [])
+
+    def test_reset_uploads(self):
+        storage = ManifestSessionStorage('wizard1', get_request(), self.file_storage)
+        storage.data[UPLOADS_KEY] = {'upload1': {'location': 'wizard_uploads/upload1'}}
+        self.file_storage.save('wizard_uploads/upload1/0000', ContentFile(b'chunk'))
+        storage.update_response(HttpResponse())
+        storage.reset()
+        storage.update_response(HttpResponse())
+        self.assertEqual(self.file_storage.listdir('wizard_uploads/upload1')[1], [])
+
+    def test_only_wizard_files(self):
+        storage = self.store_files(ManifestSessionStorage, b'one')
+        self.assertTrue(storage.get_file_names()[0].startswith('wizard_files/'))
+        self.file_storage.save('victim.txt', ContentFile(b'victim'))
+        manifest = storage.get_file_manifest()
+        names = ['victim.txt', 'wizard_files/../victim.txt', '/victim.txt', 'wizard_blobs']
+        manifest.write(manifest.get_bucket(), 'forged', names)
+
+        self.clock.now += 48 * HOUR
+        stats = self.get_sweeper().sweep()
+        self.assertEqual((stats.manifests, stats.files, stats.errors), (2, 1, 4))
+        self.assertTrue(self.file_storage.exists('victim.txt'))
+        self.assertEqual(manifest.get_owners(manifest.get_bucket(100 * HOUR)), [])
+
+    def test_dry_run(self):
+        storage = self.store_files(ManifestSessionStorage, b'one')
+        self.clock.now += 48 * HOUR
+        stats = self.get_sweeper(dry_run=True).sweep()
+        self.assertEqual((stats.manifests, stats.files), (1, 1))
+        self.assertTrue(self.file_storage.exists(storage.get_file_names()[0]))
+
+    def test_batches(self):
+        for i in range(5):
+            self.store_files(ManifestSessionStorage, b'one', b'two')
+        self.clock.now += 48 * HOUR
+        sweeper = self.get_sweeper(batch_size=4, rate=2)
+        self.assertEqual([len(batch) for batch in sweeper.get_batches()], [2, 2, 1])
+        stats = sweeper.sweep()
+        self.assertEqual(stats.files, 10)
+        self.assertEqual(self.sleeps, [2.0, 2.0, 1.0])
+
+    def test_command(self):
+        storage = ManifestSessionStorage('wizard1', get_request(), temp_storage)
+        storage.set_step_files('start', {'file': SimpleUploadedFile('file.txt', b'content')})
+        storage.update_response(HttpResponse())
+        name, = storage.get_file_names()
+
+        self.clock.now += HOUR
+        stdout = StringIO()
+        call_command('sweep_wizard_files', storage='tests.wizard.storage.temp_storage', max_age=0,
+                     dry_run=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Would delete 1 files of 1 abandoned wizards (0 errors)')
+        self.assertTrue(temp_storage.exists(name))
+
+        storage.reset()
+        storage.update_response(HttpResponse())
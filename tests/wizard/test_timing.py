@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+from django import http
+from django.test import TestCase
+from formtools.wizard.views import WizardView
+
+from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.wizard.timing import (
+    NULL_PHASE, PhaseTimer, format_server_timing, register_timing_callback, unregister_timing_callback)
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import TestWizard, get_request, Step1, Step2
+
+
+class TimedAPIWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', Step1), ('step2', Step2)]
+    server_timing = True
+
+    def done(self, form_list, **kwargs):
+        return http.HttpResponse()
+
+
+class TimedWizard(TestWizard):
+    server_timing = True
+
+
+class DispatchMixin(WizardView):
+    def dispatch(self, request, *args, **kwargs):
+        self.dispatched = True
+        return super(DispatchMixin, self).dispatch(request, *args, **kwargs)
+
+
+class TimedDispatchWizard(TimedWizard, DispatchMixin):
+    pass
+
+
+def get_json_request(*args, **kwargs):
+    request = get_request(*args, **kwargs)
+    request.META['HTTP_ACCEPT'] = HTTP_APPLICATION_JSON
+    return request
+
+
+def parse_server_timing(header):
+    timings = {}
+    for item in header.split(', '):
+        name, duration = item.split(';dur=')
+        timings[name] = float(duration)
+    return timings
+
+
+class PhaseTimerTests(TestCase):
+    def test_nested_phases(self):
+        timer = PhaseTimer()
+        with timer.phase('outer'):
+            with timer.phase('inner'):
+                pass
+            # re-entering a phase doesn't count it twice
+            with timer.phase('outer'):
+                pass
+        timer.add('inner', 1.0)
+
+        timings = timer.get_timings()
+        self.assertEqual(list(timings.keys()), ['inner', 'outer', 'total'])
+        self.assertTrue(timings['inner'] >= 1.0)
+        self.assertTrue(timings['outer'] < 1.0)
+
+    def test_format_server_timing(self):
+        self.assertEqual(format_server_timing({'forms': 0.0015}), 'forms;dur=1.500')
+
+
+class WizardAPIViewTimingTests(TestCase):
+    def test_server_timing_header(self):
+        view = TimedAPIWizard.as_view(url_name='wizard_step')
+        request = get_json_request({'name': 'data1'})
+        response = view(request, step='start')
+        self.assertEqual(response.status_code, 200)
+
+        timings = parse_server_timing(response['Server-Timing'])
+        for phase in ('storage_load', 'forms', 'is_valid', 'conditions', 'render_form',
+                      'render_preview', 'json', 'storage_save', 'total'):
+            self.assertIn(phase, timings)
+
+    def test_disabled(self):
+        view = TimedAPIWizard.as_view(url_name='wizard_step', server_timing=False)
+        response = view(get_json_request(), step='data')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        instance = TimedAPIWizard(server_timing=False)
+        self.assertIs(instance.time_phase('forms'), NULL_PHASE)
+
+    def test_callback(self):
+        calls = []
+
+        def callback(view, timings):
+            calls.append((view, timings))
+
+        register_timing_callback(callback)
+        try:
+            view = TimedAPIWizard.as_view(url_name='wizard_step', server_timing=False)
+            response = view(get_json_request(), step='data')
+        finally:
+            unregister_timing_callback(callback)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(len(calls), 1)
+        self.assertIsInstance(calls[0][0], TimedAPIWizard)
+        self.assertIn('json', calls[0][1])
+
+
+class MultipleFormWizardViewTimingTests(TestCase):
+    def test_server_timing_header(self):
+        view = TimedWizard.as_view([('start', Step1), ('step2', Step2)])
+        request = get_request()
+        response, instance = view(request)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        response.render()
+        timings = parse_server_timing(response['Server-Timing'])
+        for phase in ('storage_load', 'forms', 'conditions', 'render', 'storage_save', 'total'):
+            self.assertIn(phase, timings)
+
+        request = get_request({'timed_wizard-current_step': 'start', 'start-name': 'data1'})
+        response, instance = view(request)
+        response.render()
+        timings = parse_server_timing(response['Server-Timing'])
+        self.assertIn('is_valid', timings)
+
+    def test_dispatch_of_bases(self):
+        # The dispatch() of the bases after the timing mixin is used too
+        view = TimedDispatchWizard.as_view([('start', Step1), ('step2', Step2)])
+        response, instance = view(get_request())
+        self.assertTrue(instance.dispatched)
+        response.render()
+        self.assertIn('storage_load', parse_server_timing(response['Server-Timing']))
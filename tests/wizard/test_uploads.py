@@ -0,0 +1,191 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import shutil
+import tempfile
+
+from django import forms, http
+from django.conf.urls import url
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils.http import urlquote
+
+from formtools_addons.enums import HTTP_APPLICATION_JSON
+from formtools_addons.wizard.uploads import UPLOADS_KEY
+from formtools_addons.wizard.views import WizardAPIView
+
+from .test_forms import Step2
+
+upload_storage = FileSystemStorage(location=tempfile.mkdtemp())
+
+
+class UploadForm(forms.Form):
+    name = forms.CharField()
+    document = forms.FileField()
+
+
+class UploadWizard(WizardAPIView):
+    storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    form_list = [('start', UploadForm), ('step2', Step2)]
+    file_storage = upload_storage
+    upload_step_name = 'upload'
+    finalize_step_name = 'finalize'
+    file_step_name = 'file'
+    upload_chunk_max_size = 10
+
+    def done(self, form_list, **kwargs):
+        form = list(form_list)[0]
+        return http.JsonResponse({'content': form.cleaned_data['document'].read().decode('utf-8'),
+                                  'file_name': form.cleaned_data['document'].name})
+
+
+upload_wizard = UploadWizard.as_view(url_name='upload_wizard_step')
+
+urlpatterns = [
+    url(r'^wizard/(?P<step>[^/]+)/(?P<substep>[^/]+)/$', upload_wizard, name='upload_wizard_step'),
+    url(r'^wizard/(?P<step>[^/]+)/$', upload_wizard, name='upload_wizard_step'),
+]
+
+
+def checksum(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+@override_settings(ROOT_URLCONF='tests.wizard.test_uploads')
+class ChunkedUploadTests(TestCase):
+    content = b'first chunk|second chunk|last'
+
+    def tearDown(self):
+        shutil.rmtree(upload_storage.location, ignore_errors=True)
+
+    def post_chunk(self, query, chunk, **extra):
+        return self.client.post('/wizard/upload/start/?%s' % query, data=chunk,
+                                content_type='application/octet-stream', HTTP_ACCEPT=HTTP_APPLICATION_JSON, **extra)
+
+    def upload(self, content):
+        upload_id = None
+        for offset in range(0, len(content), 10):
+            chunk = content[offset:offset + 10]
+            if upload_id is None:
+                query = 'field=document&name=doc.txt&checksum=%s' % checksum(chunk)
+            else:
+                query = 'upload_id=%s&offset=%d&checksum=%s' % (upload_id, offset, checksum(chunk))
+            response = self.post_chunk(query, chunk)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = json.loads(response.content.decode('utf-8'))
+            upload_id = data['upload_id']
+            self.assertEqual(data['offset'], offset + len(chunk))
+        return upload_id
+
+    def finalize(self, upload_id, content):
+        return self.client.post('/wizard/finalize/start/?upload_id=%s&checksum=%s' % (upload_id, checksum(content)),
+                                HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+
+    def test_upload(self):
+        upload_id = self.upload(self.content)
+        response = self.finalize(upload_id, self.content)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['size'], len(self.content))
+        self.assertEqual(self.client.session['wizard_upload_wizard'][UPLOADS_KEY], {})
+        # The chunks are deleted
+        self.assertEqual(upload_storage.listdir('wizard_uploads/%s' % upload_id)[1], [])
+
+        # The file is bound to the field when the step is submitted
+        response = self.client.post('/wizard/start/', {'name': 'joe'}, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['current_step'], 'step2')
+        self.client.post('/wizard/step2/', {'name': 'other'}, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+
+        response = self.client.post('/wizard/commit/', HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {
+            'content': self.content.decode('utf-8'), 'file_name': 'doc.txt'})
+
+    def test_resume(self):
+        response = self.post_chunk('field=document', self.content[:10])
+        upload_id = json.loads(response.content.decode('utf-8'))['upload_id']
+
+        # A chunk at the wrong offset is refused with the offset to resume at
+        response = self.post_chunk('upload_id=%s&offset=20' % upload_id, self.content[20:30])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['offset'], 10)
+
+        response = self.client.get('/wizard/upload/start/?upload_id=%s' % upload_id,
+                                   HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'upload_id': upload_id, 'offset': 10})
+
+        for offset in (10, 20):
+            response = self.post_chunk('upload_id=%s&offset=%d' % (upload_id, offset),
+                                       self.content[offset:offset + 10])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.finalize(upload_id, self.content).status_code, 200)
+
+    def test_lost_state(self):
+        response = self.post_chunk('field=document', self.content[:10])
+        upload_id = json.loads(response.content.decode('utf-8'))['upload_id']
+        state = self.client.session['wizard_upload_wizard']
+        for offset in (10, 20):
+            self.post_chunk('upload_id=%s&offset=%d' % (upload_id, offset), self.content[offset:offset + 10])
+
+        # The stored chunks are sent again after the state was lost, in
+        # chunks of another size
+        session = self.client.session
+        session['wizard_upload_wizard'] = state
+        session.save()
+        for start, end in ((10, 15), (15, 25), (25, 29)):
+            response = self.post_chunk('upload_id=%s&offset=%d' % (upload_id, start), self.content[start:end])
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.finalize(upload_id, self.content).status_code, 200)
+        self.assertEqual(upload_storage.listdir('wizard_uploads/%s' % upload_id)[1], [])
+
+    def test_name_without_directories(self):
+        for name, expected in (('../../wizard_manifests/0/evil', 'evil'), ('a\\b/../c.txt', 'c.txt'),
+                               ('..', 'document')):
+            response = self.post_chunk('field=document&name=%s' % urlquote(name), self.content[:10])
+            upload_id = json.loads(response.content.decode('utf-8'))['upload_id']
+            response = self.finalize(upload_id, self.content[:10])
+            self.assertEqual(response.status_code, 200)
+            file_dict = self.client.session['wizard_upload_wizard']['step_files']['start']['document']
+            self.assertEqual(file_dict['name'], expected)
+            self.assertEqual(file_dict['tmp_name'], 'wizard_uploads/%s/file/%s' % (upload_id, expected))
+
+    def test_max_size(self):
+        UploadWizard.upload_max_size = 15
+        try:
+            upload_id = self.upload(self.content[:10])
+            response = self.post_chunk('upload_id=%s&offset=10' % upload_id, self.content[10:20])
+            self.assertEqual(response.status_code, 413)
+        finally:
+            del UploadWizard.upload_max_size
+
+    def test_invalid_chunk(self):
+        response = self.post_chunk('field=document&checksum=%s' % checksum(b'other'), self.content[:10])
+        self.assertEqual(response.status_code, 400)
+        upload_id, = self.client.session['wizard_upload_wizard'][UPLOADS_KEY].keys()
+        self.assertEqual(self.client.session['wizard_upload_wizard'][UPLOADS_KEY][upload_id]['offset'], 0)
+
+        self.assertEqual(self.post_chunk('field=document', b'x' * 11).status_code, 413)
+        self.assertEqual(self.post_chunk('field=name', b'x').status_code, 400)
+        self.assertEqual(self.post_chunk('upload_id=unknown', b'x').status_code, 404)
+
+    def test_checksum_mismatch(self):
+        upload_id = self.upload(self.content)
+        response = self.finalize(upload_id, b'other')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('start', self.client.session['wizard_upload_wizard']['step_files'])
+
+        # The upload can still be finalized
+        self.assertEqual(self.finalize(upload_id, self.content).status_code, 200)
+
+    def test_replaced_by_posted_file(self):
+        upload_id = self.upload(self.content)
+        self.finalize(upload_id, self.content)
+
+        response = self.client.post('/wizard/start/', {
+            'name': 'joe', 'document': SimpleUploadedFile('posted.txt', b'posted'),
+        }, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(response.status_code, 200)
+        self.client.post('/wizard/step2/', {'name': 'other'}, HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        response = self.client.post('/wizard/commit/', HTTP_ACCEPT=HTTP_APPLICATION_JSON)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['content'], 'posted')
@@ -87,6 +87,8 @@ def show_page2_step2(wizard):
 
 class ComplexNamedSubStepContactWizardAPIView(WizardAPIView):
     storage_name = 'formtools.wizard.storage.session.SessionStorage'
+    peek_step_name = 'peek'
+    sync_step_name = 'sync'
     form_list = (
         ('page1', (
             ('step1.1', Page1),
@@ -11,6 +11,9 @@ from django.test.utils import override_settings
 from formtools_addons.enums import HTTP_APPLICATION_JSON
 from formtools_addons.wizard.views.wizardapi import WizardAPIView
 
+from ..test_timing import get_json_request
+from .forms import ContactWizardAPIView, Page1, Page2
+
 
 @override_settings(
     ROOT_URLCONF='tests.wizard.wizardapitests.urls',
@@ -540,6 +543,139 @@ class WizardAPITests(TestCase):
 
         assert response.status_code == 302
 
+    ####################################################################################################################
+    # Step versions
+    ####################################################################################################################
+    def test_step_versions(self):
+        response = self.client.get(reverse('wizard_step', kwargs={'step': 'data'}), **self.DEFAULT_HEADERS)
+        steps = self._get_response_data(response)['steps']
+        assert 'X-Wizard-Step-Versions' in response['Vary']
+        assert steps['0']['version'] != steps['1']['version']
+
+        # The HTML of the steps held by the client at their version is left out
+        versions = '%s:%s,%s:outdated' % (steps['0']['form_id'], steps['0']['version'], steps['1']['form_id'])
+        response = self.client.get(reverse('wizard_step', kwargs={'step': 'data'}),
+                                   HTTP_X_WIZARD_STEP_VERSIONS=versions, **self.DEFAULT_HEADERS)
+        cached_steps = self._get_response_data(response)['steps']
+        assert cached_steps['0']['cached'] is True
+        assert 'form' not in cached_steps['0']
+        assert cached_steps['0']['version'] == steps['0']['version']
+        assert 'cached' not in cached_steps['1']
+        assert cached_steps['1']['form'] == steps['1']['form']
+
+        # The version changes with the HTML
+        response = self.client.post(reverse('wizard_step', kwargs={'step': '0'}), {'name': 'test'},
+                                    HTTP_X_WIZARD_STEP_VERSIONS=versions, **self.DEFAULT_HEADERS)
+        changed_steps = self._get_response_data(response)['steps']
+        assert changed_steps['0']['version'] != steps['0']['version']
+        assert 'form' in changed_steps['0']
+
+    def test_step_versions_clean_state_data(self):
+        class CleaningWizard(ContactWizardAPIView):
+            def clean_state_data(self, data):
+                # The HTML of every step is available to clean_state_data()
+                for step_data in data['steps'].values():
+                    step_data['form_length'] = len(step_data['form'])
+                    # and can leave parts of it out
+                    del step_data['preview']
+                return data
+
+        view = CleaningWizard.as_view(url_name='wizard_step')
+        request = get_json_request()
+        steps = json.loads(view(request, step='data').content.decode('utf-8'))['steps']
+
+        request.META['HTTP_X_WIZARD_STEP_VERSIONS'] = '%s:%s' % (steps['0']['form_id'], steps['0']['version'])
+        response = view(request, step='data')
+        assert response.status_code == 200
+        cached_steps = self._get_response_data(response)['steps']
+        assert cached_steps['0']['cached'] is True
+        assert 'form' not in cached_steps['0']
+        assert cached_steps['0']['form_length'] == steps['0']['form_length']
+
+    def _complex_url(self, step, substep=None):
+        kwargs = {'step': step}
+        if substep:
+            kwargs['substep'] = substep
+        return reverse('complex_named_substep_wizard_step', kwargs=kwargs)
+
+    def test_peek(self):
+        self.client.post(self._complex_url('goto', 'page1|step1.2'), **self.DEFAULT_HEADERS)
+        response = self.client.get(self._complex_url('peek'), **self.DEFAULT_HEADERS)
+        assert response.status_code == 200
+        data = self._get_response_data(response)
+        assert data['step'] == 'page1|step1.3'
+        assert data['current_step'] == 'page1|step1.2'
+        assert data['data']['valid'] is False
+        assert 'form' in data['data']
+
+        # The current step isn't changed
+        response = self.client.get(self._complex_url('data'), **self.DEFAULT_HEADERS)
+        assert self._get_response_data(response)['current_step'] == 'page1|step1.2'
+
+        versions = '%s:%s' % (data['data']['form_id'], data['data']['version'])
+        response = self.client.get(self._complex_url('peek'), HTTP_X_WIZARD_STEP_VERSIONS=versions,
+                                   **self.DEFAULT_HEADERS)
+        assert self._get_response_data(response)['data']['cached'] is True
+
+        # A given step
+        response = self.client.get(self._complex_url('peek', 'page2|step2.2'), **self.DEFAULT_HEADERS)
+        assert self._get_response_data(response)['step'] == 'page2|step2.2'
+        response = self.client.get(self._complex_url('peek', 'unknown'), **self.DEFAULT_HEADERS)
+        assert response.status_code == 404
+
+        # No step after the last step
+        self.client.post(self._complex_url('goto', 'page2|step2.2'), **self.DEFAULT_HEADERS)
+        response = self.client.get(self._complex_url('peek'), **self.DEFAULT_HEADERS)
+        assert response.status_code == 404
+
+    def test_navigation(self):
+        response = self.client.get(self._complex_url('data'), **self.DEFAULT_HEADERS)
+        data = self._get_response_data(response)
+        assert data['navigation']['order'] == [
+            'page1|step1.1', 'page1|step1.2', 'page1|step1.3', 'page2|step2.1', 'page2|step2.2']
+        assert data['navigation']['conditional'] == ['page2|step2.2']
+        assert data['navigation']['reachable'] == [
+            step for step in data['structure'] if step != 'page2|step2.2']
+        assert data['navigation']['peek'] == 'peek'
+        assert data['navigation']['sync'] == 'sync'
+
+        # Disabled API views
+        response = self.client.get(reverse('wizard_step', kwargs={'step': 'data'}), **self.DEFAULT_HEADERS)
+        data = self._get_response_data(response)
+        assert data['navigation']['peek'] is None
+        assert data['navigation']['sync'] is None
+
+    def test_sync(self):
+        response = self.client.post(self._complex_url('sync', 'page1|step1.3'), **self.DEFAULT_HEADERS)
+        assert response.status_code == 200
+        assert self._get_response_data(response) == {'current_step': 'page1|step1.3'}
+
+        response = self.client.get(self._complex_url('data'), **self.DEFAULT_HEADERS)
+        assert self._get_response_data(response)['current_step'] == 'page1|step1.3'
+
+        response = self.client.post(self._complex_url('sync', 'unknown'), **self.DEFAULT_HEADERS)
+        assert response.status_code == 400
+
+    def test_reserved_step_names(self):
+        # The API views are disabled by default
+        for step_name in ('data', 'commit', 'upload', 'finalize', 'file', 'peek', 'sync'):
+            initkwargs = WizardAPIView.get_initkwargs(form_list=[(step_name, Page1), ('page2', Page2)])
+            assert list(initkwargs['form_list']) == [step_name, 'page2']
+        for step_name in ('upload', 'finalize', 'file', 'peek', 'sync'):
+            with self.assertRaises(AssertionError):
+                WizardAPIView.get_initkwargs(form_list=[(step_name, Page1), ('page2', Page2)],
+                                             **{'%s_step_name' % step_name: step_name})
+        # Unless the API view is renamed
+        initkwargs = WizardAPIView.get_initkwargs(form_list=[('file', Page1), ('page2', Page2)],
+                                                  file_step_name='stored-file')
+        assert list(initkwargs['form_list']) == ['file', 'page2']
+
+    def test_disabled_api_views(self):
+        response = self.client.get(reverse('wizard_step', kwargs={'step': 'peek'}), **self.DEFAULT_HEADERS)
+        assert response.status_code == 404
+        response = self.client.post(reverse('wizard_step', kwargs={'step': 'sync'}), **self.DEFAULT_HEADERS)
+        assert response.status_code == 400
+
     def _get_response_data(self, response):
         assert isinstance(response, JsonResponse)
         return json.loads(response.content.decode('utf-8'))